@@ -5,103 +5,222 @@
 
 
 # Install and load relevant libraries
+import os
 import pandas as pd
 import numpy as np
-from datetime import datetime
 import warnings
 
+from cyclistic.ingest import find_month_files, month_label, chunk_rows_for_budget, check_schema
+from cyclistic.cache import is_cached, read_meta
+from cyclistic.cleaning import merge_stats, standardized_counts, day_name_counts
+from cyclistic.filters import CLEANING_RULES, GEO_RULES
+from cyclistic.schema import RAW_DTYPES, DATE_COLUMNS, read_cleaned_csv
+from cyclistic.cube import merge_cubes, rollup, crosstab, write_cube
+from cyclistic.sketch import (merge_sketches, sketch_quantiles, write_sketch,
+                              exact_quantiles, max_relative_error, RELATIVE_ACCURACY)
+from cyclistic.incremental import read_month_state, partition_path, assemble_csv
+from cyclistic.pipeline import clean_month, clean_months
+from cyclistic.stations import (find_station_keys, station_keys_key, merge_station_counts, station_dimension,
+                                top_stations, start_counts_from_dimension)
+from cyclistic.spatial import merge_od, write_od
+from cyclistic.dataset import month_is_written, drop_other_months, read_months
+from cyclistic.dedup import find_duplicates, duplicates_key, write_duplicate_report
+from cyclistic.excel import write_workbook
+from cyclistic.quality import value_counts, checklist, check_rows, write_quality_report
+from cyclistic.profiling import (start_run, begin_stage, end_stage, add_steps, stage_table,
+                                 write_run_report, read_run_report, compare_runs)
+
 
 # In[2]:
 
 
-# Upload the Cyclistic datasets (csv files) from the past 12 months
-jan_trips = pd.read_csv("2025_01_cyclistic.csv")
-feb_trips = pd.read_csv("2025_02_cyclistic.csv")
-mar_trips = pd.read_csv("2025_03_cyclistic.csv")
-apr_trips = pd.read_csv("2025_04_cyclistic.csv")
-may_trips = pd.read_csv("2025_05_cyclistic.csv")
-june_trips = pd.read_csv("2025_06_cyclistic.csv")
-july_trips = pd.read_csv("2025_07_cyclistic.csv")
-aug_trips = pd.read_csv("2025_08_cyclistic.csv")
-sep_trips = pd.read_csv("2025_09_cyclistic.csv")
-oct_trips = pd.read_csv("2025_10_cyclistic.csv")
-nov_trips = pd.read_csv("2025_11_cyclistic.csv")
-dec_trips = pd.read_csv("2025_12_cyclistic.csv")
+# Find the Cyclistic datasets (csv files), one per month, in date order
+month_files = find_month_files('.')
+print(f"Found {len(month_files)} monthly files: {month_files[0]} ... {month_files[-1]}")
+
+# Number of months cleaned (and ride_id indexes built) at once in separate
+# worker processes (1 = no pool); os.cpu_count() uses every core. Only raise it
+# where workers are forked (Linux): this script has no `__main__` guard, so under
+# the spawn start method (macOS, Windows) every worker would re-run the script
+WORKERS = 1
+
+# Memory budget for the raw chunks being cleaned and their copies (MB), shared
+# by all workers. Peak memory is set by this budget, not by how many months are loaded.
+CHUNK_BUDGET_MB = 1024
+chunk_size = chunk_rows_for_budget(CHUNK_BUDGET_MB / WORKERS)
+print(f"Reading in chunks of {chunk_size:,} rows (~{CHUNK_BUDGET_MB} MB budget, {WORKERS} worker(s))")
+
+# Raw months are cached as columnar .npy files; unchanged months skip CSV parsing
+CACHE_DIR = '.cyclistic_cache'
+cached = [path for path in month_files if is_cached(path, CACHE_DIR, RAW_DTYPES, DATE_COLUMNS)]
+print(f"{len(cached)} of {len(month_files)} months already cached in {CACHE_DIR}/")
+
+# Set to a file name to keep every rejected row with its reason code
+REJECTS_PATH = None
+
+# Medians come from mergeable sketches (within 0.25%); set True to also keep
+# the ride lengths and report exact medians, e.g. to check the sketch
+EXACT_QUANTILES = False
+
+# Keep each month's cleaned rows and summaries in STATE_DIR and only clean the
+# months that are new or changed since the last run
+INCREMENTAL = False
+STATE_DIR = '.cyclistic_state'
+
+# A ride_id already seen in an earlier month (or earlier in the same month) is
+# dropped and listed in 2025_cyclistic_duplicates.csv. The sorted ride_ids of
+# each month are kept in RIDE_INDEX_DIR. BLOOM_PREFILTER checks them through a
+# Bloom filter first, which pays off from about two years of month files on.
+# Set DEDUP_RIDE_IDS = False to keep every row
+DEDUP_RIDE_IDS = True
+RIDE_INDEX_DIR = '.cyclistic_ride_index'
+BLOOM_PREFILTER = False
+
+# Set True to also drop rides with an implausible implied speed for their
+# bike type, or that start and end at the same point (GEO_RULES in cyclistic/filters.py)
+FILTER_GEO_OUTLIERS = False
+rules = CLEANING_RULES + (GEO_RULES if FILTER_GEO_OUTLIERS else [])
+
+# The cleaned rows are also written as a dataset partitioned by month (and by
+# member_casual with PARTITION_BY_USER_TYPE), one .npy file per column, with
+# min/max started_at and ride_length_min per partition; the analysis script
+# then reads only the partitions and columns it needs. None turns it off.
+DATASET_DIR = '2025_cyclistic_cleaned'
+PARTITION_BY_USER_TYPE = False
+partition_by = ['member_casual'] if PARTITION_BY_USER_TYPE else []
+
+# Wall/CPU time, peak memory and rows in/out of every step are saved to
+# RUN_REPORT (JSON, plus a CSV next to it). Set PROFILE to 'cprofile' or
+# 'tracemalloc' to also profile each stage into .cyclistic_profile/
+RUN_REPORT = 'cyclistic_run_report_cleaning.json'
+PROFILE = None
+run = start_run('01_data_cleaning', PROFILE)
 
 
 # In[3]:
 
 
-# Check if all DataFrames have identical columns
+# Check if all months have identical columns
 print("Checking column consistency across all months...")
 
-# Get column sets for each month
-datasets = {
-    'Jan': jan_trips, 'Feb': feb_trips, 'Mar': mar_trips,
-    'Apr': apr_trips, 'May': may_trips, 'Jun': june_trips,
-    'Jul': july_trips, 'Aug': aug_trips, 'Sep': sep_trips,
-    'Oct': oct_trips, 'Nov': nov_trips, 'Dec': dec_trips
-}
-
-# Check column names match
-base_columns = set(jan_trips.columns)
-all_match = True
+base_columns, mismatches = check_schema(month_files)
+for month, (extra, missing) in mismatches.items():
+    print(f"⚠️  {month} has different columns!")
+    print(f"   Extra: {extra}")
+    print(f"   Missing: {missing}")
 
-for month, df in datasets.items():
-    if set(df.columns) != base_columns:
-        print(f"⚠️  {month} has different columns!")
-        print(f"   Extra: {set(df.columns) - base_columns}")
-        print(f"   Missing: {base_columns - set(df.columns)}")
-        all_match = False
-
-if all_match:
-    print("✅ All 12 months have identical column structure")
-    print(f"Columns ({len(base_columns)}): {list(base_columns)}")
+if not mismatches:
+    print(f"✅ All {len(month_files)} months have identical column structure")
+    print(f"Columns ({len(base_columns)}): {base_columns}")
 
 
 # In[4]:
 
 
-# Stack individual month's data frames into one big data frame
-all_trips = pd.concat([
-    jan_trips, feb_trips, mar_trips, apr_trips, may_trips, june_trips,
-    july_trips, aug_trips, sep_trips, oct_trips, nov_trips, dec_trips
-], ignore_index=True)
-
-print(f"✅ Combined all 12 months: {len(all_trips):,} total rows")
-print(f"Memory usage: {all_trips.memory_usage(deep=True).sum() / 1024**2:.1f} MB")
+# 1-7. Stream every month through the cleaning steps chunk by chunk.
+# Each cleaned chunk is appended to the output files straight away, so only
+# one raw chunk per worker is in memory at a time.
+print("\n1. Streaming raw data through cleaning steps 2-7...")
+stage = begin_stage(run, '1-7. Stream months through cleaning')
+
+# Duplicate ride_ids, found from the ride_id column alone before any month is cleaned
+duplicates, duplicate_report = {}, None
+if DEDUP_RIDE_IDS:
+    duplicates, duplicate_report = find_duplicates(month_files, RIDE_INDEX_DIR, CACHE_DIR, chunk_size, RAW_DTYPES,
+                                                   DATE_COLUMNS, use_bloom=BLOOM_PREFILTER,
+                                                   workers=WORKERS)
+    print(f"Duplicate ride_ids: {len(duplicate_report):,} in {len(duplicates)} of {len(month_files)} months")
+
+# Integer station keys, numbered in order of the first month naming each station
+# from the station id and name columns alone; the cleaned rows carry them as
+# start_station_key and end_station_key
+station_keys = find_station_keys(month_files, CACHE_DIR, chunk_size, RAW_DTYPES, DATE_COLUMNS, workers=WORKERS)
+print(f"Station keys: {len(station_keys):,} stations named in {len(month_files)} months")
+
+full_path = '2025_cyclistic_cleaned_full.csv'
+analysis_path = '2025_cyclistic_analysis_ready.csv'
+outputs = {'full': full_path, 'analysis': analysis_path, 'rejects': REJECTS_PATH}
+options = dict(chunksize=chunk_size, columns=base_columns, cache_dir=CACHE_DIR, dtypes=RAW_DTYPES,
+               date_columns=DATE_COLUMNS, rules=rules, keep_rejects=REJECTS_PATH is not None,
+               dataset_dir=DATASET_DIR, partition_by=partition_by, duplicates=duplicates,
+               station_keys=station_keys)
+
+def report_month(path, state, action='cleaned'):
+    """Print the row counts of one month"""
+    month_stats = state['stats']
+    print(f"  {month_label(path)}: {month_stats.get('rows_in', 0):,} rows in, "
+          f"{month_stats.get('rows_out', 0):,} clean ({action})")
+
+states, cleaned_months = {}, []
+if DATASET_DIR is not None:
+    # Months whose file is gone are dropped from the dataset
+    drop_other_months(DATASET_DIR, [month_label(path) for path in month_files])
+if not INCREMENTAL and WORKERS == 1:
+    # Serial runs stream every month straight into the output files
+    for path in outputs.values():
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+    for path in month_files:
+        states[path] = clean_month(path, outputs, **options)
+        cleaned_months.append(path)
+        report_month(path, states[path])
+else:
+    # Incremental and parallel runs clean each month into its own folder in
+    # STATE_DIR; unchanged months are reused in incremental mode
+    to_clean = []
+    for path in month_files:
+        month_stations = station_keys_key(station_keys, month_label(path))
+        state = (read_month_state(path, STATE_DIR, rules, options['keep_rejects'],
+                                  duplicates_key(duplicates.get(month_label(path))), month_stations)
+                 if INCREMENTAL else None)
+        if (DATASET_DIR is not None
+                and not month_is_written(DATASET_DIR, month_label(path), partition_by, month_stations)):
+            state = None
+        if state is None:
+            to_clean.append(path)
+        else:
+            states[path] = state
+            report_month(path, state, 'unchanged, reused')
+    for path, state in clean_months(to_clean, WORKERS, state_dir=STATE_DIR, **options):
+        states[path] = state
+        cleaned_months.append(path)
+        report_month(path, state)
+
+    # The yearly files are rebuilt from the month partitions, appending only
+    # what changed since they were last assembled
+    for name, path in outputs.items():
+        if path is not None:
+            parts = [partition_path(states[month]['folder'], name) for month in month_files]
+            copied = assemble_csv(parts, path, STATE_DIR)
+            print(f"  {path}: {copied} of {len(month_files)} month partitions written")
+
+# Month summaries merge in month order, exactly as if cleaned in one pass
+stats = {}
+for path in month_files:
+    stats = merge_stats(stats, states[path]['stats'])
+cube = merge_cubes(states[path]['cube'] for path in month_files)
+sketch = merge_sketches(states[path]['sketch'] for path in month_files)
+stations = station_dimension(merge_station_counts(states[path]['stations'] for path in month_files), station_keys)
+od = merge_od(states[path]['od'] for path in month_files)
+end_stage(run, stage, rows_in=stats['rows_in'], rows_out=stats['rows_out'])
+# Time spent reading, in each cleaning step, writing and aggregating (months cleaned in this run)
+add_steps(run, (states[path]['stats'].get('step_times') for path in cleaned_months), prefix='    ')
+del states
+
+original_count = stats['rows_in']
+print(f"Streamed {original_count:,} rows, {len(base_columns)} columns")
+print(f"Date range in raw data: {stats['raw_first_started_at']} to {stats['raw_last_started_at']}")
+print(f"Aggregate cube: {len(cube):,} cells; quantile sketch: {len(sketch):,} bins; "
+      f"{len(stations):,} stations; {len(od):,} OD flow cells")
 
 
 # In[5]:
 
 
-# Save combined raw data before cleaning
-raw_data_path = '2025_cyclistic_combined_raw.csv'
-all_trips.to_csv(raw_data_path, index=False)
-print(f"Saved combined raw data to: {raw_data_path}")
-
-
-# In[6]:
-
-
-# 1. Load raw data
-print("\n1. Loading saved raw data...")
-df = pd.read_csv('2025_cyclistic_combined_raw.csv')
-print(f"Loaded {len(df):,} rows, {len(df.columns)} columns")
-print(f"Date range in raw data: {df['started_at'].iloc[0]} to {df['started_at'].iloc[-1]}")
-
-
-# In[7]:
-
-
-# 2. Convert datetime columns with error handling
+# 2. Datetime conversion report
 print("\n2. Converting datetime columns...")
-df['started_at'] = pd.to_datetime(df['started_at'], errors='coerce')
-df['ended_at'] = pd.to_datetime(df['ended_at'], errors='coerce')
-
-# Check for failed conversions
-failed_start = df['started_at'].isna().sum()
-failed_end = df['ended_at'].isna().sum()
+failed_start = stats['failed_start']
+failed_end = stats['failed_end']
 
 if failed_start > 0 or failed_end > 0:
     print(f"Warning: {failed_start} started_at and {failed_end} ended_at conversions failed")
@@ -109,178 +228,105 @@ if failed_start > 0 or failed_end > 0:
 else:
     print("All datetime conversions successful")
 
+# Each month's timestamp format was detected once, when the month was cached;
+# only rows that did not match it went through the slow parser
+print("Timestamp formats by month:")
+for path in month_files:
+    meta = read_meta(path, CACHE_DIR, RAW_DTYPES, DATE_COLUMNS)
+    if meta is None:
+        continue
+    started, ended = meta['timestamps']['started_at'], meta['timestamps']['ended_at']
+    print(f"  {month_label(path)}: {started['format']}, slow fallback for "
+          f"{started['fallback']:,} started_at / {ended['fallback']:,} ended_at rows")
+fallback = stats['fallback_start'] + stats['fallback_end']
+if fallback > 0:
+    print(f"  {fallback:,} uncached rows also needed the slow fallback")
 
-# In[8]:
+
+# In[6]:
 
 
-# 3. Standardize member_casual column
+# 3. member_casual standardization report
 print("\n3. Standardizing member_casual column...")
 
+# Counted once per chunk in the raw profile; the standardized counts follow from them
+member_casual_before = value_counts(stats['raw_profile'], 'member_casual', dropna=False)
 print("Before standardization:")
-print(df['member_casual'].value_counts(dropna=False))
-
-# Standardize: strip whitespace, lowercase
-df['member_casual'] = df['member_casual'].astype(str).str.strip().str.lower()
+print(member_casual_before)
 
 print("\nAfter standardization:")
-print(df['member_casual'].value_counts(dropna=False))
+print(standardized_counts(member_casual_before).sort_values(ascending=False))
 
 
-# In[9]:
+# In[7]:
 
 
-# 4. Convert ride_length to minutes
+# 4. ride_length conversion report
 print("\n4. Converting ride_length to minutes...")
 
-# Check current format of ride_length
 print(f"ride_length sample values:")
-print(df['ride_length'].head(3).tolist())
-
-# Function to convert hh:mm:ss to minutes
-def convert_ride_length(time_str):
-    """Convert hh:mm:ss string to total minutes (float)"""
-    try:
-        if pd.isna(time_str):
-            return None
-        
-        # Handle different formats
-        if isinstance(time_str, str):
-            # Format: "hh:mm:ss" or "mm:ss"
-            parts = time_str.split(':')
-            
-            if len(parts) == 3:  # hh:mm:ss
-                hours, minutes, seconds = map(int, parts)
-                return hours * 60 + minutes + seconds / 60
-            elif len(parts) == 2:  # mm:ss
-                minutes, seconds = map(int, parts)
-                return minutes + seconds / 60
-            else:
-                return None
-        elif isinstance(time_str, (int, float)):
-            # If already numeric, assume it's seconds
-            return time_str / 60
-        else:
-            return None
-    except:
-        return None
-
-# Apply conversion
-df['ride_length_min'] = df['ride_length'].apply(convert_ride_length)
-
-print(f"\nConversion check (first 5 rows):")
-print(df[['ride_length', 'ride_length_min']].head())
+print(stats['ride_length_sample'])
 
 print(f"\nRide length statistics (minutes):")
-print(f"  Min: {df['ride_length_min'].min():.2f}")
-print(f"  Max: {df['ride_length_min'].max():.2f}")
-print(f"  Mean: {df['ride_length_min'].mean():.2f}")
-print(f"  Missing: {df['ride_length_min'].isna().sum()}")
+print(f"  Min: {stats['ride_length_min']:.2f}")
+print(f"  Max: {stats['ride_length_max']:.2f}")
+print(f"  Mean: {stats['ride_length_sum'] / stats['ride_length_count']:.2f}")
+print(f"  Missing: {stats['ride_length_missing']}")
 
+print(f"\nValues that failed to parse, by format:")
+for fmt, count in stats['ride_length_failed'].items():
+    print(f"  {fmt}: {count:,}")
 
-# In[10]:
+
+# In[8]:
 
 
-# 5. Convert day_of_week to day names
+# 5. day_of_week conversion report
 print("\n5. Converting day_of_week numbers to day names...")
 
-# Check current day_of_week values
+day_of_week_counts = value_counts(stats['raw_profile'], 'day_of_week')
 print(f"Current day_of_week values (1-7, Sunday=1):")
-print(df['day_of_week'].value_counts().sort_index())
-
-# Map numeric to day names
-day_map = {
-    1: 'Sunday',
-    2: 'Monday',
-    3: 'Tuesday',
-    4: 'Wednesday',
-    5: 'Thursday',
-    6: 'Friday',
-    7: 'Saturday'
-}
-
-# Create day_name column
-df['day_name'] = df['day_of_week'].map(day_map)
+print(day_of_week_counts.sort_index())
 
 print(f"\nDay distribution (from numeric column):")
-print(df['day_name'].value_counts().sort_index())
+print(day_name_counts(day_of_week_counts).sort_index())
 
 
-# In[11]:
+# In[9]:
 
 
-# 6. Add additional time features
+# 6. Time features
 print("\n6. Adding additional time features...")
+print("Added: month, year, hour, hour_category, date, season, distance_km, speed_kmh")
+print(f"Straight-line distance missing (no coordinates): {stats['distance_missing']:,} rows")
+print(f"Start and end at the same point: {stats['zero_distance']:,} rows")
 
-# Month and year
-df['month'] = df['started_at'].dt.month_name()
-df['year'] = df['started_at'].dt.year
-
-# Hour of day
-df['hour'] = df['started_at'].dt.hour
-df['hour_category'] = pd.cut(df['hour'], 
-                             bins=[0, 6, 10, 15, 19, 24],
-                             labels=['Night (0-6)', 'Morning (7-10)', 'Midday (11-15)', 
-                                     'Evening (16-19)', 'Night (20-23)'],
-                             right=False)
-
-# Date (without time)
-df['date'] = df['started_at'].dt.date
-
-# Season (based on month)
-def get_season(month_name):
-    """Convert month_name to season with datetime - FIXED"""
-    # Convert to string first
-    month_str = str(month_name)
-    try:
-        month_num = datetime.strptime(month_str, "%B").month
-        if month_num in [12, 1, 2]:
-            return 'Winter'
-        elif month_num in [3, 4, 5]:
-            return 'Spring'
-        elif month_num in [6, 7, 8]:
-            return 'Summer'
-        else:
-            return 'Fall'
-    except:
-        return 'Unknown'
-
-df['season'] = df['month'].apply(get_season)
-
-print("Added: month, year, hour, hour_category, date, season")
 
-
-# In[12]:
+# In[10]:
 
 
-# 7. Filter invalid data
+# 7. Filtering report
 print("\n7. Filtering invalid data...")
-
-original_count = len(df)
 print(f"Original row count: {original_count:,}")
 
-# Define filtering conditions
-conditions = [
-    df['ride_length_min'].notna(),                    # Has valid ride length
-    df['ride_length_min'] >= 1,                       # At least 1 minute
-    df['ride_length_min'] <= 1440,                    # Max 24 hours (1440 minutes)
-    df['member_casual'].isin(['member', 'casual']),   # Valid user type
-    df['started_at'].notna(),                         # Has start time
-    df['ended_at'].notna(),                           # Has end time
-    df['started_at'] < df['ended_at'],                # Logical time order
-    df['rideable_type'].notna()                       # Has bike type
-]
-
-# Apply all conditions
-clean_df = df.copy()
-for i, condition in enumerate(conditions, 1):
-    before = len(clean_df)
-    clean_df = clean_df[condition].copy()
-    removed = before - len(clean_df)
+for i, removed in stats['removed_by_condition'].items():
     if removed > 0:
-        print(f"  Condition {i}: Removed {removed:,} rows")
+        print(f"  Condition {i}: Removed {removed:,} rows ({rules[i - 1]['reason']})")
+
+# Duplicate ride_ids, by the month they were dropped from and the month kept
+if duplicate_report is not None:
+    duplicates_removed = stats.get('duplicates_removed', 0)
+    print(f"  Duplicate ride_id: Removed {duplicates_removed:,} rows")
+    write_duplicate_report(duplicate_report, '2025_cyclistic_duplicates.csv')
+    if duplicates_removed > 0:
+        pairs = duplicate_report.groupby(['month', 'first_month'])['rows_dropped'].sum()
+        for (month, first_month), rows in pairs.items():
+            kept_in = 'earlier in the same month' if month == first_month else f'kept in {first_month}'
+            print(f"    {month}: {rows:,} rows ({kept_in})")
+        print(f"    Listed in 2025_cyclistic_duplicates.csv")
 
 # Final count
-final_count = len(clean_df)
+final_count = stats['rows_out']
 removed_total = original_count - final_count
 removal_percent = (removed_total / original_count) * 100
 
@@ -288,128 +334,143 @@ print(f"\nFILTERING SUMMARY:")
 print(f"  Original rows: {original_count:,}")
 print(f"  Removed rows: {removed_total:,} ({removal_percent:.2f}%)")
 print(f"  Final clean rows: {final_count:,}")
+if REJECTS_PATH is not None:
+    print(f"  Rejected rows saved with reason codes to: {REJECTS_PATH}")
 
 
-# In[13]:
+# In[11]:
 
 
 # 8. Data Quality Report
 print("\n8. Generating data quality report...")
+stage = begin_stage(run, '8. Data quality report')
+
+# The checklist comes from the profile of the clean rows (null counts, value
+# counts and ranges of every column, gathered chunk by chunk while cleaning),
+# with ride lengths per user type from the cube and the sketch
+clean_profile = stats['clean_profile']
+total_rides = stats['rows_out']
+user_counts = value_counts(clean_profile, 'member_casual')
+by_user = rollup(cube, 'member_casual')
+user_medians = sketch_quantiles(sketch, 'member_casual')['median']
+if EXACT_QUANTILES:
+    clean_df = read_cleaned_csv(analysis_path, columns=['member_casual', 'ride_length_min'])
+    exact_medians = exact_quantiles(clean_df, 'member_casual')['median']
+    error = max_relative_error(user_medians.to_frame(), exact_medians.to_frame())
+    print(f"(sketch medians within {error:.3%} of exact; bound {RELATIVE_ACCURACY:.2%})")
+    user_medians = exact_medians
+
+with_station = {role: stations[[f'{role}s_casual', f'{role}s_member']].to_numpy().sum() for role in ['start', 'end']}
+located = int(od['rides'].sum())
+quality_report = pd.concat([
+    checklist(clean_profile, by_user, user_medians),
+    check_rows('Stations', [('Distinct stations (id + name)', len(stations))]
+               + [(f'Rides with {role} station', int(count), count / total_rides * 100)
+                  for role, count in with_station.items()]),
+    check_rows('Origin-Destination Grid (geohash cells)', [
+        ('Rides with start and end coordinates', located, located / total_rides * 100),
+        ('Origin cells', od['origin'].nunique()),
+        ('Destination cells', od['destination'].nunique()),
+    ]),
+], ignore_index=True)
 
 print("\nDATA QUALITY CHECKLIST:")
 print("-" * 40)
-
-# 1. User type distribution
-print("1. User Type Distribution:")
-user_counts = clean_df['member_casual'].value_counts()
-for user_type, count in user_counts.items():
-    percent = (count / len(clean_df)) * 100
-    print(f"   {user_type.title()}: {count:,} rides ({percent:.1f}%)")
-
-# 2. Date range
-print(f"\n2. Date Range:")
-print(f"   Start: {clean_df['started_at'].min()}")
-print(f"   End: {clean_df['started_at'].max()}")
-print(f"   Total days: {(clean_df['started_at'].max() - clean_df['started_at'].min()).days}")
-
-# 3. Ride length statistics
-print(f"\n3. Ride Length Statistics (minutes):")
-for user_type in ['member', 'casual']:
-    user_data = clean_df[clean_df['member_casual'] == user_type]
-    print(f"   {user_type.title()}:")
-    print(f"     Avg: {user_data['ride_length_min'].mean():.1f} min")
-    print(f"     Median: {user_data['ride_length_min'].median():.1f} min")
-    print(f"     Max: {user_data['ride_length_min'].max():.1f} min")
-
-# 4. Missing values
-print(f"\n4. Missing Values in Clean Data:")
-missing_clean = clean_df.isnull().sum()
-missing_clean = missing_clean[missing_clean > 0]
-if len(missing_clean) == 0:
-    print("   No missing values in critical columns")
-else:
-    for col, count in missing_clean.items():
-        print(f"   {col}: {count} missing ({count/len(clean_df)*100:.2f}%)")
+for number, (section, items) in enumerate(quality_report.groupby('section', sort=False), 1):
+    if number > 1:
+        print()
+    print(f"{number}. {section}:")
+    for item in items.itertuples():
+        value = f"{item.value:,}" if isinstance(item.value, (int, np.integer)) else item.value
+        percent = f" ({item.percent:.1f}%)" if pd.notna(item.percent) else ""
+        print(f"   {item.item}: {value}{percent}")
+
+# The checklist with the column profiles of the raw and clean data
+quality_path = '2025_cyclistic_quality_report.json'
+write_quality_report(quality_path, quality_report, {'raw': stats['raw_profile'], 'clean': clean_profile})
+print(f"\nSaved quality checklist and column profiles: {quality_path}")
+end_stage(run, stage)
 
 
-# In[14]:
+# In[12]:
 
 
 # 9. Save cleaned data
 print("\n9. Saving cleaned data...")
+stage = begin_stage(run, '9. Save cleaned data')
 
-# Save full cleaned dataset
-clean_df.to_csv('2025_cyclistic_cleaned_full.csv', index=False)
-print(f"Saved full cleaned data: 2025_cyclistic_cleaned_full.csv")
+# Both files were appended chunk by chunk while streaming (or assembled
+# from the month partitions in incremental mode)
+print(f"Saved full cleaned data: {full_path}")
+print(f"Saved analysis-ready data: {analysis_path}")
 
-# Save analysis-ready summary (smaller, faster for analysis)
-analysis_cols = [
-    'ride_id', 'rideable_type', 'started_at', 'ended_at',
-    'member_casual', 'ride_length_min', 'day_name', 
-    'month', 'year', 'hour', 'hour_category', 'season'
-]
+# One row per station: integer key, id, name, canonical coordinate and ride counts
+stations_path = '2025_cyclistic_stations.csv'
+stations.to_csv(stations_path, index=False)
+print(f"Saved station dimension: {stations_path}")
 
-clean_df[analysis_cols].to_csv('2025_cyclistic_analysis_ready.csv', index=False)
-print(f"Saved analysis-ready data: 2025_cyclistic_analysis_ready.csv")
+# Sparse OD matrix by user type, season and hour, sorted by origin cell
+od_path = '2025_cyclistic_od_flows.csv'
+write_od(od, od_path)
+print(f"Saved origin-destination flows: {od_path}")
 
+# The aggregate cube and ride length sketch, for query_service.py
+write_cube(cube, '2025_cyclistic_cube.csv')
+write_sketch(sketch, '2025_cyclistic_sketch.csv')
+print("Saved aggregate cube and quantile sketch: 2025_cyclistic_cube.csv, 2025_cyclistic_sketch.csv")
 
-# In[15]:
+# Month partitions with min/max started_at and ride_length_min
+if DATASET_DIR is not None:
+    partitions = sum(len(month['partitions']) for month in read_months(DATASET_DIR))
+    print(f"Saved partitioned dataset: {DATASET_DIR}/ ({len(month_files)} months, {partitions} partitions)")
+end_stage(run, stage, rows_out=len(stations) + len(od))
 
 
-# 10. Create quick summary for Excel
-print("\n10. Creating summary for Excel visualization...")
+# In[13]:
 
-# Create summary tables for easy Excel import
-with pd.ExcelWriter('2025_cyclistic_summaries.xlsx') as writer:
-    
-    # 1. Monthly usage by user type
-    monthly_summary = pd.crosstab(
-        clean_df['month'], 
-        clean_df['member_casual'],
-        values=clean_df['ride_id'],
-        aggfunc='count',
-        margins=True,
-        margins_name='Total'
-    )
-    monthly_summary.to_excel(writer, sheet_name='Monthly_Usage')
-    
-    # 2. Day of week patterns
-    dow_summary = pd.crosstab(
-        clean_df['day_name'], 
-        clean_df['member_casual'],
-        values=clean_df['ride_length_min'],
-        aggfunc='mean'
-    ).round(2)
-    dow_summary.to_excel(writer, sheet_name='Day_of_Week')
-    
-    # 3. Hourly patterns
-    hourly_summary = pd.crosstab(
-        clean_df['hour'], 
-        clean_df['member_casual'],
-        values=clean_df['ride_id'],
-        aggfunc='count'
-    )
-    hourly_summary.to_excel(writer, sheet_name='Hourly_Usage')
-    
-    # 4. Bike type preference
-    bike_summary = pd.crosstab(
-        clean_df['rideable_type'], 
-        clean_df['member_casual'],
-        normalize='columns'
-    ).round(4) * 100
-    bike_summary.to_excel(writer, sheet_name='Bike_Preference')
-    
-    # 5. Basic statistics
-    stats_summary = clean_df.groupby('member_casual').agg({
-        'ride_id': 'count',
-        'ride_length_min': ['mean', 'median', 'std', 'min', 'max']
-    }).round(2)
-    stats_summary.to_excel(writer, sheet_name='Basic_Stats')
 
+# 10. Create quick summary for Excel
+print("\n10. Creating summary for Excel visualization...")
+stage = begin_stage(run, '10. Excel summary')
+
+# Create summary tables for easy Excel import; every sheet is rolled up from the cube
+# 1. Monthly usage by user type
+monthly_summary = crosstab(cube, 'month', 'member_casual', margins=True)
+
+# 2. Day of week patterns
+dow_summary = crosstab(cube, 'day_name', 'member_casual', measure='mean').round(2)
+
+# 3. Hourly patterns
+hourly_summary = crosstab(cube, 'hour', 'member_casual')
+
+# 4. Bike type preference
+bike_summary = crosstab(cube, 'rideable_type', 'member_casual', normalize='columns').round(4) * 100
+
+# 5. Basic statistics
+stats_summary = pd.concat({
+    'ride_id': by_user[['count']],
+    'ride_length_min': by_user[['mean', 'std', 'min', 'max']].assign(median=user_medians)
+                              [['mean', 'median', 'std', 'min', 'max']],
+}, axis=1).round(2)
+
+# 6. Busiest start stations by user type
+top_start = top_stations(start_counts_from_dimension(stations), stations)
+
+# Streamed to the file in write-only mode, one sheet at a time
+write_workbook('2025_cyclistic_summaries.xlsx', [
+    ('Monthly_Usage', monthly_summary, True),
+    ('Day_of_Week', dow_summary, True),
+    ('Hourly_Usage', hourly_summary, True),
+    ('Bike_Preference', bike_summary, True),
+    ('Basic_Stats', stats_summary, True),
+    ('Top_Start_Stations', top_start, False),
+])
+
+end_stage(run, stage)
 print(f"Created Excel summary: 2025_cyclistic_summaries.xlsx")
 
 
-# In[16]:
+# In[14]:
 
 
 # Final Report
@@ -419,15 +480,19 @@ print("="*60)
 
 print(f"""
 📋 FINAL RESULTS:
-   • Clean rides: {len(clean_df):,}
+   • Clean rides: {total_rides:,}
    • Casual riders: {user_counts.get('casual', 0):,}
    • Annual members: {user_counts.get('member', 0):,}
-   • Data quality: {(len(clean_df)/original_count*100):.1f}% retained
+   • Data quality: {(total_rides/original_count*100):.1f}% retained
 
 📁 OUTPUT FILES CREATED:
    1. 2025_cyclistic_cleaned_full.csv       (Complete cleaned dataset)
    2. 2025_cyclistic_analysis_ready.csv     (Analysis-optimized dataset)
    3. 2025_cyclistic_summaries.xlsx         (Excel-ready summaries)
+   4. 2025_cyclistic_stations.csv           (Station dimension table)
+   5. 2025_cyclistic_od_flows.csv           (Origin-destination flows by geohash cell)
+   6. 2025_cyclistic_cube.csv / _sketch.csv (Aggregates for query_service.py)
+   7. 2025_cyclistic_quality_report.json    (Quality checklist and column profiles)
 
 📊 NEXT STEPS:
    1. Open '2025_cyclistic_summaries.xlsx' for initial insights
@@ -436,6 +501,24 @@ print(f"""
 """)
 
 
+# In[15]:
+
+
+# Run report: time, memory and rows per step, compared with the previous run
+previous_run = read_run_report(RUN_REPORT)
+write_run_report(run, RUN_REPORT)
+print(f"\n⏱️ RUN REPORT (saved to {RUN_REPORT}):")
+print(stage_table(run).set_index('stage')[['wall_s', 'cpu_s', 'peak_rss_mb', 'rows_in', 'rows_out']]
+      .round(2).to_string())
+if previous_run is not None:
+    slower = compare_runs(previous_run, run)
+    if len(slower):
+        print(f"\n⚠️  Slower than the previous run ({previous_run['started']}):")
+        print(slower.round(2).to_string())
+    else:
+        print(f"\n✅ No step slower than the previous run ({previous_run['started']})")
+
+
 # In[ ]:
 
 
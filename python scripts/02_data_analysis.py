@@ -7,18 +7,184 @@
 # Install and load relevant libraries
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import seaborn as sns
 
+import glob
+import os
+
+import cyclistic.cache
+import cyclistic.cleaning
+import cyclistic.cube
+import cyclistic.dataset
+import cyclistic.features
+import cyclistic.filters
+import cyclistic.incremental
+import cyclistic.quality
+import cyclistic.sampling
+import cyclistic.schema
+import cyclistic.sketch
+import cyclistic.stations
+import cyclistic.timestamps
+from cyclistic.ingest import find_month_files
+from cyclistic.features import derive_time_features
+from cyclistic.schema import decode_ride_ids, read_cleaned_csv, iter_cleaned_csv, concat_frames
+from cyclistic.dataset import iter_dataset, select_partitions, rule_columns, filter_rows
+from cyclistic.cube import build_cube, merge_cubes, rollup, crosstab, summary_table
+from cyclistic.sketch import (build_sketch, merge_sketches, sketch_quantiles,
+                              exact_quantiles, max_relative_error)
+from cyclistic.cleaning import merge_stats
+from cyclistic.incremental import load_month_state, month_state_dir, partition_path, assemble_csv, append_csv
+from cyclistic.stations import (STATION_KEY_COLUMNS, read_station_dimension, top_stations,
+                                start_counts_from_rides, merge_start_counts, start_counts_from_dimension)
+from cyclistic.spatial import read_od, flows_from, top_flows, geohash_strings, cell_centers
+from cyclistic.excel import write_workbook
+from cyclistic.charts import CHARTS, chart_tables, render_charts
+from cyclistic.sampling import STRATA, start_sample, add_to_sample, finish_sample, write_npz
+from cyclistic.memo import memo_key, input_fingerprint, file_fingerprints, code_version, read_memo, write_memo, memoize
+from cyclistic.profiling import (start_run, begin_stage, end_stage, stage_table,
+                                 write_run_report, read_run_report, compare_runs)
+
 
 # In[2]:
 
 
+# Set True after running 01_data_cleaning.py with INCREMENTAL = True: the
+# tables then come from the saved month summaries and only new months are
+# read for the visualization file
+INCREMENTAL = False
+STATE_DIR = '.cyclistic_state'
+
+# Set True to stream the cleaned rides in chunks of CHUNK_ROWS instead of
+# loading them all: memory stays flat however many months or years there
+# are, and every table is the same as with the rides in memory
+OUT_OF_CORE = False
+CHUNK_ROWS = 1_000_000
+
+# Rides are read from the month-partitioned dataset written by the cleaning
+# script when it is there (else from the cleaned CSV): only the columns used
+# and only the partitions that can hold rows passing ROW_FILTERS are read.
+# ROW_FILTERS are rules as in cyclistic/filters.py; e.g. casual riders in August:
+#   [{'column': 'member_casual', 'op': '==', 'value': 'casual'},
+#    {'column': 'started_at', 'op': '>=', 'value': '2025-08-01'},
+#    {'column': 'started_at', 'op': '<', 'value': '2025-09-01'}]
+# The OD flows always cover every ride
+DATASET_DIR = '2025_cyclistic_cleaned'
+ROW_FILTERS = []
+if INCREMENTAL and ROW_FILTERS:
+    raise ValueError("ROW_FILTERS need the rides; set INCREMENTAL = False to use them")
+
+# Set True to use exact medians from the rides instead of the sketch (within 0.25%);
+# they need the rides in memory, so not with OUT_OF_CORE or INCREMENTAL
+EXACT_QUANTILES = False
+if EXACT_QUANTILES and (OUT_OF_CORE or INCREMENTAL):
+    raise ValueError("EXACT_QUANTILES needs the rides in memory; set OUT_OF_CORE = False and INCREMENTAL = False")
+
+# The aggregates and every summary table are memoized in MEMO_DIR under a key
+# of the input files, the settings and the code that computes them, so a rerun
+# after a chart or wording change skips the load and the groupbys. The least
+# recently used entries are dropped beyond MEMO_MAX_MB; None turns it off.
+MEMO_DIR = '.cyclistic_memo'
+MEMO_MAX_MB = 256
+
+# Step 9 writes a sample of the visualization rows for Tableau/Excel:
+# VIZ_SAMPLE_SIZE rides stratified by member_casual × month × rideable_type
+# ('proportional' or 'equal' rows per stratum), or a uniform sample with
+# VIZ_SAMPLE_METHOD = 'reservoir'; the same VIZ_SAMPLE_SEED draws the same rides.
+# Set VIZ_FULL_EXPORT = True to also write every ride to cyclistic_viz_ready.csv
+VIZ_SAMPLE_SIZE = 100_000
+VIZ_SAMPLE_METHOD = 'stratified'
+VIZ_SAMPLE_ALLOCATION = 'proportional'
+VIZ_SAMPLE_SEED = 2025
+VIZ_FULL_EXPORT = False
+
+# Charts are rendered in up to CHART_WORKERS processes (1 = no pool). This
+# script has no `if __name__ == '__main__':` guard, so a pool only works where
+# workers are forked (Linux); on macOS and Windows each worker would re-run the
+# whole script. render_charts.py --workers draws them in parallel anywhere.
+CHART_WORKERS = 1
+
+# Wall/CPU time, peak memory and rows of every step are saved to RUN_REPORT
+# (JSON, plus a CSV next to it). Set PROFILE to 'cprofile' or 'tracemalloc' to
+# also profile each stage into .cyclistic_profile/
+RUN_REPORT = 'cyclistic_run_report_analysis.json'
+PROFILE = None
+run = start_run('02_data_analysis', PROFILE)
+
+# Only the columns the analysis uses, read with the compact dtypes from cyclistic/schema.py
+RIDE_COLUMNS = ['ride_id', 'rideable_type', 'started_at', 'ended_at',
+                'member_casual', 'ride_length_min', 'day_name', 'distance_km', 'speed_kmh']
+
+# Rides carry int32 station keys into the station table written by the cleaning script
+stations = read_station_dimension('2025_cyclistic_stations.csv')
+
+# Origin-destination flows between geohash cells, also written by the cleaning script
+od = read_od('2025_cyclistic_od_flows.csv')
+
+def iter_rides(columns):
+    """Cleaned rides with `columns` that pass ROW_FILTERS, in chunks"""
+    if os.path.isdir(DATASET_DIR):
+        return iter_dataset(DATASET_DIR, columns, ROW_FILTERS)
+    chunks = iter_cleaned_csv('2025_cyclistic_cleaned_full.csv', columns=columns + rule_columns(ROW_FILTERS),
+                              chunksize=CHUNK_ROWS)
+    return (filter_rows(chunk, ROW_FILTERS, columns) for chunk in chunks)
+
+# member_casual, rideable_type and day_name are already categoricals from the schema
+# Month, season and hour come straight from started_at instead of the text columns
+def add_time_columns(rides):
+    """Add month, season, hour and is_weekend derived from started_at"""
+    time_features = derive_time_features(rides['started_at'], ['month', 'season', 'hour', 'is_weekend'])
+    rides['month'] = time_features['month']
+    rides['season'] = time_features['season']
+    rides['hour'] = time_features['hour'].astype('int8')
+    rides['is_weekend'] = time_features['is_weekend']
+    return rides
+
+# Everything the aggregates depend on: the input files, the settings that
+# change them and the code that builds them. Only the modules that read and
+# aggregate the rides are hashed, so editing charts.py or excel.py keeps them
+AGGREGATE_MODULES = [cyclistic.timestamps, cyclistic.features, cyclistic.schema, cyclistic.cache,
+                     cyclistic.filters, cyclistic.dataset, cyclistic.stations, cyclistic.cube, cyclistic.sketch,
+                     cyclistic.incremental, cyclistic.cleaning, cyclistic.quality]
+if INCREMENTAL:
+    input_files = [os.path.join(month_state_dir(path, STATE_DIR), 'state.pkl') for path in find_month_files('.')]
+elif os.path.isdir(DATASET_DIR):
+    input_files = glob.glob(os.path.join(DATASET_DIR, '*', 'month.json'))
+else:
+    input_files = ['2025_cyclistic_cleaned_full.csv']
+inputs_key = memo_key(input_fingerprint(input_files + ['2025_cyclistic_stations.csv', '2025_cyclistic_od_flows.csv']),
+                      INCREMENTAL, ROW_FILTERS, RIDE_COLUMNS,
+                      code_version(iter_rides, add_time_columns, *AGGREGATE_MODULES))
+
+def memo_table(name, compute, *uses):
+    """compute(), memoized under the inputs and the code of compute and of the functions it uses"""
+    key = memo_key(inputs_key, EXACT_QUANTILES, code_version(compute, *uses))
+    return memoize(MEMO_DIR, name, key, compute, MEMO_MAX_MB)
+
 # 1. Load cleaned data
 print("\n1. Loading cleaned data...")
-df = pd.read_csv('2025_cyclistic_cleaned_full.csv', parse_dates=['started_at', 'ended_at'])
-print(f"Loaded {len(df):,} cleaned rides")
-print(f"Memory usage: {df.memory_usage(deep=True).sum() / 1024**2:.1f} MB")
+stage = begin_stage(run, '1. Load cleaned data')
+# Exact quantiles need the rides, so the memoized aggregates are not enough
+aggregates = None if EXACT_QUANTILES else read_memo(MEMO_DIR, 'aggregates', inputs_key)
+if INCREMENTAL:
+    df = None
+    month_states = [load_month_state(path, STATE_DIR) for path in find_month_files('.')]
+    print(f"Loaded saved summaries of {len(month_states)} months from {STATE_DIR}/")
+elif aggregates is not None:
+    df = None
+    print(f"Rides not read: their aggregates are memoized in {MEMO_DIR}/")
+else:
+    if os.path.isdir(DATASET_DIR):
+        selected, total = select_partitions(DATASET_DIR, ROW_FILTERS)
+        print(f"Reading {len(selected)} of {total} partitions of {DATASET_DIR}/")
+    ride_chunks = iter_rides(RIDE_COLUMNS + STATION_KEY_COLUMNS)
+    if OUT_OF_CORE:
+        df = None
+        print("Streaming the cleaned rides chunk by chunk")
+    else:
+        df = concat_frames(ride_chunks)
+        print(f"Loaded {len(df):,} cleaned rides")
+        print(f"Memory usage: {df.memory_usage(deep=True).sum() / 1024**2:.1f} MB")
+end_stage(run, stage, rows_out=len(df) if df is not None else None)
 
 
 # In[3]:
@@ -26,23 +192,62 @@ print(f"Memory usage: {df.memory_usage(deep=True).sum() / 1024**2:.1f} MB")
 
 # 2. Organize data for analysis
 print("\n2. Organizing data for analysis...")
-
-# Ensure proper data types
-df['member_casual'] = df['member_casual'].astype('category')
-df['rideable_type'] = df['rideable_type'].astype('category')
-df['day_name'] = pd.Categorical(df['day_name'], 
-                                categories=['Sunday', 'Monday', 'Tuesday', 'Wednesday', 
-                                           'Thursday', 'Friday', 'Saturday'],
-                                ordered=True)
-df['month'] = pd.Categorical(df['month'],
-                             categories=['January', 'February', 'March', 'April', 'May', 'June',
-                                        'July', 'August', 'September', 'October', 'November', 'December'],
-                             ordered=True)
-df['season'] = pd.Categorical(df['season'],
-                              categories=['Winter', 'Spring', 'Summer', 'Fall'],
-                              ordered=True)
-
-print("Data organized with proper categorical ordering")
+stage = begin_stage(run, '2. Organize data (cube and sketch)')
+
+if aggregates is not None:
+    cube, sketch, start_counts, first_ride, last_ride = (
+        aggregates[name] for name in ('cube', 'sketch', 'start_counts', 'first_ride', 'last_ride'))
+    print(f"Loaded the aggregates of these inputs from {MEMO_DIR}/")
+elif INCREMENTAL:
+    # The month summaries were saved by the cleaning script; merging them is exact
+    cube = merge_cubes(state['cube'] for state in month_states)
+    sketch = merge_sketches(state['sketch'] for state in month_states)
+    clean_stats = {}
+    for state in month_states:
+        clean_stats = merge_stats(clean_stats, state['stats'])
+    started_at = clean_stats['clean_profile']['columns']['started_at']
+    first_ride, last_ride = started_at['min'], started_at['max']
+    start_counts = start_counts_from_dimension(stations)
+    print(f"Merged the cube and sketch of {len(month_states)} months")
+elif OUT_OF_CORE:
+    # The same aggregates, built one chunk at a time and merged as they come
+    cube, sketch, start_counts, first_ride, last_ride = None, None, None, None, None
+    for rides in ride_chunks:
+        rides = add_time_columns(rides)
+        cube = merge_cubes([cube, build_cube(rides)])
+        sketch = merge_sketches([sketch, build_sketch(rides)])
+        start_counts = merge_start_counts([start_counts, start_counts_from_rides(rides)])
+        chunk_first, chunk_last = rides['started_at'].min(), rides['started_at'].max()
+        first_ride = chunk_first if first_ride is None else min(first_ride, chunk_first)
+        last_ride = chunk_last if last_ride is None else max(last_ride, chunk_last)
+    print(f"Aggregated {int(cube['count'].sum()):,} cleaned rides chunk by chunk")
+else:
+    df = add_time_columns(df)
+    print("Data organized with proper categorical ordering")
+
+    # One pass over the rides builds the aggregate cube and the ride-length
+    # quantile sketch; the tables below are rolled up from those two
+    cube = build_cube(df)
+    sketch = build_sketch(df)
+    start_counts = start_counts_from_rides(df)
+    first_ride, last_ride = df['started_at'].min(), df['started_at'].max()
+if aggregates is None:
+    write_memo(MEMO_DIR, 'aggregates', inputs_key, {'cube': cube, 'sketch': sketch, 'start_counts': start_counts,
+                                                    'first_ride': first_ride, 'last_ride': last_ride}, MEMO_MAX_MB)
+total_rides = int(cube['count'].sum())
+by_user = rollup(cube, 'member_casual')
+print(f"Aggregate cube: {len(cube):,} cells; quantile sketch: {len(sketch):,} bins")
+
+def ride_length_quantiles(by, quantiles=(0.5,)):
+    """Ride length quantiles per group, from the sketch or (in exact mode) the rides"""
+    if EXACT_QUANTILES and df is not None:
+        exact = exact_quantiles(df, by, quantiles)
+        error = max_relative_error(sketch_quantiles(sketch, by, quantiles), exact)
+        print(f"  (sketch quantiles by {by} within {error:.3%} of exact)")
+        return exact
+    return sketch_quantiles(sketch, by, quantiles)
+
+end_stage(run, stage, rows_in=len(df) if df is not None else total_rides, rows_out=len(cube))
 
 
 # In[4]:
@@ -50,18 +255,19 @@ print("Data organized with proper categorical ordering")
 
 # 3. Descriptive Analysis
 print("\n3. Descriptive Analysis")
+stage = begin_stage(run, '3. Descriptive analysis')
 
 print("\n" + "="*50)
 print("OVERALL STATISTICS")
 print("="*50)
 
 # Overall statistics
-print(f"\nTotal rides in 2025: {len(df):,}")
-print(f"Date range: {df['started_at'].min().date()} to {df['started_at'].max().date()}")
+print(f"\nTotal rides in 2025: {total_rides:,}")
+print(f"Date range: {first_ride.date()} to {last_ride.date()}")
 
 # User distribution
-user_counts = df['member_casual'].value_counts()
-user_percents = df['member_casual'].value_counts(normalize=True) * 100
+user_counts = by_user['count']
+user_percents = user_counts / total_rides * 100
 
 print("\n👥 USER DISTRIBUTION:")
 for user_type in ['member', 'casual']:
@@ -71,43 +277,82 @@ for user_type in ['member', 'casual']:
 
 # Ride length statistics
 print("\n⏱️ RIDE LENGTH STATISTICS (minutes):")
-print(df['ride_length_min'].describe().round(2))
+if df is not None:
+    print(df['ride_length_min'].describe().round(2))
+else:
+    # Same summary from the cube totals and the sketch quartiles
+    totals = by_user[['count', 'sum', 'sum_sq']].sum()
+    quartiles = sketch_quantiles(sketch, [], (0.25, 0.5, 0.75))
+    print(pd.Series({
+        'count': totals['count'],
+        'mean': totals['sum'] / totals['count'],
+        'std': np.sqrt((totals['sum_sq'] - totals['sum'] ** 2 / totals['count']) / (totals['count'] - 1)),
+        'min': by_user['min'].min(),
+        '25%': quartiles['p25'],
+        '50%': quartiles['median'],
+        '75%': quartiles['p75'],
+        'max': by_user['max'].max(),
+    }, name='ride_length_min').round(2))
 
 print("\n📊 RIDE LENGTH BY USER TYPE:")
-ride_stats = df.groupby('member_casual')['ride_length_min'].agg([
-    'count', 'mean', 'median', 'std', 'min', 'max'
-]).round(2)
+def ride_stats_table():
+    """Ride length statistics by user type"""
+    medians = ride_length_quantiles('member_casual')['median']
+    return by_user.assign(median=medians)[['count', 'mean', 'median', 'std', 'min', 'max']].round(2)
+
+ride_stats = memo_table('ride_stats', ride_stats_table, ride_length_quantiles)
 print(ride_stats)
+user_quantiles = ride_length_quantiles('member_casual', (0.5, 0.9, 0.99))
+
+print("\nRide length percentiles by user type (minutes):")
+print(user_quantiles.round(2))
+
+# Straight-line distance from start to end point, and the implied average speed
+print("\n📏 RIDE DISTANCE BY USER TYPE (straight line, km):")
+distance_stats = pd.DataFrame({
+    'rides_with_distance': by_user['distance_count'],
+    'avg_distance_km': by_user['avg_distance'],
+    'avg_speed_kmh': by_user['avg_speed'],
+    'avg_duration': by_user['mean'],
+}).round(2)
+print(distance_stats)
+
+print("\nAverage distance by bike type (km):")
+print(crosstab(cube, 'rideable_type', 'member_casual', measure='avg_distance').round(2))
+end_stage(run, stage)
 
 
 # In[5]:
 
 
 # 4. Time-based Analysis
+stage = begin_stage(run, '4. Time-based analysis')
 print("\n" + "="*50)
 print("TIME-BASED ANALYSIS")
 print("="*50)
 
 # 4.1 Daily Patterns
 print("\n📅 DAILY PATTERNS:")
-daily_summary = df.groupby(['member_casual', 'day_name']).agg(
-    num_rides=('ride_id', 'count'),
-    avg_duration=('ride_length_min', 'mean'),
-    median_duration=('ride_length_min', 'median')
-).round(2).reset_index()
-
-# Calculate percentages
-total_by_user = daily_summary.groupby('member_casual')['num_rides'].transform('sum')
-daily_summary['pct_of_user_total'] = (daily_summary['num_rides'] / total_by_user * 100).round(1)
-
+def daily_table():
+    """Rides, durations and medians by user type and day, with each day's share"""
+    daily = summary_table(cube, ['member_casual', 'day_name'])
+    daily_medians = ride_length_quantiles(['member_casual', 'day_name'])['median']
+    daily = daily.join(daily_medians.rename('median_duration'), on=['member_casual', 'day_name']).round(2)
+
+    # Calculate percentages
+    total_by_user = daily.groupby('member_casual')['num_rides'].transform('sum')
+    daily['pct_of_user_total'] = (daily['num_rides'] / total_by_user * 100).round(1)
+    return daily
+
+daily_summary = memo_table('daily_summary', daily_table, ride_length_quantiles)
 print(daily_summary)
 
 # 4.2 Hourly Patterns
 print("\n🕐 HOURLY PATTERNS:")
-hourly_summary = df.groupby(['member_casual', 'hour']).agg(
-    num_rides=('ride_id', 'count'),
-    avg_duration=('ride_length_min', 'mean')
-).round(2).reset_index()
+def hourly_table():
+    return summary_table(cube, ['member_casual', 'hour']).round(2)
+
+hourly_summary = memo_table('hourly_summary', hourly_table)
 
 # Find peak hours for each user type
 peak_hours = hourly_summary.loc[hourly_summary.groupby('member_casual')['num_rides'].idxmax()]
@@ -116,66 +361,115 @@ print(peak_hours)
 
 # 4.3 Monthly/Seasonal Patterns
 print("\n📅 MONTHLY/SEASONAL PATTERNS:")
-monthly_summary = df.groupby(['member_casual', 'month']).agg(
-    num_rides=('ride_id', 'count'),
-    avg_duration=('ride_length_min', 'mean')
-).round(2).reset_index()
+def monthly_table():
+    return summary_table(cube, ['member_casual', 'month']).round(2)
+
+monthly_summary = memo_table('monthly_summary', monthly_table)
 
-seasonal_summary = df.groupby(['member_casual', 'season']).agg(
-    num_rides=('ride_id', 'count'),
-    avg_duration=('ride_length_min', 'mean')
-).round(2).reset_index()
+seasonal_summary = summary_table(cube, ['member_casual', 'season']).round(2)
+end_stage(run, stage)
 
 
 # In[6]:
 
 
 # 5. Bike-type Analysis
+stage = begin_stage(run, '5. Bike type, station and OD analysis')
 print("\n" + "="*50)
 print("BIKE TYPE ANALYSIS")
 print("="*50)
 
-bike_summary = df.groupby(['member_casual', 'rideable_type']).agg(
-    num_rides=('ride_id', 'count'),
-    avg_duration=('ride_length_min', 'mean'),
-    pct_of_total=('ride_id', lambda x: len(x) / len(df) * 100)
-).round(2).reset_index()
+def bike_table():
+    bike = summary_table(cube, ['member_casual', 'rideable_type'])
+    bike['pct_of_total'] = bike['num_rides'] / total_rides * 100
+    return bike.round(2)
+
+bike_summary = memo_table('bike_summary', bike_table)
 
 print(bike_summary)
 
 # Calculate preference differences
-bike_pref = pd.crosstab(df['member_casual'], df['rideable_type'], normalize='index') * 100
+bike_pref = crosstab(cube, 'member_casual', 'rideable_type', normalize='index') * 100
 print("\nBike Type Preferences (% by user type):")
 print(bike_pref.round(1))
 
+# 5.1 Busiest start stations (grouped on the integer station keys)
+top_start_stations = top_stations(start_counts, stations)
+
+print(f"\n📍 TOP START STATIONS ({len(stations):,} stations):")
+for user_type in ['casual', 'member']:
+    top = top_start_stations[top_start_stations['member_casual'] == user_type].head(5)
+    print(f"  {user_type.title()}: " + ", ".join(f"{name} ({rides:,})" for name, rides
+                                                  in zip(top['station_name'], top['rides'])))
+
+# 5.2 Origin-destination flows (geohash cells, ~1.2 x 0.6 km)
+print("\n🗺️ ORIGIN-DESTINATION FLOWS:")
+od_top = top_flows(od, by=['member_casual'])
+od_top['share_of_user_rides'] = od_top['rides'] / od_top['member_casual'].map(user_counts).astype(float) * 100
+for end in ['origin', 'destination']:
+    lat, lng = cell_centers(od_top[end])
+    od_top[f'{end}_lat'], od_top[f'{end}_lng'] = lat.round(5), lng.round(5)
+    od_top[end] = geohash_strings(od_top[end])
+for user_type in ['casual', 'member']:
+    top = od_top[od_top['member_casual'] == user_type].head(3)
+    print(f"  {user_type.title()}: " + ", ".join(f"{o} → {d} ({rides:,})" for o, d, rides
+                                                  in zip(top['origin'], top['destination'], top['rides'])))
+
+# Where do rides from the busiest casual origin cell go, by user type and season?
+casual_origins = od[od['member_casual'] == 'casual'].groupby('origin')['rides'].sum()
+if casual_origins.empty:
+    print("\n  No casual rides with start and end coordinates; skipping the flows from the busiest origin")
+else:
+    busiest_cell = casual_origins.idxmax()
+    outflows = flows_from(od, busiest_cell).unstack('member_casual', fill_value=0)
+    print(f"\n  Rides leaving cell {geohash_strings([busiest_cell])[0]} (busiest casual origin):")
+    for user_type in outflows.columns:
+        leaving = outflows[user_type]
+        print(f"    {user_type.title()}: {leaving.sum():,} rides to {(leaving > 0).sum():,} cells "
+              f"({leaving.get(busiest_cell, 0) / leaving.sum() * 100:.1f}% stay in the same cell)")
+    print(flows_from(od, busiest_cell, by=['member_casual', 'season']).groupby(
+        ['member_casual', 'season'], observed=True).sum().unstack('season'))
+end_stage(run, stage)
+
 
 # In[7]:
 
 
 # 6. Key insights and surprises
+stage = begin_stage(run, '6. Key insights')
 print("\n" + "="*50)
 print("KEY INSIGHTS & SURPRISES")
 print("="*50)
 
-# Calculate key metrics
-casual_data = df[df['member_casual'] == 'casual']
-member_data = df[df['member_casual'] == 'member']
+# Calculate key metrics (ride counts by user type and one other key, from the cube)
+def share_of_user_rides(key, value):
+    """Percent of each user type's rides where `key` equals `value`"""
+    counts = rollup(cube, ['member_casual', key])['count']
+    return {user_type: counts.get((user_type, value), 0) / user_counts[user_type] * 100
+            for user_type in ['casual', 'member']}
+
+casual_avg = by_user.loc['casual', 'mean']
+member_avg = by_user.loc['member', 'mean']
 
 insights = []
 
 # Insight 1: Usage patterns by day
-casual_weekend_pct = len(casual_data[casual_data['day_name'].isin(['Saturday', 'Sunday'])]) / len(casual_data) * 100
-member_weekend_pct = len(member_data[member_data['day_name'].isin(['Saturday', 'Sunday'])]) / len(member_data) * 100
+weekend_pct = share_of_user_rides('is_weekend', True)
+casual_weekend_pct = weekend_pct['casual']
+member_weekend_pct = weekend_pct['member']
 
 insights.append(f"📅 DAY PATTERNS:")
 insights.append(f"  • Casual riders use bikes more on weekends: {casual_weekend_pct:.1f}% vs {member_weekend_pct:.1f}% for members")
 insights.append(f"  • Members have more consistent weekday usage")
 
 # Insight 2: Ride duration differences
-avg_duration_diff = casual_data['ride_length_min'].mean() - member_data['ride_length_min'].mean()
+avg_duration_diff = casual_avg - member_avg
 insights.append(f"\n⏱️ DURATION DIFFERENCES:")
 insights.append(f"  • Casual rides are {avg_duration_diff:.1f} minutes longer on average")
-insights.append(f"  • Casual: {casual_data['ride_length_min'].mean():.1f} min vs Member: {member_data['ride_length_min'].mean():.1f} min")
+insights.append(f"  • Casual: {casual_avg:.1f} min vs Member: {member_avg:.1f} min")
+insights.append(f"  • Straight-line distance: Casual {by_user.loc['casual', 'avg_distance']:.2f} km vs "
+                f"Member {by_user.loc['member', 'avg_distance']:.2f} km "
+                f"({by_user.loc['casual', 'avg_speed']:.1f} vs {by_user.loc['member', 'avg_speed']:.1f} km/h)")
 
 # Insight 3: Peak hours
 casual_peak_hour = hourly_summary[hourly_summary['member_casual'] == 'casual'].sort_values('num_rides', ascending=False).iloc[0]['hour']
@@ -187,29 +481,33 @@ insights.append(f"  • Members peak at {member_peak_hour}:00")
 insights.append(f"  • Members show clear commute patterns (morning/evening peaks)")
 
 # Insight 4: Seasonal patterns
-casual_summer_pct = len(casual_data[casual_data['season'] == 'Summer']) / len(casual_data) * 100
-member_summer_pct = len(member_data[member_data['season'] == 'Summer']) / len(member_data) * 100
+summer_pct = share_of_user_rides('season', 'Summer')
+casual_summer_pct = summer_pct['casual']
+member_summer_pct = summer_pct['member']
 
 insights.append(f"\n🌤️ SEASONAL PATTERNS:")
 insights.append(f"  • Casual ridership increases {((casual_summer_pct/member_summer_pct)-1)*100:.0f}% more than members in summer")
 insights.append(f"  • Members show more consistent year-round usage")
 
 # Insight 5: Bike preferences
-if 'electric' in df['rideable_type'].unique():
-    casual_electric_pct = len(casual_data[casual_data['rideable_type'] == 'electric']) / len(casual_data) * 100
-    member_electric_pct = len(member_data[member_data['rideable_type'] == 'electric']) / len(member_data) * 100
+if 'electric' in cube['rideable_type'].unique():
+    electric_pct = share_of_user_rides('rideable_type', 'electric')
+    casual_electric_pct = electric_pct['casual']
+    member_electric_pct = electric_pct['member']
     insights.append(f"\n🚲 BIKE PREFERENCES:")
     insights.append(f"  • Casual riders prefer electric bikes {casual_electric_pct:.1f}% vs {member_electric_pct:.1f}% for members")
 
 # Print all insights
 for insight in insights:
     print(insight)
+end_stage(run, stage)
 
 
 # In[8]:
 
 
 # 7. Business Question Analysis
+stage = begin_stage(run, '7. Business questions')
 print("\n" + "="*50)
 print("ANSWERING BUSINESS QUESTIONS")
 print("="*50)
@@ -240,6 +538,7 @@ print("   • Digital ads should target weekends and summer months")
 print("   • Highlight electric bike access in membership promotions")
 print("   • Create 'commute calculator' to show membership savings")
 print("   • Develop app features for leisure route discovery")
+end_stage(run, stage)
 
 
 # In[9]:
@@ -247,43 +546,43 @@ print("   • Develop app features for leisure route discovery")
 
 # 8. Export Analysis Results
 print("\n8. Exporting analysis results...")
+stage = begin_stage(run, '8. Excel export')
 
-# Create comprehensive summary
-with pd.ExcelWriter('cyclistic_analysis_summary.xlsx') as writer:
-    
-    # 1. Executive Summary
-    exec_summary = pd.DataFrame({
+def exec_table():
+    """Headline numbers for the first sheet"""
+    peak_hour = {user_type: hourly_summary[hourly_summary['member_casual'] == user_type]
+                 .sort_values('num_rides', ascending=False).iloc[0]['hour'] for user_type in ['casual', 'member']}
+    return pd.DataFrame({
         'Metric': ['Total Rides', 'Casual Riders', 'Annual Members', 
                   'Avg Casual Ride (min)', 'Avg Member Ride (min)',
                   'Most Popular Casual Day', 'Most Popular Member Day',
                   'Peak Casual Hour', 'Peak Member Hour'],
-        'Value': [f"{len(df):,}",
-                 f"{len(casual_data):,} ({user_percents.get('casual', 0):.1f}%)",
-                 f"{len(member_data):,} ({user_percents.get('member', 0):.1f}%)",
-                 f"{casual_data['ride_length_min'].mean():.1f}",
-                 f"{member_data['ride_length_min'].mean():.1f}",
+        'Value': [f"{total_rides:,}",
+                 f"{user_counts['casual']:,} ({user_percents.get('casual', 0):.1f}%)",
+                 f"{user_counts['member']:,} ({user_percents.get('member', 0):.1f}%)",
+                 f"{by_user.loc['casual', 'mean']:.1f}",
+                 f"{by_user.loc['member', 'mean']:.1f}",
                  daily_summary[daily_summary['member_casual']=='casual'].sort_values('num_rides', ascending=False).iloc[0]['day_name'],
                  daily_summary[daily_summary['member_casual']=='member'].sort_values('num_rides', ascending=False).iloc[0]['day_name'],
-                 f"{casual_peak_hour}:00",
-                 f"{member_peak_hour}:00"]
+                 f"{peak_hour['casual']}:00",
+                 f"{peak_hour['member']}:00"]
     })
-    exec_summary.to_excel(writer, sheet_name='Executive_Summary', index=False)
-    
-    # 2. Daily Patterns
-    daily_summary.to_excel(writer, sheet_name='Daily_Patterns', index=False)
-    
-    # 3. Hourly Patterns
-    hourly_summary.to_excel(writer, sheet_name='Hourly_Patterns', index=False)
-    
-    # 4. Monthly Patterns
-    monthly_summary.to_excel(writer, sheet_name='Monthly_Patterns', index=False)
-    
-    # 5. Bike Preferences
-    bike_summary.to_excel(writer, sheet_name='Bike_Preferences', index=False)
-    
-    # 6. Ride Statistics
-    ride_stats.to_excel(writer, sheet_name='Ride_Statistics')
 
+# Create comprehensive summary, streamed to the file in write-only mode
+exec_summary = memo_table('exec_summary', exec_table, daily_table, hourly_table)
+write_workbook('cyclistic_analysis_summary.xlsx', [
+    ('Executive_Summary', exec_summary, False),
+    ('Daily_Patterns', daily_summary, False),
+    ('Hourly_Patterns', hourly_summary, False),
+    ('Monthly_Patterns', monthly_summary, False),
+    ('Bike_Preferences', bike_summary, False),
+    ('Ride_Statistics', ride_stats, True),
+    ('Top_Start_Stations', top_start_stations, False),
+    ('Top_OD_Flows', od_top.round(2), False),
+    ('Ride_Distance', distance_stats, True),
+])
+
+end_stage(run, stage)
 print("Analysis exported to 'cyclistic_analysis_summary.xlsx'")
 
 
@@ -292,23 +591,85 @@ print("Analysis exported to 'cyclistic_analysis_summary.xlsx'")
 
 # 9. Create visualization-ready data
 print("\n9. Creating visualization-ready data...")
+stage = begin_stage(run, '9. Visualization-ready data')
 
 # For Tableau/Power BI/Excel charts
-viz_data = df[[
-    'ride_id', 'started_at', 'ended_at', 'member_casual', 
-    'ride_length_min', 'day_name', 'hour', 'month', 'season',
-    'rideable_type'
-]].copy()
-
-# Add derived metrics for visualization
-viz_data['is_weekend'] = viz_data['day_name'].isin(['Saturday', 'Sunday'])
-viz_data['ride_category'] = pd.cut(viz_data['ride_length_min'],
-                                   bins=[0, 15, 30, 60, 120, 1440],
-                                   labels=['0-15min', '16-30min', '31-60min', '61-120min', '120+min'])
-
-# Save for visualization tools
-viz_data.to_csv('cyclistic_viz_ready.csv', index=False)
-print("✅ Visualization-ready data saved to 'cyclistic_viz_ready.csv'")
+def viz_frame(rides):
+    """Visualization columns of the cleaned rides, with ride_id as text"""
+    viz_data = rides[[
+        'ride_id', 'started_at', 'ended_at', 'member_casual',
+        'ride_length_min', 'day_name', 'hour', 'month', 'season',
+        'rideable_type', 'is_weekend'
+    ]].copy()
+
+    # Add derived metrics for visualization
+    viz_data['ride_category'] = pd.cut(viz_data['ride_length_min'],
+                                       bins=[0, 15, 30, 60, 120, 1440],
+                                       labels=['0-15min', '16-30min', '31-60min', '61-120min', '120+min'])
+    viz_data['ride_id'] = decode_ride_ids(viz_data['ride_id'])
+    return viz_data
+
+def ride_chunks_with_time():
+    """The cleaned rides with the time columns, in chunks (the whole frame when loaded)"""
+    if df is not None:
+        yield df
+    elif INCREMENTAL:
+        for state in month_states:
+            yield add_time_columns(read_cleaned_csv(partition_path(state['folder'], 'full'), columns=RIDE_COLUMNS))
+    else:
+        for rides in iter_rides(RIDE_COLUMNS):
+            yield add_time_columns(rides)
+
+# A reproducible sample in one pass over the rides, with a weight per stratum
+# (rides per sampled row) so charts can be reweighted to the population totals.
+# Also saved as a compressed .npz (read it with cyclistic.sampling.read_npz)
+SAMPLE_FILES = ['cyclistic_viz_sample.csv', 'cyclistic_viz_sample_weights.csv', 'cyclistic_viz_sample.npz']
+sample_key = memo_key(inputs_key, code_version(viz_frame, ride_chunks_with_time, cyclistic.sampling), VIZ_SAMPLE_SIZE,
+                      VIZ_SAMPLE_METHOD, VIZ_SAMPLE_ALLOCATION, VIZ_SAMPLE_SEED)
+if read_memo(MEMO_DIR, 'viz_sample', sample_key) == file_fingerprints(SAMPLE_FILES):
+    print("cyclistic_viz_sample.csv is already up to date")
+else:
+    sample = start_sample(cube.groupby(STRATA, observed=True)['count'].sum(), VIZ_SAMPLE_SIZE,
+                          VIZ_SAMPLE_METHOD, VIZ_SAMPLE_ALLOCATION, VIZ_SAMPLE_SEED)
+    for rides in ride_chunks_with_time():
+        add_to_sample(sample, rides)
+    sampled, sample_weights = finish_sample(sample)
+    viz_sample = viz_frame(sampled).assign(sample_weight=sampled['sample_weight'])
+    viz_sample.to_csv('cyclistic_viz_sample.csv', index=False)
+    sample_weights.to_csv('cyclistic_viz_sample_weights.csv', index=False)
+    write_npz(viz_sample, 'cyclistic_viz_sample.npz')
+    write_memo(MEMO_DIR, 'viz_sample', sample_key, file_fingerprints(SAMPLE_FILES), MEMO_MAX_MB)
+print(f"✅ Sample of {VIZ_SAMPLE_SIZE:,} rides ({VIZ_SAMPLE_METHOD}) saved to 'cyclistic_viz_sample.csv', "
+      f"weights to 'cyclistic_viz_sample_weights.csv'")
+
+# Every ride as well with VIZ_FULL_EXPORT; skipped when the file is the one last
+# written for these inputs and this code
+viz_key = memo_key(inputs_key, code_version(viz_frame))
+if not VIZ_FULL_EXPORT:
+    print("Full export skipped; set VIZ_FULL_EXPORT = True for every ride in cyclistic_viz_ready.csv")
+elif read_memo(MEMO_DIR, 'viz_ready', viz_key) == file_fingerprints(['cyclistic_viz_ready.csv']):
+    print("cyclistic_viz_ready.csv is already up to date")
+elif INCREMENTAL:
+    # Only months without a visualization partition yet are read
+    viz_parts = []
+    for state in month_states:
+        viz_part = partition_path(state['folder'], 'viz')
+        if not os.path.exists(viz_part):
+            rides = read_cleaned_csv(partition_path(state['folder'], 'full'), columns=RIDE_COLUMNS)
+            viz_frame(add_time_columns(rides)).to_csv(viz_part, index=False)
+        viz_parts.append(viz_part)
+    assemble_csv(viz_parts, 'cyclistic_viz_ready.csv', STATE_DIR)
+elif df is None:
+    if os.path.exists('cyclistic_viz_ready.csv'):
+        os.remove('cyclistic_viz_ready.csv')
+    for rides in iter_rides(RIDE_COLUMNS):
+        append_csv(viz_frame(add_time_columns(rides)), 'cyclistic_viz_ready.csv')
+else:
+    viz_frame(df).to_csv('cyclistic_viz_ready.csv', index=False)
+if VIZ_FULL_EXPORT:
+    write_memo(MEMO_DIR, 'viz_ready', viz_key, file_fingerprints(['cyclistic_viz_ready.csv']), MEMO_MAX_MB)
+    print("✅ Visualization-ready data saved to 'cyclistic_viz_ready.csv'")
+end_stage(run, stage)
 
 
 # In[11]:
@@ -321,7 +682,7 @@ print("="*60)
 
 print(f"""
 📈 QUANTITATIVE FINDINGS:
-1. Scale: {len(df):,} total rides analyzed
+1. Scale: {total_rides:,} total rides analyzed
 2. User Split: {user_percents.get('casual', 0):.1f}% casual vs {user_percents.get('member', 0):.1f}% member
 3. Duration: Casual rides {avg_duration_diff:.1f} minutes longer on average
 4. Timing: Different peak hours (Casual: {casual_peak_hour}:00, Member: {member_peak_hour}:00)
@@ -341,7 +702,8 @@ print(f"""
 
 📁 OUTPUT FILES:
 • cyclistic_analysis_summary.xlsx - All analysis tables
-• cyclistic_viz_ready.csv - Ready for Tableau/Excel charts
+• cyclistic_viz_sample.csv - Weighted ride sample ready for Tableau/Excel charts
+  (cyclistic_viz_ready.csv with every ride when VIZ_FULL_EXPORT = True)
 
 Next: Use these insights to design targeted marketing campaigns!
 """)
@@ -352,32 +714,36 @@ Next: Use these insights to design targeted marketing campaigns!
 
 # Optional: Quick Visualizations
 print("\n📈 Generating quick visualizations...")
-
-# Set style
-plt.style.use('seaborn-v0_8-darkgrid')
-fig, axes = plt.subplots(2, 2, figsize=(15, 10))
-
-# 1. Ride count by day
-daily_pivot = daily_summary.pivot(index='day_name', columns='member_casual', values='num_rides')
-daily_pivot.plot(kind='bar', ax=axes[0,0], title='Rides by Day of Week')
-axes[0,0].set_ylabel('Number of Rides')
-
-# 2. Average duration by day
-duration_pivot = daily_summary.pivot(index='day_name', columns='member_casual', values='avg_duration')
-duration_pivot.plot(kind='bar', ax=axes[0,1], title='Average Duration by Day (minutes)')
-
-# 3. Hourly patterns
-hourly_pivot = hourly_summary.pivot(index='hour', columns='member_casual', values='num_rides')
-hourly_pivot.plot(kind='line', ax=axes[1,0], title='Hourly Ride Patterns', marker='o')
-axes[1,0].set_xlabel('Hour of Day')
-
-# 4. Monthly patterns
-monthly_pivot = monthly_summary.pivot(index='month', columns='member_casual', values='num_rides')
-monthly_pivot.plot(kind='line', ax=axes[1,1], title='Monthly Trends', marker='o')
-
-plt.tight_layout()
-plt.savefig('cyclistic_analysis_charts.png', dpi=300, bbox_inches='tight')
-print("✅ Charts saved as 'cyclistic_analysis_charts.png'")
+stage = begin_stage(run, 'Charts')
+
+# Drawn from the cube and sketch only, CHART_WORKERS figures at a time; a chart
+# whose tables, style and code are unchanged since its PNG was written is skipped.
+# For chart changes alone, `python "python scripts/render_charts.py"` redraws
+# them from the files saved by the cleaning script without running this one
+charts = render_charts(chart_tables(cube, sketch), workers=CHART_WORKERS, memo_dir=MEMO_DIR)
+end_stage(run, stage)
+for name in charts['rendered']:
+    print(f"✅ Chart saved as '{CHARTS[name][0]}'")
+for name in charts['skipped']:
+    print(f"{CHARTS[name][0]} is already up to date")
+
+
+# In[13]:
+
+
+# Run report: time, memory and rows per step, compared with the previous run
+previous_run = read_run_report(RUN_REPORT)
+write_run_report(run, RUN_REPORT)
+print(f"\n⏱️ RUN REPORT (saved to {RUN_REPORT}):")
+print(stage_table(run).set_index('stage')[['wall_s', 'cpu_s', 'peak_rss_mb', 'rows_in', 'rows_out']]
+      .round(2).to_string())
+if previous_run is not None:
+    slower = compare_runs(previous_run, run)
+    if len(slower):
+        print(f"\n⚠️  Slower than the previous run ({previous_run['started']}):")
+        print(slower.round(2).to_string())
+    else:
+        print(f"\n✅ No step slower than the previous run ({previous_run['started']})")
 
 
 # In[ ]:
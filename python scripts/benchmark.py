@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""Benchmark both scripts on synthetic trip data
+
+    python "python scripts/benchmark.py" --rows 1M 5M 20M
+
+For each size, twelve synthetic monthly files (cyclistic/synthetic.py) are
+written once to <dir>/<size>/ and reused while the size, seed and generator
+stay the same. Every benchmark run starts cold (no parse cache, month
+state, ride_id index, partitioned dataset or memoized analysis), runs
+01_data_cleaning.py and then 02_data_analysis.py in that folder and reads
+the run reports they write. Each stage's wall time, CPU time,
+throughput (rows/s) and peak memory is appended to the history CSV with the
+code version, and the totals are compared with the last run of a different
+version at the same size.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPTS_DIR)
+
+from cyclistic import synthetic
+from cyclistic.cache import DEFAULT_CACHE_DIR
+from cyclistic.dataset import DEFAULT_DATASET_DIR
+from cyclistic.dedup import DEFAULT_INDEX_DIR
+from cyclistic.incremental import DEFAULT_STATE_DIR
+from cyclistic.memo import DEFAULT_MEMO_DIR
+from cyclistic.profiling import stage_table
+
+SCRIPTS = {
+    '01_data_cleaning': 'cyclistic_run_report_cleaning.json',
+    '02_data_analysis': 'cyclistic_run_report_analysis.json',
+}
+COLD_DIRS = [DEFAULT_CACHE_DIR, DEFAULT_STATE_DIR, DEFAULT_INDEX_DIR, DEFAULT_DATASET_DIR, DEFAULT_MEMO_DIR]
+DEFAULT_BENCH_DIR = 'cyclistic_benchmark'
+HISTORY_COLUMNS = ['version', 'started', 'rows', 'script', 'stage', 'wall_s', 'cpu_s',
+                   'rows_per_s', 'peak_rss_mb']
+
+
+def parse_rows(text):
+    """'5M' -> 5000000, '250k' -> 250000, '1000' -> 1000"""
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1].lower(), 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def code_version():
+    """git describe of the scripts folder, or 'unknown' outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=SCRIPTS_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def ensure_data(folder, rows, seed, workers):
+    """Write the synthetic months to `folder` unless the same ones are there"""
+    with open(synthetic.__file__, 'rb') as f:
+        generator = hashlib.sha1(f.read()).hexdigest()[:12]
+    settings = {'rows': rows, 'seed': seed, 'generator': generator}
+    marker = os.path.join(folder, 'synthetic.json')
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if json.load(f) == settings:
+                print(f"  Reusing synthetic data in {folder}/")
+                return
+    print(f"  Writing {rows:,} synthetic rides to {folder}/ ...")
+    start = time.perf_counter()
+    synthetic.write_synthetic_year(folder, rows, seed=seed, workers=workers)
+    with open(marker, 'w') as f:
+        json.dump(settings, f)
+    print(f"  Generated in {time.perf_counter() - start:.1f}s")
+
+
+def run_script(name, folder):
+    """Run one script in `folder`; returns (wall seconds, peak RSS in MB or None)"""
+    env = dict(os.environ, MPLBACKEND='Agg',
+               PYTHONPATH=os.pathsep.join(filter(None, [SCRIPTS_DIR, os.environ.get('PYTHONPATH')])))
+    log_path = os.path.join(folder, f'{name}.log')
+    with open(log_path, 'w') as log:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.join(SCRIPTS_DIR, f'{name}.py')],
+                                   cwd=folder, env=env, stdout=log, stderr=subprocess.STDOUT)
+        if hasattr(os, 'wait4'):
+            _, status, usage = os.wait4(process.pid, 0)
+            returncode = os.waitstatus_to_exitcode(status)
+            # kB on Linux, bytes on macOS
+            peak = usage.ru_maxrss / (1024**2 if sys.platform == 'darwin' else 1024)
+        else:
+            returncode, peak = process.wait(), None
+        wall = time.perf_counter() - start
+    if returncode != 0:
+        raise RuntimeError(f"{name}.py failed (exit code {returncode}), see {log_path}")
+    return wall, peak
+
+
+def benchmark_size(folder, rows, version, warm=False):
+    """Cold-run both scripts on one synthetic folder; one row per stage"""
+    for name in COLD_DIRS:
+        shutil.rmtree(os.path.join(folder, name), ignore_errors=True)
+    runs = list(SCRIPTS) + (['01_data_cleaning'] if warm else [])
+    started = datetime.now().isoformat(timespec='seconds')
+    results = []
+    for i, name in enumerate(runs):
+        label = name if i < len(SCRIPTS) else f'{name} (warm)'
+        wall, peak = run_script(name, folder)
+        print(f"  {label}: {wall:.1f}s, {rows / wall:,.0f} rows/s, peak {peak or float('nan'):,.0f} MB")
+        with open(os.path.join(folder, SCRIPTS[name])) as f:
+            stages = stage_table(json.load(f))
+        stages['stage'] = stages['stage'].str.strip()
+        stages = pd.concat([stages, pd.DataFrame([{
+            'stage': 'total', 'wall_s': wall, 'rows_per_s': rows / wall, 'peak_rss_mb': peak,
+        }])], ignore_index=True)
+        stages.insert(0, 'script', label)
+        results.append(stages)
+    results = pd.concat(results, ignore_index=True)
+    results.insert(0, 'rows', rows)
+    results.insert(0, 'started', started)
+    results.insert(0, 'version', version)
+    return results[HISTORY_COLUMNS]
+
+
+def compare_with_previous(history, results):
+    """Totals of this run next to the last run of another version at the same size"""
+    totals = results[results['stage'] == 'total'].set_index('script')
+    earlier = history[(history['rows'] == results['rows'].iloc[0]) & (history['stage'] == 'total')
+                      & (history['version'] != results['version'].iloc[0])]
+    if earlier.empty:
+        return None
+    last = earlier[earlier['started'] == earlier['started'].max()].set_index('script')
+    return pd.DataFrame({
+        f"{last['version'].iloc[0]}_s": last['wall_s'],
+        f"{results['version'].iloc[0]}_s": totals['wall_s'],
+        'speedup': last['wall_s'] / totals['wall_s'],
+        'peak_mb_before': last['peak_rss_mb'],
+        'peak_mb_after': totals['peak_rss_mb'],
+    }).dropna(subset=['speedup'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', nargs='+', default=['1M'],
+                        help="sizes to benchmark, e.g. 1M 5M 50M (default 1M)")
+    parser.add_argument('--dir', default=DEFAULT_BENCH_DIR,
+                        help=f"folder for the synthetic data and history (default {DEFAULT_BENCH_DIR})")
+    parser.add_argument('--seed', type=int, default=0, help="generator seed (default 0)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes used to write the synthetic months (default 1)")
+    parser.add_argument('--warm', action='store_true',
+                        help="also time a second cleaning run with the parse cache in place")
+    parser.add_argument('--history', help="history CSV (default <dir>/benchmark_history.csv)")
+    args = parser.parse_args(argv)
+
+    history_path = args.history or os.path.join(args.dir, 'benchmark_history.csv')
+    history = (pd.read_csv(history_path) if os.path.exists(history_path)
+               else pd.DataFrame(columns=HISTORY_COLUMNS))
+    version = code_version()
+    print(f"Benchmarking version {version}")
+
+    for size in args.rows:
+        rows = parse_rows(size)
+        folder = os.path.join(args.dir, size)
+        print(f"\n📏 {rows:,} rows")
+        ensure_data(folder, rows, args.seed, args.workers)
+        results = benchmark_size(folder, rows, version, args.warm)
+
+        print(results[results['stage'] != 'total'].pivot_table(
+            index='stage', columns='script', values='wall_s', sort=False).round(2).to_string())
+        comparison = compare_with_previous(history, results)
+        if comparison is not None:
+            print("\nCompared with the previous version:")
+            print(comparison.round(2).to_string())
+
+        history = pd.concat([history, results], ignore_index=True)
+        history.to_csv(history_path, index=False)
+    print(f"\n✅ History saved to {history_path}")
+
+
+if __name__ == '__main__':
+    main()
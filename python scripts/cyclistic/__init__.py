@@ -0,0 +1 @@
+"""Helpers shared by the Cyclistic cleaning and analysis scripts"""
@@ -0,0 +1,196 @@
+"""Columnar on-disk cache of the raw monthly files
+
+Each month file gets a cache folder holding one sub-folder per chunk
+(`part-00000`, `part-00001`, ...) with one .npy file per column, so reruns
+can memory-map just the columns they need instead of parsing CSV text.
+Text and categorical columns are dictionary encoded: `<column>.npy` holds
+int32 codes (-1 for missing) and `<column>.categories.npy` holds the
+distinct strings.
+
+Timestamp columns are parsed once, with the format detected for that month
+(see cyclistic.timestamps), and saved as datetime64[ns] (int64 epoch
+nanoseconds), so reruns never parse those strings again. meta.json records
+the format and how many rows needed the slow fallback parser.
+
+A cache folder is reused only while its meta.json still matches the source
+file's size and modification time and the dtypes it was parsed with.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from cyclistic.ingest import month_label, read_columns
+from cyclistic.timestamps import parse_timestamps
+
+# Bump when the on-disk layout changes so old caches are rebuilt
+CACHE_VERSION = 3
+
+DEFAULT_CACHE_DIR = '.cyclistic_cache'
+
+
+def source_fingerprint(path):
+    """Size and modification time of a source file"""
+    info = os.stat(path)
+    return {'size': info.st_size, 'mtime_ns': info.st_mtime_ns}
+
+
+def month_cache_dir(path, cache_dir=DEFAULT_CACHE_DIR):
+    return os.path.join(cache_dir, os.path.splitext(os.path.basename(path))[0])
+
+
+def dtypes_key(dtypes):
+    return {column: str(dtype) for column, dtype in sorted((dtypes or {}).items())}
+
+
+def read_meta(path, cache_dir=DEFAULT_CACHE_DIR, dtypes=None, date_columns=()):
+    """Return the cache metadata for a month file, or None if it is stale"""
+    meta_path = os.path.join(month_cache_dir(path, cache_dir), 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if (meta.get('version') != CACHE_VERSION
+            or meta.get('source') != source_fingerprint(path)
+            or meta.get('dtypes') != dtypes_key(dtypes)
+            or meta.get('date_columns') != list(date_columns)):
+        return None
+    return meta
+
+
+def is_cached(path, cache_dir=DEFAULT_CACHE_DIR, dtypes=None, date_columns=()):
+    return read_meta(path, cache_dir, dtypes, date_columns) is not None
+
+
+def write_part(chunk, part_dir):
+    """Save one chunk as one .npy file per column"""
+    os.makedirs(part_dir, exist_ok=True)
+    for column in chunk.columns:
+        values = chunk[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Categoricals keep their own codes and category order
+            codes, categories = values.cat.codes.to_numpy(), values.cat.categories
+        elif values.dtype == object:
+            codes, categories = pd.factorize(values)
+        else:
+            np.save(os.path.join(part_dir, f'{column}.npy'), values.to_numpy())
+            continue
+        np.save(os.path.join(part_dir, f'{column}.npy'), codes.astype(np.int32))
+        np.save(os.path.join(part_dir, f'{column}.categories.npy'), np.asarray(categories, dtype=str))
+
+
+def read_column(part_dir, column, start=0, stop=None, as_category=False):
+    """Load rows [start:stop] of one cached column, decoding text columns"""
+    values = np.load(os.path.join(part_dir, f'{column}.npy'), mmap_mode='r')[start:stop]
+    categories_path = os.path.join(part_dir, f'{column}.categories.npy')
+    if not os.path.exists(categories_path):
+        return np.array(values)
+    categories = np.load(categories_path).astype(object)
+    if as_category:
+        return pd.Categorical.from_codes(np.array(values), categories=categories)
+    decoded = np.empty(len(values), dtype=object)
+    present = values >= 0
+    decoded[present] = categories[values[present]]
+    decoded[~present] = np.nan
+    return decoded
+
+
+def iter_cached_chunks(path, chunksize, columns, cache_dir=DEFAULT_CACHE_DIR, dtypes=None,
+                       date_columns=()):
+    """Yield chunks of one month straight from its (fresh) cache"""
+    dtypes = dtypes or {}
+    meta = read_meta(path, cache_dir, dtypes, date_columns)
+    folder = month_cache_dir(path, cache_dir)
+    offset = 0
+    for i, part in enumerate(meta['parts']):
+        part_dir = os.path.join(folder, f'part-{i:05d}')
+        # A header-only month still gives one empty chunk, as read_csv does
+        for start in range(0, part['rows'] or 1, chunksize):
+            stop = min(start + chunksize, part['rows'])
+            data = {}
+            for column in columns:
+                if column in meta['columns']:
+                    data[column] = read_column(part_dir, column, start, stop,
+                                               as_category=dtypes.get(column) == 'category')
+                else:
+                    data[column] = np.full(stop - start, np.nan)
+            yield pd.DataFrame(data, index=pd.RangeIndex(offset, offset + stop - start))
+            offset += stop - start
+
+
+def iter_source_columns(path, columns, chunksize, cache_dir=DEFAULT_CACHE_DIR, dtypes=None, date_columns=()):
+    """Yield chunks of just `columns` of one month file, without caching it
+
+    A fresh cache is read like iter_cached_chunks(); otherwise only those
+    columns are parsed from the CSV, with `dtypes` (text for the others).
+    Columns the file does not have come back as NaN.
+    """
+    if is_cached(path, cache_dir, dtypes, date_columns):
+        yield from iter_cached_chunks(path, chunksize, columns, cache_dir, dtypes, date_columns)
+        return
+    present = [column for column in columns if column in read_columns(path)]
+    if not present:
+        return
+    for chunk in pd.read_csv(path, usecols=present, chunksize=chunksize,
+                             dtype={column: (dtypes or {}).get(column, str) for column in present}):
+        yield chunk.reindex(columns=columns)
+
+
+def iter_csv_chunks_into_cache(path, chunksize, columns, cache_dir=DEFAULT_CACHE_DIR, dtypes=None,
+                               date_columns=()):
+    """Parse a month CSV in chunks, caching every chunk as it goes by
+
+    The timestamp format of each of `date_columns` is detected on the first
+    chunk and reused for the rest of the file.
+    """
+    folder = month_cache_dir(path, cache_dir)
+    building = folder + '.building'
+    shutil.rmtree(building, ignore_errors=True)
+
+    fingerprint = source_fingerprint(path)
+    file_columns = read_columns(path)
+    parts = []
+    timestamps = {column: {'format': None, 'fallback': 0, 'failed': 0}
+                  for column in date_columns if column in file_columns}
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype=dtypes):
+        for column, parsing in timestamps.items():
+            raw = chunk[column]
+            chunk[column], fmt, fallback = parse_timestamps(raw, parsing['format'])
+            parsing['format'] = parsing['format'] or fmt
+            parsing['fallback'] += fallback
+            parsing['failed'] += int((chunk[column].isna() & raw.notna()).sum())
+        write_part(chunk, os.path.join(building, f'part-{len(parts):05d}'))
+        parts.append({'rows': len(chunk)})
+        if list(chunk.columns) != columns:
+            chunk = chunk.reindex(columns=columns)
+        yield chunk
+
+    # Only publish the cache once the whole file has been read
+    with open(os.path.join(building, 'meta.json'), 'w') as f:
+        json.dump({'version': CACHE_VERSION, 'source': fingerprint, 'dtypes': dtypes_key(dtypes),
+                   'date_columns': list(date_columns), 'timestamps': timestamps,
+                   'columns': file_columns, 'parts': parts}, f)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(building, folder)
+
+
+def iter_cached_month_chunks(paths, chunksize, columns, cache_dir=DEFAULT_CACHE_DIR, dtypes=None,
+                             date_columns=()):
+    """Yield (month_label, chunk) pairs, reading from the cache where possible
+
+    Months whose source file is unchanged are read from the cache, and only
+    the requested columns are loaded. Other months are parsed from CSV and
+    cached for the next run. `dtypes` is passed to read_csv and
+    `date_columns` come back as datetime64 columns.
+    """
+    for path in paths:
+        label = month_label(path)
+        if is_cached(path, cache_dir, dtypes, date_columns):
+            chunks = iter_cached_chunks(path, chunksize, columns, cache_dir, dtypes, date_columns)
+        else:
+            chunks = iter_csv_chunks_into_cache(path, chunksize, columns, cache_dir, dtypes,
+                                                date_columns)
+        for chunk in chunks:
+            yield label, chunk
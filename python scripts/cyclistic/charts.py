@@ -0,0 +1,164 @@
+"""Charts drawn from the aggregate cube and sketch, in worker processes
+
+chart_tables() rolls the cube and ride length sketch up into the small
+tables behind the charts; no figure ever sees a ride. CHARTS lists each
+figure's PNG file, drawing function and the tables it uses, and
+render_charts() draws them on bare matplotlib Figures, which save through
+the headless Agg canvas whatever backend pyplot uses, `workers` at a time in
+separate processes. A figure is skipped when its PNG was last written from
+the same tables, style and drawing code (see cyclistic.memo).
+"""
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from matplotlib import style as mpl_style
+from matplotlib.figure import Figure
+
+from cyclistic.cube import crosstab
+from cyclistic.memo import code_version, file_fingerprints, memo_key, read_memo, write_memo
+from cyclistic.sketch import bin_value
+
+DEFAULT_STYLE = 'seaborn-v0_8-darkgrid'
+DEFAULT_DPI = 300
+USER_COLORS = {'casual': '#f28e2b', 'member': '#4e79a7'}
+
+# The ride_category buckets of the visualization file
+DURATION_BINS = [0, 15, 30, 60, 120, 1440]
+DURATION_LABELS = ['0-15min', '16-30min', '31-60min', '61-120min', '120+min']
+
+
+def duration_table(sketch):
+    """Rides per ride_category bucket and user type, from the sketch bins
+
+    A bin straddling a bucket edge is counted in the bucket of its reported
+    value, so only rides within 0.25% of 15, 30, 60 or 120 minutes can land
+    in the neighbouring bucket.
+    """
+    counts = sketch.groupby(['member_casual', 'bin'], observed=True).sum().reset_index()
+    counts['ride_category'] = pd.cut(bin_value(counts['bin']), bins=DURATION_BINS, labels=DURATION_LABELS)
+    return counts.pivot_table(index='ride_category', columns='member_casual', values='count',
+                              aggfunc='sum', observed=False).fillna(0).astype('int64')
+
+
+def chart_tables(cube, sketch):
+    """Every table the charts are drawn from, by name"""
+    weekend = crosstab(cube, 'is_weekend', 'member_casual')
+    weekend.index = weekend.index.map({False: 'Weekday', True: 'Weekend'})
+    return {
+        'daily_rides': crosstab(cube, 'day_name', 'member_casual'),
+        'daily_duration': crosstab(cube, 'day_name', 'member_casual', measure='mean'),
+        'hourly_rides': crosstab(cube, 'hour', 'member_casual'),
+        'monthly_rides': crosstab(cube, 'month', 'member_casual'),
+        'weekend_rides': weekend,
+        'time_of_day_rides': crosstab(cube, 'hour_category', 'member_casual'),
+        'season_rides': crosstab(cube, 'season', 'member_casual'),
+        'duration_rides': duration_table(sketch),
+        'bike_rides': crosstab(cube, 'rideable_type', 'member_casual'),
+    }
+
+
+def _bars(table, ax, title, ylabel='Number of Rides'):
+    colors = [USER_COLORS.get(column) for column in table.columns]
+    table.plot(kind='bar', ax=ax, title=title, color=colors, rot=0)
+    ax.set_ylabel(ylabel)
+    ax.set_xlabel('')
+
+
+def draw_analysis(fig, tables):
+    """Rides and average duration by day, hourly and monthly rides (2x2)"""
+    axes = fig.subplots(2, 2)
+    tables['daily_rides'].plot(kind='bar', ax=axes[0, 0], title='Rides by Day of Week')
+    axes[0, 0].set_ylabel('Number of Rides')
+    tables['daily_duration'].plot(kind='bar', ax=axes[0, 1], title='Average Duration by Day (minutes)')
+    tables['hourly_rides'].plot(kind='line', ax=axes[1, 0], title='Hourly Ride Patterns', marker='o')
+    axes[1, 0].set_xlabel('Hour of Day')
+    tables['monthly_rides'].plot(kind='line', ax=axes[1, 1], title='Monthly Trends', marker='o')
+
+
+def draw_insights(fig, tables):
+    """Rides by day of week and weekday vs weekend rides"""
+    axes = fig.subplots(1, 2, gridspec_kw={'width_ratios': [2, 1]})
+    _bars(tables['daily_rides'], axes[0], 'Rides by Day of Week')
+    _bars(tables['weekend_rides'], axes[1], 'Weekday vs. Weekend Rides')
+
+
+def draw_supporting(fig, tables):
+    """Rides by time of day, season, ride duration and bike type (2x2)"""
+    axes = fig.subplots(2, 2)
+    _bars(tables['time_of_day_rides'], axes[0, 0], 'Rides by Time of Day')
+    _bars(tables['season_rides'], axes[0, 1], 'Rides by Season')
+    _bars(tables['duration_rides'], axes[1, 0], 'Ride Duration')
+    _bars(tables['bike_rides'], axes[1, 1], 'Bike Preference')
+
+
+# name: (PNG file, drawing function, tables used, figure size in inches)
+CHARTS = {
+    'analysis': ('cyclistic_analysis_charts.png', draw_analysis,
+                 ['daily_rides', 'daily_duration', 'hourly_rides', 'monthly_rides'], (15, 10)),
+    'insights': ('cyclistic_insight_charts.png', draw_insights, ['daily_rides', 'weekend_rides'], (15, 6)),
+    'supporting': ('cyclistic_supporting_charts.png', draw_supporting,
+                   ['time_of_day_rides', 'season_rides', 'duration_rides', 'bike_rides'], (15, 10)),
+}
+
+
+def table_digest(table):
+    """SHA-256 of a table's index, columns and values"""
+    return hashlib.sha256(table.to_csv().encode()).hexdigest()
+
+
+def render_chart(path, draw, tables, figsize, style=DEFAULT_STYLE, dpi=DEFAULT_DPI):
+    """Draw one figure and save it as a PNG; returns the path"""
+    with mpl_style.context(style):
+        fig = Figure(figsize=figsize)
+        draw(fig, tables)
+        fig.tight_layout()
+        building = path + '.building'
+        fig.savefig(building, dpi=dpi, bbox_inches='tight', format='png')
+    os.replace(building, path)
+    return path
+
+
+def _png_fingerprint(path):
+    # Size and modification time, whatever folder path the PNG was given by
+    return file_fingerprints([path]).get(path)
+
+
+def render_charts(tables, folder='.', names=None, workers=1, style=DEFAULT_STYLE, dpi=DEFAULT_DPI,
+                  memo_dir=None, force=False):
+    """Render the CHARTS in `names` (all by default) into folder
+
+    Returns {'rendered': [...], 'skipped': [...]} chart names. With a memo_dir
+    a chart whose PNG was written from the same tables, style and code is
+    skipped unless force is set.
+    """
+    names = list(CHARTS) if names is None else list(names)
+    unknown = [name for name in names if name not in CHARTS]
+    if unknown:
+        raise ValueError(f"Unknown chart(s) {unknown}; use {list(CHARTS)}")
+    jobs, skipped = {}, []
+    for name in names:
+        file, draw, used, figsize = CHARTS[name]
+        path = os.path.join(folder, file)
+        key = memo_key({table: table_digest(tables[table]) for table in used}, style, dpi, figsize,
+                       code_version(draw, render_chart, _bars))
+        # Without a memo entry (or a memo_dir) the chart is drawn, even if no PNG exists either
+        written = read_memo(memo_dir, f'chart-{name}', key)
+        if not force and written is not None and written == _png_fingerprint(path):
+            skipped.append(name)
+        else:
+            jobs[name] = (path, draw, {table: tables[table] for table in used}, figsize, style, dpi, key)
+
+    def finished(name, path):
+        write_memo(memo_dir, f'chart-{name}', jobs[name][-1], _png_fingerprint(path))
+
+    if workers <= 1 or len(jobs) <= 1:
+        for name, job in jobs.items():
+            finished(name, render_chart(*job[:-1]))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            futures = {name: pool.submit(render_chart, *job[:-1]) for name, job in jobs.items()}
+            for name, future in futures.items():
+                finished(name, future.result())
+    return {'rendered': list(jobs), 'skipped': skipped}
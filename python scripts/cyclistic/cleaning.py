@@ -0,0 +1,202 @@
+"""Cleaning steps 2-7, applied to one chunk of raw trips at a time
+
+Every step works on a single chunk and records what it did in a `stats`
+dict, so the step-by-step report can be printed once after all chunks have
+been cleaned. Use merge_stats() to combine the stats of several chunks.
+The value counts, null counts and ranges of the raw and cleaned columns
+are in the stats' 'raw_profile' and 'clean_profile' (see cyclistic.quality).
+"""
+import numpy as np
+import pandas as pd
+
+from cyclistic.dedup import DUPLICATE_REASON
+from cyclistic.durations import parse_ride_length
+from cyclistic.features import derive_time_features
+from cyclistic.filters import CLEANING_RULES, apply_rules
+from cyclistic.profiling import step_table, timed
+from cyclistic.quality import merge_profiles, profile_frame
+from cyclistic.spatial import haversine_km
+from cyclistic.timestamps import parse_timestamps
+
+# Map numeric day_of_week (1-7, Sunday=1) to day names
+DAY_MAP = {
+    1: 'Sunday',
+    2: 'Monday',
+    3: 'Tuesday',
+    4: 'Wednesday',
+    5: 'Thursday',
+    6: 'Friday',
+    7: 'Saturday'
+}
+
+# Time features added in step 6, in output column order
+TIME_FEATURE_COLS = ['month', 'year', 'hour', 'hour_category', 'date', 'season']
+
+# Columns kept in the analysis-ready output
+ANALYSIS_COLS = [
+    'ride_id', 'rideable_type', 'started_at', 'ended_at',
+    'member_casual', 'ride_length_min', 'day_name',
+    'month', 'year', 'hour', 'hour_category', 'season',
+    'distance_km', 'speed_kmh'
+]
+
+
+def convert_datetimes(df, stats):
+    """2. Convert datetime columns with error handling
+
+    Chunks from the cache arrive already parsed; text columns are parsed
+    here with a detected format (see cyclistic.timestamps).
+    """
+    df['started_at'], _, stats['fallback_start'] = parse_timestamps(df['started_at'])
+    df['ended_at'], _, stats['fallback_end'] = parse_timestamps(df['ended_at'])
+
+    stats['failed_start'] = int(df['started_at'].isna().sum())
+    stats['failed_end'] = int(df['ended_at'].isna().sum())
+    return df
+
+
+def standard_member_casual(values):
+    """member_casual values stripped of whitespace and lowercased"""
+    return pd.Series(values).astype(str).str.strip().str.lower()
+
+
+def standardize_member_casual(df, stats):
+    """3. Standardize member_casual: strip whitespace, lowercase"""
+    df['member_casual'] = standard_member_casual(df['member_casual'])
+    return df
+
+
+def standardized_counts(counts):
+    """member_casual counts after step 3, from the raw counts (NaN included)"""
+    return counts.groupby(standard_member_casual(counts.index).to_numpy()).sum()
+
+
+def add_ride_length_min(df, stats):
+    """4. Convert ride_length to minutes"""
+    df['ride_length_min'], stats['ride_length_failed'] = parse_ride_length(df['ride_length'])
+
+    ride_length = df['ride_length_min']
+    stats['ride_length_count'] = int(ride_length.count())
+    stats['ride_length_sum'] = float(ride_length.sum())
+    stats['ride_length_min'] = ride_length.min()
+    stats['ride_length_max'] = ride_length.max()
+    stats['ride_length_missing'] = int(ride_length.isna().sum())
+    return df
+
+
+def add_day_name(df, stats):
+    """5. Convert day_of_week numbers to day names"""
+    df['day_name'] = df['day_of_week'].map(DAY_MAP)
+    return df
+
+
+def day_name_counts(day_of_week_counts):
+    """Rides per day name after step 5, from the raw day_of_week counts"""
+    names = day_of_week_counts.index.map(DAY_MAP)
+    return day_of_week_counts[names.notna()].groupby(names[names.notna()]).sum().rename('day_name')
+
+
+def add_time_features(df, stats):
+    """6. Add month, year, hour, hour_category, date, season"""
+    features = derive_time_features(df['started_at'], TIME_FEATURE_COLS)
+    for column in TIME_FEATURE_COLS:
+        df[column] = features[column]
+    return df
+
+
+def add_distance_speed(df, stats):
+    """6. Add straight-line distance (km) and implied average speed (km/h)"""
+    df['distance_km'] = haversine_km(df['start_lat'], df['start_lng'], df['end_lat'], df['end_lng'])
+    hours = df['ride_length_min'].to_numpy(dtype='float32') / np.float32(60)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df['speed_kmh'] = df['distance_km'].to_numpy() / hours
+
+    stats['distance_missing'] = int(df['distance_km'].isna().sum())
+    stats['zero_distance'] = int((df['distance_km'] == 0).sum())
+    return df
+
+
+def filter_invalid(df, stats, rules=CLEANING_RULES, keep_rejects=False, duplicate=None):
+    """7. Filter invalid data in one pass; return (clean rows, rejected rows)
+
+    Rows flagged in `duplicate` (see cyclistic.dedup) are dropped first and
+    counted in stats['duplicates_removed'].
+    """
+    stats['rows_in'] = len(df)
+    stats['duplicates_removed'] = 0
+    duplicates = None
+    if duplicate is not None and duplicate.any():
+        stats['duplicates_removed'] = int(duplicate.sum())
+        if keep_rejects:
+            duplicates = df[duplicate].assign(reject_reason=DUPLICATE_REASON)
+        df = df[~duplicate]
+    clean_df, removed, rejects = apply_rules(df, rules, keep_rejects)
+    if duplicates is not None:
+        rejects = pd.concat([duplicates, rejects])
+
+    stats['rows_out'] = len(clean_df)
+    stats['removed_by_condition'] = removed
+    return clean_df, rejects
+
+
+# Steps 2-6 in order; each takes the frame and the stats and returns the frame
+CLEANING_STEPS = [convert_datetimes, standardize_member_casual, add_ride_length_min,
+                  add_day_name, add_time_features, add_distance_speed]
+
+
+def clean_chunk(chunk, rules=CLEANING_RULES, keep_rejects=False, duplicate=None):
+    """Run cleaning steps 2-7 on one raw chunk
+
+    Returns (clean chunk, rejected rows or None, stats). The time spent in
+    each step is kept in stats['step_times'], and the profiles of the raw
+    and clean chunk in stats['raw_profile'] and stats['clean_profile'].
+    `duplicate` flags rows to drop as duplicate ride_ids in step 7.
+    """
+    stats = {
+        'raw_first_started_at': chunk['started_at'].iloc[0] if len(chunk) else None,
+        'raw_last_started_at': chunk['started_at'].iloc[-1] if len(chunk) else None,
+        'ride_length_sample': chunk['ride_length'].head(3).tolist(),
+    }
+    times = {}
+    # The steps change the chunk in place, so the raw columns are profiled first
+    with timed(times, 'profile_raw', len(chunk)):
+        stats['raw_profile'] = profile_frame(chunk)
+    df = chunk
+    for step in CLEANING_STEPS:
+        with timed(times, step.__name__, len(df)):
+            df = step(df, stats)
+    with timed(times, 'filter_invalid', len(df)) as rows:
+        clean_df, rejects = filter_invalid(df, stats, rules, keep_rejects, duplicate)
+        rows['rows_out'] = len(clean_df)
+
+    # Clean rows always have a start time, so year and hour have no gaps left
+    clean_df = clean_df.astype({'year': 'int16', 'hour': 'int8'})
+    with timed(times, 'profile_clean', len(clean_df)):
+        stats['clean_profile'] = profile_frame(clean_df)
+    stats['step_times'] = step_table(times)
+    return clean_df, rejects, stats
+
+
+def merge_stats(total, stats):
+    """Fold the stats of one chunk into the running total"""
+    if not total:
+        return dict(stats)
+    merged = dict(total)
+    for key, value in stats.items():
+        if key not in merged or merged[key] is None:
+            merged[key] = value
+        elif key in ('raw_first_started_at', 'ride_length_sample'):
+            continue
+        elif key == 'raw_last_started_at':
+            merged[key] = value if value is not None else merged[key]
+        elif key == 'ride_length_min':
+            merged[key] = pd.Series([merged[key], value]).min()
+        elif key == 'ride_length_max':
+            merged[key] = pd.Series([merged[key], value]).max()
+        elif key.endswith('_profile'):
+            merged[key] = merge_profiles([merged[key], value])
+        elif isinstance(value, pd.Series):
+            merged[key] = merged[key].add(value, fill_value=0).astype('int64')
+        else:
+            merged[key] = merged[key] + value
+    return merged
@@ -0,0 +1,133 @@
+"""Pre-aggregated ride cube
+
+One pass over the rides builds a small table with one row per
+(member_casual, rideable_type, month, day_name, hour) cell holding the ride
+count and the count/sum/sum-of-squares/min/max of ride_length_min, plus the number of
+rides with a distance and the sums of distance_km and speed_kmh. Every
+summary table of the two scripts can be rolled up from it without going
+back to the rides. Cubes of separate chunks or months merge exactly.
+
+Medians cannot be rolled up from these measures.
+"""
+import numpy as np
+import pandas as pd
+
+from cyclistic.features import HOUR_CATEGORIES, HOUR_CATEGORY_BY_HOUR, SEASONS, SEASON_BY_MONTH
+from cyclistic.schema import compact, concat_frames
+
+CUBE_KEYS = ['member_casual', 'rideable_type', 'month', 'day_name', 'hour']
+
+# How each measure combines when cells are merged or rolled up
+MEASURES = {'count': 'sum', 'sum': 'sum', 'sum_sq': 'sum', 'min': 'min', 'max': 'max',
+            'distance_count': 'sum', 'distance_sum': 'sum', 'speed_sum': 'sum'}
+
+
+def build_cube(df, value='ride_length_min', distance='distance_km', speed='speed_kmh'):
+    """Aggregate rides (one chunk or the whole frame) into cube cells
+
+    Rides without a distance (or frames without the distance columns) only
+    add to the duration measures.
+    """
+    values = df[value].astype('float64')
+    cells = pd.DataFrame({key: df[key] for key in CUBE_KEYS})
+    cells['value'] = values
+    cells['value_sq'] = values * values
+    cells['distance'] = df[distance].astype('float64') if distance in df else np.nan
+    cells['speed'] = df[speed].astype('float64').where(cells['distance'].notna()) if speed in df else np.nan
+    cube = cells.groupby(CUBE_KEYS, observed=True).agg(
+        count=('value', 'size'),
+        sum=('value', 'sum'),
+        sum_sq=('value_sq', 'sum'),
+        min=('value', 'min'),
+        max=('value', 'max'),
+        distance_count=('distance', 'count'),
+        distance_sum=('distance', 'sum'),
+        speed_sum=('speed', 'sum'),
+    )
+    return cube.reset_index()
+
+
+def merge_cubes(cubes):
+    """Combine the cubes of several chunks or months into one"""
+    cubes = [cube for cube in cubes if cube is not None]
+    combined = concat_frames(cubes)
+    if len(cubes) == 1:
+        return combined
+    return combined.groupby(CUBE_KEYS, observed=True).agg(MEASURES).reset_index()
+
+
+def write_cube(cube, path):
+    """Save a cube as CSV, one row per cell"""
+    cube.to_csv(path, index=False)
+
+
+def read_cube(path):
+    """Read a cube saved with write_cube(), with the compact dtypes"""
+    return compact(pd.read_csv(path))
+
+
+def with_derived_keys(cube, keys):
+    """Add season, hour_category or is_weekend to the cube when asked for"""
+    cube = cube.copy()
+    if 'season' in keys:
+        codes = SEASON_BY_MONTH[cube['month'].cat.codes.to_numpy()]
+        cube['season'] = pd.Categorical.from_codes(codes, categories=SEASONS, ordered=True)
+    if 'hour_category' in keys:
+        codes = HOUR_CATEGORY_BY_HOUR[cube['hour'].to_numpy()]
+        cube['hour_category'] = pd.Categorical.from_codes(codes, categories=HOUR_CATEGORIES,
+                                                          ordered=True)
+    if 'is_weekend' in keys:
+        cube['is_weekend'] = cube['day_name'].isin(['Saturday', 'Sunday'])
+    return cube
+
+
+def rollup(cube, by, observed=False):
+    """Roll the cube up to the `by` keys and add mean, std, avg_distance and
+    avg_speed columns
+
+    Categorical keys keep their unobserved combinations (count 0, mean NaN)
+    unless observed is set, the same way a groupby on the rides would.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    cube = with_derived_keys(cube, by)
+    table = cube.groupby(by, observed=observed).agg(MEASURES)
+
+    count = table['count'].astype('float64')
+    table['mean'] = table['sum'] / count.where(count > 0)
+    variance = (table['sum_sq'] - table['sum'] ** 2 / count.where(count > 0)) / (count - 1).where(count > 1)
+    table['std'] = np.sqrt(variance.clip(lower=0))
+    distance_count = table['distance_count'].astype('float64').where(table['distance_count'] > 0)
+    table['avg_distance'] = table['distance_sum'] / distance_count
+    table['avg_speed'] = table['speed_sum'] / distance_count
+    return table
+
+
+def crosstab(cube, index, columns, measure='count', margins=False, normalize=None):
+    """Cube version of pd.crosstab(rides[index], rides[columns], ...)
+
+    measure is 'count' or any column of rollup() such as 'mean'; normalize
+    may be 'index' or 'columns' for count tables. Only observed rows are
+    listed, as pd.crosstab does.
+    """
+    table = rollup(cube, [index, columns], observed=True)[measure].unstack(columns)
+    table = table.sort_index().sort_index(axis=1)
+    if measure == 'count':
+        table = table.fillna(0).astype('int64')
+    if normalize == 'index':
+        table = table.div(table.sum(axis=1), axis=0)
+    elif normalize == 'columns':
+        table = table.div(table.sum(axis=0), axis=1)
+    if margins:
+        table.columns = table.columns.astype(object)
+        table['Total'] = table.sum(axis=1)
+        table = table.reindex(table.index.astype(object))
+        table.loc['Total'] = table.sum(axis=0)
+    return table
+
+
+def summary_table(cube, by):
+    """num_rides, avg_duration and avg_distance_km per `by` group, as a flat table"""
+    table = rollup(cube, by)
+    return pd.DataFrame({'num_rides': table['count'],
+                         'avg_duration': table['mean'],
+                         'avg_distance_km': table['avg_distance']}).reset_index()
@@ -0,0 +1,221 @@
+"""Cleaned rides as a dataset partitioned by month (and optionally user type)
+
+The cleaning script also writes the cleaned rows as a folder with one
+sub-folder per month file and, when partitioned by member_casual, one
+partition per user type inside it:
+
+    2025_cyclistic_cleaned/2025_08/member_casual=casual/part-00000/<column>.npy
+
+Partitions use the columnar layout of the parse cache (cyclistic.cache):
+one .npy file per column, text and categorical columns dictionary encoded,
+so a reader loads only the columns it asks for. Each month's month.json
+lists its partitions with their row counts, a digest of their rows and the
+min/max of STATS_COLUMNS, and the digest of the station keys the rows were
+written with (cyclistic.stations); it is written last, so a half-written
+month is never read.
+
+Filters are rules in the cyclistic.filters form. read_dataset() skips the
+partitions whose keys or min/max show that no row can pass a filter, then
+applies the filters to the rows of the partitions it reads.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+from cyclistic.cache import read_column, write_part
+from cyclistic.filters import first_failed_rule, rule_mask
+from cyclistic.schema import CLEAN_DTYPES, DATE_COLUMNS, compact, concat_frames
+
+# Bump when the layout changes so old months are rewritten
+DATASET_VERSION = 2
+
+DEFAULT_DATASET_DIR = '2025_cyclistic_cleaned'
+PARTITION_KEYS = ['member_casual']
+STATS_COLUMNS = ['started_at', 'ride_length_min']
+
+# Can a partition whose values all lie in [low, high] hold a row passing the op?
+RANGE_OPS = {
+    '>=': lambda low, high, value: high >= value,
+    '>': lambda low, high, value: high > value,
+    '<=': lambda low, high, value: low <= value,
+    '<': lambda low, high, value: low < value,
+    '==': lambda low, high, value: low <= value <= high,
+    'isin': lambda low, high, value: any(low <= v <= high for v in value),
+}
+
+
+def _month_json(root, label):
+    return os.path.join(root, label, 'month.json')
+
+
+def _stat_value(column, value):
+    return pd.Timestamp(value) if column in DATE_COLUMNS else float(value)
+
+
+def _is_categorical(column):
+    dtype = CLEAN_DTYPES.get(column)
+    return isinstance(dtype, CategoricalDtype) or dtype == 'category'
+
+
+def start_month_partitions(root, label, partition_by=(), stations=None):
+    """Start writing one month; returns the record to pass to write_partitions()
+
+    stations is the station_keys_key() of the keys in the rows, if any.
+    """
+    partition_by = list(partition_by)
+    unknown = set(partition_by) - set(PARTITION_KEYS)
+    if unknown:
+        raise ValueError(f"Can only partition by {PARTITION_KEYS}, got {sorted(unknown)}")
+    building = os.path.join(root, label + '.building')
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    return {'root': root, 'month': label, 'building': building, 'partition_by': partition_by,
+            'stations': stations, 'columns': None, 'partitions': {}}
+
+
+def write_partitions(month, rows):
+    """Add one chunk of cleaned rows (with the compact dtypes) to a month's partitions"""
+    if month['columns'] is None:
+        month['columns'] = list(rows.columns)
+    groups = rows.groupby(month['partition_by'], observed=True) if month['partition_by'] else [((), rows)]
+    for key, group in groups:
+        # Cleaning can leave a chunk with no rows; it adds no part and no bounds
+        if group.empty:
+            continue
+        keys = dict(zip(month['partition_by'], key if isinstance(key, tuple) else (key,)))
+        folder = '/'.join(f'{column}={value}' for column, value in keys.items())
+        partition = month['partitions'].setdefault(folder, {'folder': folder, **keys, 'rows': 0, 'parts': 0})
+        digest = hashlib.sha256(bytes.fromhex(partition.get('digest', '')))
+        digest.update(pd.util.hash_pandas_object(group, index=False).to_numpy().tobytes())
+        partition['digest'] = digest.hexdigest()
+        write_part(group, os.path.join(month['building'], folder, f"part-{partition['parts']:05d}"))
+        partition['rows'] += len(group)
+        partition['parts'] += 1
+        for column in STATS_COLUMNS:
+            low, high = group[column].min(), group[column].max()
+            if pd.isna(low):
+                continue
+            if column in partition:
+                low, high = min(partition[column][0], low), max(partition[column][1], high)
+            partition[column] = [low, high]
+
+
+def finish_month_partitions(month):
+    """Write month.json and publish the month's folder"""
+    partitions = [dict(partition, **{column: [str(bound) if column in DATE_COLUMNS else float(bound)
+                                              for bound in partition[column]]
+                                     for column in STATS_COLUMNS if column in partition})
+                  for partition in month['partitions'].values()]
+    with open(os.path.join(month['building'], 'month.json'), 'w') as f:
+        json.dump({'version': DATASET_VERSION, 'month': month['month'], 'partition_by': month['partition_by'],
+                   'stations': month['stations'], 'columns': month['columns'], 'partitions': partitions},
+                  f, indent=1)
+    folder = os.path.join(month['root'], month['month'])
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(month['building'], folder)
+
+
+def month_is_written(root, label, partition_by=(), stations=None):
+    """True if the dataset has a complete copy of the month with this partitioning and station keys"""
+    path = _month_json(root, label)
+    if not os.path.exists(path):
+        return False
+    with open(path) as f:
+        meta = json.load(f)
+    return (meta.get('version') == DATASET_VERSION and meta.get('partition_by') == list(partition_by)
+            and meta.get('stations') == stations)
+
+
+def drop_other_months(root, labels):
+    """Remove the months of the dataset that are not in `labels`"""
+    if not os.path.isdir(root):
+        return
+    for name in os.listdir(root):
+        if name not in labels and os.path.isdir(os.path.join(root, name)):
+            shutil.rmtree(os.path.join(root, name))
+
+
+def read_months(root):
+    """month.json of every complete month of the dataset, in month order"""
+    months = []
+    for name in sorted(os.listdir(root)):
+        path = _month_json(root, name)
+        if os.path.exists(path):
+            with open(path) as f:
+                months.append(json.load(f))
+    return months
+
+
+def may_match(partition, rule):
+    """False when the partition's keys or min/max show no row can pass `rule`"""
+    column = rule['column']
+    if 'other' in rule or 'when' in rule or rule.get('allow_missing'):
+        return True
+    if column in STATS_COLUMNS and column in partition and rule['op'] in RANGE_OPS:
+        low, high = (_stat_value(column, bound) for bound in partition[column])
+        # Bounds written from rows that were all missing say nothing
+        if pd.isna(low) or pd.isna(high):
+            return True
+        value = rule['value']
+        value = [_stat_value(column, v) for v in value] if rule['op'] == 'isin' else _stat_value(column, value)
+        return bool(RANGE_OPS[rule['op']](low, high, value))
+    if column in PARTITION_KEYS and column in partition:
+        return bool(rule_mask(pd.DataFrame({column: [partition[column]]}), rule)[0])
+    return True
+
+
+def select_partitions(root, filters=()):
+    """(month, partition) pairs that can hold rows passing every filter, and the total count"""
+    selected, total = [], 0
+    for month in read_months(root):
+        for partition in month['partitions']:
+            total += 1
+            if all(may_match(partition, rule) for rule in filters):
+                selected.append((month, partition))
+    return selected, total
+
+
+def rule_columns(rules):
+    """Columns read by a list of rules, including `other` and `when` columns"""
+    columns = []
+    for rule in rules:
+        for column in [rule['column'], rule.get('other')] + rule_columns([rule['when']] if 'when' in rule else []):
+            if column is not None and column not in columns:
+                columns.append(column)
+    return columns
+
+
+def filter_rows(rows, filters, columns=None):
+    """The rows passing every filter, with `columns` (in frame order) or all columns"""
+    if filters:
+        rows = rows[first_failed_rule(rows, filters) < 0]
+    if columns is not None:
+        rows = rows[[column for column in rows.columns if column in columns]]
+    return rows
+
+
+def iter_dataset(root, columns=None, filters=()):
+    """Yield the rows passing every filter, one written chunk at a time
+
+    Only the selected partitions are opened, and only `columns` plus the
+    columns the filters need are loaded.
+    """
+    filters = list(filters)
+    selected, _ = select_partitions(root, filters)
+    for month, partition in selected:
+        wanted = month['columns'] if columns is None else [c for c in month['columns'] if c in columns]
+        needed = wanted + [column for column in rule_columns(filters) if column not in wanted]
+        for i in range(partition['parts']):
+            part_dir = os.path.join(root, month['month'], partition['folder'], f'part-{i:05d}')
+            rows = compact(pd.DataFrame({column: read_column(part_dir, column, as_category=_is_categorical(column))
+                                         for column in needed}))
+            yield filter_rows(rows, filters, wanted)
+
+
+def read_dataset(root, columns=None, filters=()):
+    """The rows passing every filter, with `columns`, as one frame"""
+    return concat_frames(iter_dataset(root, columns, filters))
@@ -0,0 +1,208 @@
+"""Duplicate ride_id detection across month files
+
+A ride that spans a month boundary, or a month that was exported twice, can
+put the same ride_id in two month files. Before cleaning, month_ride_ids()
+reads each month's ride_id column (from the parse cache when the month is
+cached, otherwise that one column from the CSV, leaving the full parse to
+the cleaning workers), turns the hex strings into uint64 values
+(cyclistic.schema.encode_ride_ids) and saves them sorted in the index
+folder, `.cyclistic_ride_index/2025_01.npy`; the index is reused while the
+month file is unchanged. Months are indexed `workers` at a time.
+
+find_duplicates() then walks the months in order. A ride_id already in an
+earlier month is dropped from the later month, and a ride_id repeated
+within a month keeps its first row. Each month's ids are looked up in the
+sorted indexes of the earlier months. With use_bloom, a Bloom filter of
+the earlier months' ids is checked first, and only the ids it lets through
+(all duplicates plus at most about 1.5% false positives) are looked up,
+so the walk stays about linear in the number of rides as months are added;
+for a single year the plain lookups are as fast.
+
+clean_month() drops the rows with duplicate_rows(), chunk by chunk, and
+charges them to a 'duplicate ride_id' reject reason.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cyclistic.cache import DEFAULT_CACHE_DIR, iter_source_columns, source_fingerprint
+from cyclistic.ingest import month_label
+from cyclistic.sampling import ride_priorities
+from cyclistic.schema import decode_ride_ids, encode_ride_ids
+
+# Bump when the index layout changes so months are indexed again
+INDEX_VERSION = 2
+
+DEFAULT_INDEX_DIR = '.cyclistic_ride_index'
+DUPLICATE_REASON = 'duplicate ride_id'
+
+# Bits per id (at least) and bits set per id in the Bloom filter: at most about 1.5% false positives
+BLOOM_BITS_PER_ID = 12
+BLOOM_HASHES = 6
+
+
+def isin_sorted(values, sorted_ids):
+    """np.isin(values, sorted_ids) for a sorted array, by binary search"""
+    if len(sorted_ids) == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.searchsorted(sorted_ids, values).clip(max=len(sorted_ids) - 1)
+    return sorted_ids[positions] == values
+
+
+def _index_paths(path, index_dir):
+    label = month_label(path)
+    return os.path.join(index_dir, f'{label}.npy'), os.path.join(index_dir, f'{label}.json')
+
+
+def has_index(path, index_dir=DEFAULT_INDEX_DIR):
+    """Whether the saved index of a month file is up to date"""
+    meta_path = _index_paths(path, index_dir)[1]
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        return json.load(f) == {'version': INDEX_VERSION, 'source': source_fingerprint(path)}
+
+
+def month_ride_ids(path, index_dir=DEFAULT_INDEX_DIR, cache_dir=DEFAULT_CACHE_DIR, chunksize=1_000_000,
+                   dtypes=None, date_columns=()):
+    """Sorted uint64 ride_ids of one month file, repeats included, from its saved index"""
+    ids_path, meta_path = _index_paths(path, index_dir)
+    if has_index(path, index_dir):
+        return np.load(ids_path)
+    meta = {'version': INDEX_VERSION, 'source': source_fingerprint(path)}
+    # Missing ids are left out: they are not duplicates of one another
+    parts = [encode_ride_ids(chunk['ride_id'].dropna())
+             for chunk in iter_source_columns(path, ['ride_id'], chunksize, cache_dir, dtypes, date_columns)]
+    ids = np.sort(np.concatenate(parts)) if parts else np.array([], dtype=np.uint64)
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(ids_path, ids)
+    # The meta is written last, so a half-written index is never reused
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    return ids
+
+
+def new_bloom(capacity, bits_per_id=BLOOM_BITS_PER_ID):
+    """An empty Bloom filter sized for `capacity` ride_ids
+
+    The filter is blocked: an id sets all its bits in one 64-bit word, so
+    adding or looking up an id touches one word instead of one per bit.
+    """
+    words = 1 << max(0, int(np.ceil(np.log2(max(1, capacity * bits_per_id / 64)))))
+    return np.zeros(words, dtype=np.uint64)
+
+
+def _bloom_word_and_mask(bloom, ids):
+    word = ride_priorities(ids, seed=0) & np.uint64(len(bloom) - 1)
+    bits = ride_priorities(ids, seed=1)
+    mask = np.zeros(len(ids), dtype=np.uint64)
+    for i in range(BLOOM_HASHES):
+        mask |= np.uint64(1) << ((bits >> np.uint64(6 * i)) & np.uint64(63))
+    return word.astype(np.intp), mask
+
+
+def bloom_add(bloom, ids):
+    """Add uint64 ride_ids to a Bloom filter"""
+    word, mask = _bloom_word_and_mask(bloom, ids)
+    np.bitwise_or.at(bloom, word, mask)
+
+
+def bloom_may_contain(bloom, ids):
+    """False for ids certainly never added, True for ids that may have been"""
+    word, mask = _bloom_word_and_mask(bloom, ids)
+    return (bloom[word] & mask) == mask
+
+
+def find_duplicates(paths, index_dir=DEFAULT_INDEX_DIR, cache_dir=DEFAULT_CACHE_DIR, chunksize=1_000_000,
+                    dtypes=None, date_columns=(), use_bloom=False, workers=1):
+    """Find the ride_ids of `paths` (in month order) that were already seen
+
+    Returns (duplicates, report). duplicates maps the label of each month
+    with duplicates to {'drop': ids to drop from the month, 'repeated': ids
+    whose first row in the month is kept}, both sorted uint64 arrays. The
+    report has one row per duplicated ride_id and month: ride_id, month,
+    first_month (where the kept row is) and rows_dropped. Months without
+    an up-to-date index are indexed `workers` at a time.
+    """
+    labels = [month_label(path) for path in paths]
+    to_index = [path for path in paths if not has_index(path, index_dir)]
+    if workers > 1 and len(to_index) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(to_index))) as pool:
+            futures = [pool.submit(month_ride_ids, path, index_dir, cache_dir, chunksize, dtypes, date_columns)
+                       for path in to_index]
+            for future in futures:
+                future.result()
+    indexes = [month_ride_ids(path, index_dir, cache_dir, chunksize, dtypes, date_columns) for path in paths]
+    bloom = new_bloom(sum(len(ids) for ids in indexes)) if use_bloom else None
+    duplicates, report = {}, []
+    for i, (label, ids) in enumerate(zip(labels, indexes)):
+        unique, counts = np.unique(ids, return_counts=True)
+        first_month = np.full(len(unique), -1)
+        candidates = np.arange(len(unique)) if bloom is None else np.flatnonzero(bloom_may_contain(bloom, unique))
+        for j in range(i):
+            unseen = candidates[first_month[candidates] < 0]
+            if len(unseen) == 0:
+                break
+            first_month[unseen[isin_sorted(unique[unseen], indexes[j])]] = j
+        if bloom is not None:
+            bloom_add(bloom, unique)
+
+        earlier = first_month >= 0
+        repeated = ~earlier & (counts > 1)
+        if not (earlier.any() or repeated.any()):
+            continue
+        duplicates[label] = {'drop': unique[earlier], 'repeated': unique[repeated]}
+        selected = earlier | repeated
+        report.append(pd.DataFrame({
+            'ride_id': unique[selected],
+            'month': label,
+            'first_month': np.where(earlier, np.array(labels)[first_month.clip(min=0)], label)[selected],
+            'rows_dropped': np.where(earlier, counts, counts - 1)[selected],
+        }))
+    columns = ['ride_id', 'month', 'first_month', 'rows_dropped']
+    report = pd.concat(report, ignore_index=True) if report else pd.DataFrame(columns=columns)
+    return duplicates, report
+
+
+def duplicates_key(month_duplicates):
+    """Digest of one month's duplicates (None when it has none), to tell when they change"""
+    if not month_duplicates:
+        return None
+    sha = hashlib.sha256()
+    for name in ('drop', 'repeated'):
+        sha.update(np.ascontiguousarray(month_duplicates[name], dtype=np.uint64).tobytes())
+        sha.update(b'|')
+    return sha.hexdigest()
+
+
+def duplicate_rows(ride_ids, month_duplicates, seen):
+    """Boolean mask of the rows of one chunk to drop as duplicates
+
+    `seen` is a dict kept across the chunks of a month, so only the first
+    row of an id repeated within the month is kept. Rows without a ride_id
+    are never flagged.
+    """
+    ride_ids = pd.Series(ride_ids)
+    present = ride_ids.notna().to_numpy()
+    ids = np.zeros(len(ride_ids), dtype=np.uint64)
+    if ride_ids.dtype == object:
+        ids[present] = encode_ride_ids(ride_ids[present])
+    else:
+        ids[present] = ride_ids[present].to_numpy(np.uint64)
+    drop = isin_sorted(ids, month_duplicates['drop']) & present
+    repeated = np.flatnonzero(isin_sorted(ids, month_duplicates['repeated']) & ~drop & present)
+    if len(repeated):
+        repeated_ids = ids[repeated]
+        seen_before = pd.Series(repeated_ids).duplicated().to_numpy() | np.isin(repeated_ids, seen.get('ids', []))
+        drop[repeated[seen_before]] = True
+        seen['ids'] = np.union1d(seen.get('ids', np.array([], dtype=np.uint64)), repeated_ids)
+    return drop
+
+
+def write_duplicate_report(report, path):
+    """Save the duplicates report with ride_ids as hex strings"""
+    report.assign(ride_id=decode_ride_ids(report['ride_id'])).to_csv(path, index=False)
@@ -0,0 +1,85 @@
+"""Vectorized ride_length parsing
+
+Gives the same minutes as the old row-wise convert_ride_length():
+  "hh:mm:ss"  -> hours * 60 + minutes + seconds / 60
+  "mm:ss"     -> minutes + seconds / 60
+  numbers     -> seconds / 60 (also as text, e.g. "600", since the raw
+                 column is read as a categorical of strings)
+and NaN for anything else. Only the distinct values are parsed; a month of
+trips has at most a few tens of thousands of distinct ride_length strings.
+"""
+import numpy as np
+import pandas as pd
+
+# One integer field as int() accepts it: optional sign, digits with optional
+# underscores between them, surrounding whitespace
+_FIELD = r'\s*([+-]?\d+(?:_\d+)*)\s*'
+HMS_PATTERN = f'^{_FIELD}:{_FIELD}:{_FIELD}$'
+MS_PATTERN = f'^{_FIELD}:{_FIELD}$'
+
+FORMATS = ['hh:mm:ss', 'mm:ss', 'numeric', 'other']
+
+
+def _to_int(field):
+    return field.str.replace('_', '', regex=False).astype('int64')
+
+
+def _parse_strings(strings):
+    """Parse an object Series of strings; unparseable values become NaN"""
+    minutes = pd.Series(np.nan, index=strings.index)
+
+    hms = strings.str.extract(HMS_PATTERN).dropna()
+    if len(hms):
+        minutes[hms.index] = (_to_int(hms[0]) * 60 + _to_int(hms[1])) + _to_int(hms[2]) / 60
+
+    ms = strings.str.extract(MS_PATTERN).dropna()
+    if len(ms):
+        minutes[ms.index] = _to_int(ms[0]) + _to_int(ms[1]) / 60
+
+    # Plain numbers are seconds, as for numeric columns
+    rest = strings[minutes.isna() & ~strings.str.contains(':', regex=False)]
+    if len(rest):
+        minutes[rest.index] = pd.to_numeric(rest.str.strip(), errors='coerce') / 60
+    return minutes
+
+
+def parse_ride_length(values):
+    """Convert ride_length values to minutes; return (minutes, failures)
+
+    `failures` counts the non-missing values that could not be parsed,
+    per format ('hh:mm:ss', 'mm:ss', 'numeric' or 'other').
+    """
+    values = pd.Series(values)
+    failures = pd.Series(0, index=FORMATS, dtype='int64')
+
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values / 60, failures
+
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object)
+    is_str = np.array([isinstance(value, str) for value in uniques], dtype=bool)
+    is_num = np.array([isinstance(value, (int, float)) for value in uniques], dtype=bool)
+
+    parsed = pd.Series(np.nan, index=uniques.index)
+    strings = uniques[is_str]
+    if len(strings):
+        parsed[strings.index] = _parse_strings(strings)
+    numbers = uniques[is_num & ~is_str]
+    if len(numbers):
+        parsed[numbers.index] = numbers.astype(float) / 60
+
+    # Label each distinct value by format to count the ones that failed
+    n_parts = np.zeros(len(uniques), dtype='int64')
+    if len(strings):
+        n_parts[is_str] = strings.str.count(':') + 1
+    kind = np.select([n_parts == 3, n_parts == 2, is_num & ~is_str],
+                     ['hh:mm:ss', 'mm:ss', 'numeric'], 'other')
+    failed_unique = parsed.isna().to_numpy()
+    if len(uniques):
+        rows_per_unique = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        failed = pd.Series(rows_per_unique[failed_unique], index=kind[failed_unique])
+        failures = failures.add(failed.groupby(level=0).sum(), fill_value=0).astype('int64')
+
+    minutes = parsed.to_numpy()[codes]
+    minutes[codes < 0] = np.nan
+    return pd.Series(minutes, index=values.index), failures
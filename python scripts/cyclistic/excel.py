@@ -0,0 +1,115 @@
+"""Excel workbooks written in openpyxl's write-only mode
+
+Every sheet the scripts export is a small table rolled up from the
+aggregates, so a workbook is described as a list of (sheet name, frame,
+index) and write_workbook() streams it row by row: write-only worksheets
+never hold a grid of cell objects, so memory stays at the size of the
+tables and does not depend on the number of rides.
+
+The layout matches DataFrame.to_excel(): the header and index cells are
+bold, centred and boxed, and repeated labels of a column MultiIndex are
+merged. Workbooks are independent files, so write_workbooks() can build
+several at once in a pool of processes.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.utils import get_column_letter
+
+MAX_SHEET_NAME = 31
+
+# The style pandas gives header and index cells
+HEADER_FONT = Font(bold=True)
+HEADER_BORDER = Border(**{side: Side(style='thin') for side in ('left', 'right', 'top', 'bottom')})
+HEADER_ALIGNMENT = Alignment(horizontal='center', vertical='top')
+
+
+def cell_value(value):
+    """A table value as something openpyxl can write (missing values as blank cells)"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, (str, bool, int, float)) or hasattr(value, 'year'):
+        return value
+    return str(value)
+
+
+def _header_cell(sheet, value):
+    cell = WriteOnlyCell(sheet, value=cell_value(value))
+    cell.font, cell.border, cell.alignment = HEADER_FONT, HEADER_BORDER, HEADER_ALIGNMENT
+    return cell
+
+
+def _label_runs(labels):
+    """(start, end) positions of runs of the same label, for merging"""
+    runs, start = [], 0
+    for i in range(1, len(labels) + 1):
+        if i == len(labels) or labels[i] != labels[start]:
+            runs.append((start, i - 1))
+            start = i
+    return runs
+
+
+def sheet_rows(sheet, frame, index=True):
+    """Yield the rows of one sheet laid out as DataFrame.to_excel() would"""
+    if isinstance(frame.index, pd.MultiIndex) and index:
+        raise ValueError("Sheets with a row MultiIndex are not supported; reset_index() first")
+    offset = 1 if index else 0
+    if isinstance(frame.columns, pd.MultiIndex):
+        for level, name in enumerate(frame.columns.names):
+            labels = list(frame.columns.get_level_values(level))
+            if level < frame.columns.nlevels - 1:
+                for start, end in _label_runs([key[:level + 1] for key in frame.columns]):
+                    if end > start:
+                        labels[start + 1:end + 1] = [None] * (end - start)
+                        sheet.merged_cells.add(f'{get_column_letter(start + offset + 1)}{level + 1}:'
+                                               f'{get_column_letter(end + offset + 1)}{level + 1}')
+            yield [_header_cell(sheet, name)] * offset + [_header_cell(sheet, label) for label in labels]
+        if index and frame.index.name is not None:
+            yield [_header_cell(sheet, frame.index.name)]
+    else:
+        yield ([_header_cell(sheet, frame.index.name)] * offset
+               + [_header_cell(sheet, column) for column in frame.columns])
+    for label, values in zip(frame.index, frame.itertuples(index=False, name=None)):
+        yield [_header_cell(sheet, label)] * offset + [cell_value(value) for value in values]
+
+
+def write_workbook(path, sheets):
+    """Write a workbook of (sheet name, frame, index) tables; returns the path
+
+    The file is written next to `path` and moved into place when complete.
+    """
+    names = [name for name, _, _ in sheets]
+    too_long = [name for name in names if len(name) > MAX_SHEET_NAME]
+    if too_long:
+        raise ValueError(f"Sheet names longer than {MAX_SHEET_NAME} characters: {too_long}")
+    if len(set(names)) < len(names):
+        raise ValueError(f"Duplicate sheet names in {names}")
+    workbook = Workbook(write_only=True)
+    for name, frame, index in sheets:
+        sheet = workbook.create_sheet(name)
+        for row in sheet_rows(sheet, frame, index):
+            sheet.append(row)
+    building = path + '.building'
+    with open(building, 'wb') as f:
+        workbook.save(f)
+    os.replace(building, path)
+    return path
+
+
+def write_workbooks(workbooks, workers=1):
+    """Write {path: sheets} workbooks, `workers` at a time; returns the paths"""
+    paths = list(workbooks)
+    if workers <= 1 or len(paths) <= 1:
+        return [write_workbook(path, workbooks[path]) for path in paths]
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+        futures = [pool.submit(write_workbook, path, workbooks[path]) for path in paths]
+        return [future.result() for future in futures]
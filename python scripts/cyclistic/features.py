@@ -0,0 +1,81 @@
+"""Time features derived once from the started_at timestamps
+
+Everything is computed with integer arithmetic on the int64 nanosecond
+values and small lookup tables, so no string is parsed or produced per row.
+Text features come back as categoricals with a fixed category order.
+"""
+import numpy as np
+import pandas as pd
+
+NS_PER_HOUR = 3600 * 10**9
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June',
+               'July', 'August', 'September', 'October', 'November', 'December']
+DAY_NAMES = ['Sunday', 'Monday', 'Tuesday', 'Wednesday',
+             'Thursday', 'Friday', 'Saturday']
+SEASONS = ['Winter', 'Spring', 'Summer', 'Fall']
+HOUR_CATEGORIES = ['Night (0-6)', 'Morning (7-10)', 'Midday (11-15)',
+                   'Evening (16-19)', 'Night (20-23)']
+
+# Lookup tables indexed by month number - 1 and by hour
+SEASON_BY_MONTH = np.array([0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 0], dtype=np.int8)
+HOUR_CATEGORY_BY_HOUR = pd.cut(np.arange(24), bins=[0, 6, 10, 15, 19, 24],
+                               labels=False, right=False).astype(np.int8)
+
+TIME_FEATURES = ['month', 'year', 'hour', 'hour_category', 'date', 'season', 'is_weekend']
+
+
+def _categorical(codes, categories, index):
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories, ordered=True),
+                     index=index)
+
+
+def derive_time_features(started_at, columns=TIME_FEATURES):
+    """Build the requested time features from a datetime64 Series
+
+    Rows with a missing start time get NaN/NaT; year and hour come back as
+    nullable integers so they can hold those gaps.
+    """
+    ns = started_at.to_numpy(dtype='datetime64[ns]').view('int64')
+    missing = started_at.isna().to_numpy()
+    index = started_at.index
+
+    months_since_1970 = ns.view('datetime64[ns]').astype('datetime64[M]').view('int64')
+    month_code = (months_since_1970 % 12).astype(np.int8)
+    month_code[missing] = -1
+    # 1970-01-01 was a Thursday; DAY_NAMES starts on Sunday
+    days_since_1970 = np.floor_divide(ns, NS_PER_DAY)
+    day_code = ((days_since_1970 + 4) % 7).astype(np.int8)
+    hour = (np.mod(ns, NS_PER_DAY) // NS_PER_HOUR).astype(np.int8)
+
+    features = {}
+    for column in columns:
+        if column == 'month':
+            features[column] = _categorical(month_code, MONTH_NAMES, index)
+        elif column == 'year':
+            year = np.where(missing, 0, months_since_1970 // 12 + 1970).astype(np.int16)
+            features[column] = pd.Series(pd.arrays.IntegerArray(year, missing.copy()), index=index)
+        elif column == 'hour':
+            features[column] = pd.Series(pd.arrays.IntegerArray(hour, missing.copy()), index=index)
+        elif column == 'hour_category':
+            codes = HOUR_CATEGORY_BY_HOUR[hour]
+            codes[missing] = -1
+            features[column] = _categorical(codes, HOUR_CATEGORIES, index)
+        elif column == 'date':
+            date = (days_since_1970 * NS_PER_DAY).view('datetime64[ns]')
+            features[column] = pd.Series(np.where(missing, np.datetime64('NaT'), date), index=index)
+        elif column == 'season':
+            codes = SEASON_BY_MONTH[month_code]
+            codes[missing] = -1
+            features[column] = _categorical(codes, SEASONS, index)
+        elif column == 'day_name':
+            codes = day_code.copy()
+            codes[missing] = -1
+            features[column] = _categorical(codes, DAY_NAMES, index)
+        elif column == 'is_weekend':
+            # Sunday and Saturday; rides without a start time are not weekend rides
+            features[column] = pd.Series(((day_code == 0) | (day_code == 6)) & ~missing, index=index)
+        else:
+            raise KeyError(f"Unknown time feature: {column}")
+    return pd.DataFrame(features, index=index)
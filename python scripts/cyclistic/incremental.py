@@ -0,0 +1,145 @@
+"""Per-month state for incremental runs
+
+Each month file gets a state folder (`.cyclistic_state/2025_01/`) holding
+that month's cleaned partitions (`full.csv`, `analysis.csv`, `rejects.csv`,
+and `viz.csv` once the analysis script has run) and a `state.pkl` with its
+cleaning stats, aggregate cube, quantile sketch, station counts and OD
+flows. A folder is reused while its meta.json still matches the month
+file's size and modification time, the cleaning rules, the month's
+duplicate ride_ids (see cyclistic.dedup) and its station keys (see
+cyclistic.stations), so a new or
+changed month is the only one cleaned again; the yearly outputs are then
+assembled from the partitions and the summaries merged from the states.
+"""
+import json
+import os
+import shutil
+
+import pandas as pd
+
+from cyclistic.cache import source_fingerprint
+from cyclistic.ingest import month_label
+
+# Bump when the state layout or the cleaning output changes so months are recleaned
+STATE_VERSION = 6
+
+DEFAULT_STATE_DIR = '.cyclistic_state'
+
+
+def month_state_dir(path, state_dir=DEFAULT_STATE_DIR):
+    return os.path.join(state_dir, month_label(path))
+
+
+def partition_path(folder, name):
+    return os.path.join(folder, f'{name}.csv')
+
+
+def rules_key(rules):
+    return json.loads(json.dumps(rules, default=str))
+
+
+def read_month_state(path, state_dir=DEFAULT_STATE_DIR, rules=None, with_rejects=False, duplicates=None,
+                     stations=None):
+    """Return the saved state of a month file, or None if it is stale
+
+    The state is a dict with 'stats', 'cube', 'sketch', 'stations', 'od' and 'folder'.
+    duplicates is the month's duplicates_key() and stations its station_keys_key().
+    """
+    folder = month_state_dir(path, state_dir)
+    meta_path = os.path.join(folder, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if (meta.get('version') != STATE_VERSION
+            or meta.get('source') != source_fingerprint(path)
+            or meta.get('rules') != rules_key(rules)
+            or meta.get('duplicates') != duplicates
+            or meta.get('stations') != stations
+            or (with_rejects and not meta.get('rejects'))):
+        return None
+    return load_month_state(path, state_dir)
+
+
+def load_month_state(path, state_dir=DEFAULT_STATE_DIR):
+    """Load the last saved state of a month file without checking it"""
+    folder = month_state_dir(path, state_dir)
+    state_path = os.path.join(folder, 'state.pkl')
+    if not os.path.exists(state_path):
+        raise FileNotFoundError(f"No saved state for {month_label(path)} in {state_dir}/; "
+                                "run 01_data_cleaning.py with INCREMENTAL = True first")
+    state = pd.read_pickle(state_path)
+    state['folder'] = folder
+    return state
+
+
+def start_month_state(path, state_dir=DEFAULT_STATE_DIR):
+    """Create an empty folder to build a month's partitions in"""
+    building = month_state_dir(path, state_dir) + '.building'
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    return building
+
+
+def finish_month_state(path, building, state, state_dir=DEFAULT_STATE_DIR, rules=None,
+                       with_rejects=False, duplicates=None, stations=None):
+    """Save a month's stats and summaries and publish its folder"""
+    pd.to_pickle({key: state[key] for key in ('stats', 'cube', 'sketch', 'stations', 'od')},
+                 os.path.join(building, 'state.pkl'))
+    # meta.json is written last, so a half-built folder is never reused
+    with open(os.path.join(building, 'meta.json'), 'w') as f:
+        json.dump({'version': STATE_VERSION, 'source': source_fingerprint(path),
+                   'rules': rules_key(rules), 'rejects': with_rejects, 'duplicates': duplicates,
+                   'stations': stations}, f)
+    folder = month_state_dir(path, state_dir)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(building, folder)
+    state['folder'] = folder
+    return state
+
+
+def append_csv(df, path):
+    """Append rows to a CSV file, writing the header if the file is new"""
+    header = not os.path.exists(path)
+    df.to_csv(path, mode='w' if header else 'a', header=header, index=False)
+
+
+def assemble_csv(parts, output_path, state_dir=DEFAULT_STATE_DIR):
+    """Concatenate per-month CSV partitions into one output file
+
+    The output keeps whatever leading partitions are unchanged since it was
+    last assembled; it is cut after them and only the rest is appended.
+    Partitions are copied as bytes, never parsed. Returns the number of
+    partitions copied.
+    """
+    parts = [part for part in parts if os.path.exists(part)]
+    manifest_path = os.path.join(state_dir, 'outputs', os.path.basename(output_path) + '.json')
+    current = [{'path': part, **source_fingerprint(part)} for part in parts]
+
+    previous = []
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if os.path.exists(output_path) and os.path.getsize(output_path) == manifest['size']:
+            previous = manifest['parts']
+    kept = 0
+    while (kept < min(len(previous), len(current))
+           and {key: previous[kept][key] for key in current[kept]} == current[kept]):
+        kept += 1
+
+    with open(output_path, 'r+b' if kept else 'wb') as out:
+        out.truncate(previous[kept - 1]['end'] if kept else 0)
+        out.seek(0, os.SEEK_END)
+        for i in range(kept, len(parts)):
+            with open(parts[i], 'rb') as f:
+                if i > 0:
+                    f.readline()  # header
+                shutil.copyfileobj(f, out)
+            current[i]['end'] = out.tell()
+    for i in range(kept):
+        current[i]['end'] = previous[i]['end']
+
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump({'parts': current, 'size': os.path.getsize(output_path)}, f)
+    return len(parts) - kept
@@ -0,0 +1,67 @@
+"""Streaming ingestion of the monthly Cyclistic trip files"""
+import glob
+import os
+
+import pandas as pd
+
+# Monthly exports are named like 2025_01_cyclistic.csv
+MONTH_FILE_PATTERN = '[0-9][0-9][0-9][0-9]_[0-9][0-9]_cyclistic.csv'
+
+# Approximate in-memory size of one raw row (3,441.8 MB for 5,552,994 rows)
+RAW_ROW_BYTES = 650
+
+# Cleaning keeps roughly this many copies of a chunk alive at once
+CLEANING_OVERHEAD = 3
+
+
+def find_month_files(data_dir='.', pattern=MONTH_FILE_PATTERN):
+    """List the monthly trip files in chronological order"""
+    return sorted(glob.glob(os.path.join(data_dir, pattern)))
+
+
+def month_label(path):
+    """Turn '2025_01_cyclistic.csv' into '2025_01'"""
+    name = os.path.basename(path)
+    return name[:7]
+
+
+def chunk_rows_for_budget(budget_mb, row_bytes=RAW_ROW_BYTES, overhead=CLEANING_OVERHEAD):
+    """Number of raw rows per chunk that keeps cleaning within budget_mb"""
+    return max(1, int(budget_mb * 1024**2 // (row_bytes * overhead)))
+
+
+def read_columns(path):
+    """Read only the header row of a CSV file"""
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def check_schema(paths):
+    """Compare every file's header with the first file's header
+
+    Returns (base_columns, mismatches) where mismatches maps each month label
+    with a different header to its (extra, missing) column sets.
+    """
+    base_columns = read_columns(paths[0])
+    mismatches = {}
+    for path in paths:
+        columns = set(read_columns(path))
+        if columns != set(base_columns):
+            mismatches[month_label(path)] = (columns - set(base_columns),
+                                             set(base_columns) - columns)
+    return base_columns, mismatches
+
+
+def iter_month_chunks(paths, chunksize, columns=None, dtypes=None):
+    """Yield (month_label, chunk) pairs, reading each file in bounded chunks
+
+    Chunks are aligned to `columns` (default: the first file's header) the same
+    way pd.concat would align them: missing columns are filled with NaN.
+    """
+    if columns is None:
+        columns = read_columns(paths[0])
+    for path in paths:
+        label = month_label(path)
+        for chunk in pd.read_csv(path, chunksize=chunksize, dtype=dtypes):
+            if list(chunk.columns) != columns:
+                chunk = chunk.reindex(columns=columns)
+            yield label, chunk
@@ -0,0 +1,125 @@
+"""Content-addressed memo cache for analysis results
+
+A result is stored under a key hashed from everything it depends on: the
+content of the input files (size and modification time for files over
+DIGEST_MAX_MB), the settings that change it, and the code that computes it
+(the source of the functions and modules given to code_version(), so an
+edit elsewhere, e.g. to a chart, keeps the key). Changing any of them gives
+a new key, so stale entries are never read; they age out instead.
+
+Entries are pickles named `<name>-<key>.pkl` in the memo folder. Reading an
+entry touches its modification time, and after every write the least
+recently used entries are removed until the folder fits in max_mb.
+"""
+import glob
+import hashlib
+import inspect
+import json
+import os
+
+import pandas as pd
+
+from cyclistic.cache import source_fingerprint
+
+DEFAULT_MEMO_DIR = '.cyclistic_memo'
+DEFAULT_MAX_MB = 256
+DIGEST_MAX_MB = 64
+
+
+def memo_key(*parts):
+    """Hash of JSON-serializable parts (other values are hashed by their str())"""
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+
+def file_fingerprints(paths):
+    """Size and modification time of each file that exists, by path"""
+    return {path: source_fingerprint(path) for path in sorted(paths) if os.path.exists(path)}
+
+
+def file_digest(path):
+    """SHA-256 of a file's bytes"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024**2), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def input_fingerprint(paths, digest_max_mb=DIGEST_MAX_MB):
+    """Content digest of each input file that exists, by path
+
+    Files over digest_max_mb get their size and modification time instead,
+    so a large file is not read in full just to build a key.
+    """
+    return {path: (file_digest(path) if os.path.getsize(path) <= digest_max_mb * 1024**2
+                   else source_fingerprint(path))
+            for path in sorted(paths) if os.path.exists(path)}
+
+
+def code_version(*code):
+    """Hash of the source of `code`: the functions and modules a result depends on"""
+    sha = hashlib.sha256()
+    for item in code:
+        sha.update(inspect.getsource(item).encode())
+    return sha.hexdigest()[:32]
+
+
+def _entry_path(memo_dir, name, key):
+    return os.path.join(memo_dir, f'{name}-{key}.pkl')
+
+
+def has_memo(memo_dir, name, key):
+    return memo_dir is not None and os.path.exists(_entry_path(memo_dir, name, key))
+
+
+def read_memo(memo_dir, name, key):
+    """The value saved under (name, key), or None"""
+    if not has_memo(memo_dir, name, key):
+        return None
+    path = _entry_path(memo_dir, name, key)
+    os.utime(path)  # most recently used
+    return pd.read_pickle(path)
+
+
+def write_memo(memo_dir, name, key, value, max_mb=DEFAULT_MAX_MB):
+    """Save a value under (name, key), then evict down to max_mb"""
+    if memo_dir is None:
+        return value
+    os.makedirs(memo_dir, exist_ok=True)
+    path = _entry_path(memo_dir, name, key)
+    pd.to_pickle(value, path + '.tmp')
+    os.replace(path + '.tmp', path)
+    evict(memo_dir, max_mb, keep=path)
+    return value
+
+
+def memoize(memo_dir, name, key, compute, max_mb=DEFAULT_MAX_MB):
+    """compute(), or its saved value when (name, key) has been computed before"""
+    value = read_memo(memo_dir, name, key)
+    if value is None:
+        value = write_memo(memo_dir, name, key, compute(), max_mb)
+    return value
+
+
+def evict(memo_dir, max_mb=DEFAULT_MAX_MB, keep=None):
+    """Remove the least recently used entries until the folder fits in max_mb
+
+    Returns the number of entries removed; `keep` is never removed.
+    """
+    entries = []
+    for path in glob.glob(os.path.join(memo_dir, '*.pkl')):
+        info = os.stat(path)
+        entries.append((info.st_mtime_ns, info.st_size, path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in entries:
+        if total <= max_mb * 1024**2:
+            break
+        if path == keep:
+            continue
+        os.remove(path)
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,123 @@
+"""Cleaning whole month files, one after another or in worker processes
+
+clean_month() streams one month through cleaning steps 2-7 and returns its
+state: the cleaning stats, aggregate cube, quantile sketch, station counts
+and origin-destination flows. With a dataset_dir the cleaned rows are also
+written to that month's partitions (see cyclistic.dataset). Given the
+station keys of find_station_keys(), the cleaned rows carry
+start_station_key and end_station_key, and the dataset keeps them instead
+of the station id and name strings. The stats include the time spent reading,
+in each cleaning step, writing and aggregating. Months are
+independent, so clean_months() can hand them to a pool of processes; each
+worker writes its month to its own partition folder and the results come
+back in month order, so merging them gives the same output as a serial run.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from cyclistic.cache import DEFAULT_CACHE_DIR, iter_cached_month_chunks
+from cyclistic.cleaning import ANALYSIS_COLS, clean_chunk, merge_stats
+from cyclistic.cube import build_cube, merge_cubes
+from cyclistic.dataset import finish_month_partitions, start_month_partitions, write_partitions
+from cyclistic.dedup import duplicate_rows, duplicates_key
+from cyclistic.filters import CLEANING_RULES
+from cyclistic.incremental import (DEFAULT_STATE_DIR, finish_month_state, partition_path,
+                                   append_csv, start_month_state)
+from cyclistic.ingest import month_label
+from cyclistic.profiling import step_table, timed
+from cyclistic.schema import DATE_COLUMNS, RAW_DTYPES, compact
+from cyclistic.sketch import build_sketch, merge_sketches
+from cyclistic.spatial import build_od, merge_od
+from cyclistic.stations import (STATION_TEXT_COLUMNS, add_station_keys, merge_station_counts, station_counts,
+                                station_keys_key)
+
+
+def clean_month(path, outputs, chunksize, columns, cache_dir=DEFAULT_CACHE_DIR,
+                dtypes=RAW_DTYPES, date_columns=DATE_COLUMNS, rules=CLEANING_RULES,
+                keep_rejects=False, dataset_dir=None, partition_by=(), duplicates=None, station_keys=None):
+    """Clean one month file, appending its rows to the `outputs` CSV files
+
+    outputs maps 'full', 'analysis' and 'rejects' to file names. If
+    dataset_dir is set, the cleaned rows also go to the month's partitions
+    there, split by the `partition_by` columns. duplicates maps month labels
+    to the ride_ids find_duplicates() found for them; those rows are
+    dropped in step 7. station_keys is the table of find_station_keys().
+    Returns the
+    month's state: cleaning stats, aggregate cube, quantile sketch, station
+    counts and OD flows.
+    """
+    stats, cubes, sketch, stations, od = {}, [], None, [], []
+    times = {}
+    month = (start_month_partitions(dataset_dir, month_label(path), partition_by,
+                                    station_keys_key(station_keys, month_label(path)))
+             if dataset_dir else None)
+    month_duplicates, seen = (duplicates or {}).get(month_label(path)), {}
+    chunks = iter_cached_month_chunks([path], chunksize, columns, cache_dir, dtypes, date_columns)
+    while True:
+        with timed(times, 'read_chunk') as rows:
+            _, chunk = next(chunks, (None, None))
+            rows['rows_in'] = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            break
+        duplicate = duplicate_rows(chunk['ride_id'], month_duplicates, seen) if month_duplicates else None
+        clean, rejects, chunk_stats = clean_chunk(chunk, rules, keep_rejects, duplicate)
+        stats = merge_stats(stats, chunk_stats)
+        if station_keys is not None:
+            clean = add_station_keys(clean, station_keys)
+
+        with timed(times, 'write_csv', len(clean)):
+            if rejects is not None:
+                append_csv(rejects, outputs['rejects'])
+            append_csv(clean, outputs['full'])
+            append_csv(clean[ANALYSIS_COLS], outputs['analysis'])
+        if month is not None:
+            with timed(times, 'write_dataset', len(clean)):
+                write_partitions(month, compact(clean if station_keys is None
+                                                else clean.drop(columns=STATION_TEXT_COLUMNS)))
+
+        # The reports and summaries come from the cube and the sketch, so no
+        # cleaned rows need to stay in memory
+        with timed(times, 'aggregate', len(clean)):
+            analysis = compact(clean[ANALYSIS_COLS])
+            cubes.append(build_cube(analysis))
+            sketch = merge_sketches([sketch, build_sketch(analysis)])
+            stations.append(station_counts(clean, month_label(path)))
+            od.append(build_od(clean))
+
+    if month is not None:
+        finish_month_partitions(month)
+
+    # In pipeline order: reading, steps 2-7, then writing and aggregating
+    times = step_table(times)
+    stats['step_times'] = pd.concat([times.loc[['read_chunk']], stats.get('step_times'),
+                                     times.drop('read_chunk')])
+    return {'stats': stats, 'cube': merge_cubes(cubes), 'sketch': sketch,
+            'stations': merge_station_counts(stations), 'od': merge_od(od)}
+
+
+def clean_month_to_state(path, state_dir=DEFAULT_STATE_DIR, rules=CLEANING_RULES,
+                         keep_rejects=False, **options):
+    """Clean one month into its own state folder (see cyclistic.incremental)"""
+    building = start_month_state(path, state_dir)
+    outputs = {name: partition_path(building, name) for name in ('full', 'analysis', 'rejects')}
+    state = clean_month(path, outputs, rules=rules, keep_rejects=keep_rejects, **options)
+    month_duplicates = (options.get('duplicates') or {}).get(month_label(path))
+    return finish_month_state(path, building, state, state_dir, rules, keep_rejects,
+                              duplicates_key(month_duplicates),
+                              station_keys_key(options.get('station_keys'), month_label(path)))
+
+
+def clean_months(paths, workers=1, **options):
+    """Clean month files into their state folders, `workers` at a time
+
+    Yields (path, state) in the order of `paths` as the months finish.
+    """
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield path, clean_month_to_state(path, **options)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+        futures = [pool.submit(clean_month_to_state, path, **options) for path in paths]
+        for path, future in zip(paths, futures):
+            yield path, future.result()
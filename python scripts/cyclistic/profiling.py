@@ -0,0 +1,198 @@
+"""Stage timing, memory and row counts for the run reports
+
+A run is a dict with the script name and a list of stage records. Each
+numbered step of a script is bracketed by begin_stage() / end_stage() (so
+notebook cells need no extra indentation), which record wall time, CPU time
+(including finished worker processes), peak RSS and rows in/out. Peak RSS is
+reset at the start of every stage where the OS allows it (Linux), so it is
+the high-water mark of that stage alone; elsewhere it is the process peak so
+far.
+
+A stage can also be profiled: 'cprofile' dumps a .prof file per stage and
+'tracemalloc' writes the top allocation sites and records the traced peak.
+
+write_run_report() saves the run as JSON and the stages as CSV, and
+compare_runs() lists the stages that got slower since a previous report.
+"""
+import cProfile
+import json
+import os
+import platform
+import re
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_MODES = (None, 'cprofile', 'tracemalloc')
+DEFAULT_PROFILE_DIR = '.cyclistic_profile'
+TRACEMALLOC_TOP = 25
+
+STAGE_COLUMNS = ['stage', 'wall_s', 'cpu_s', 'peak_rss_mb', 'children_peak_rss_mb',
+                 'rows_in', 'rows_out', 'rows_per_s', 'traced_peak_mb']
+
+
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_mb(who='self'):
+    if who == 'self':
+        try:
+            with open('/proc/self/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN).ru_maxrss
+    # bytes on macOS, kB elsewhere
+    return peak / 1024**2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _file_name(name):
+    return re.sub(r'[^0-9a-z]+', '_', name.lower()).strip('_')
+
+
+def start_run(script, profile=None, profile_dir=DEFAULT_PROFILE_DIR):
+    """New run record for `script`; profile is one of PROFILE_MODES"""
+    if profile not in PROFILE_MODES:
+        raise ValueError(f"profile must be one of {PROFILE_MODES}, got {profile!r}")
+    return {'script': script, 'started': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'pandas': pd.__version__,
+            'cpu_count': os.cpu_count(), 'profile': profile, 'profile_dir': profile_dir,
+            'stages': []}
+
+
+def begin_stage(run, name, rows_in=None):
+    """Start timing a stage; returns the record to pass to end_stage()"""
+    record = {'stage': name, 'rows_in': rows_in, 'rows_out': None}
+    if run['profile'] == 'cprofile':
+        record['_profiler'] = cProfile.Profile()
+        record['_profiler'].enable()
+    elif run['profile'] == 'tracemalloc':
+        tracemalloc.start()
+    _reset_peak_rss()
+    record['_start'] = (time.perf_counter(), _cpu_seconds())
+    return record
+
+
+def end_stage(run, record, rows_in=None, rows_out=None):
+    """Finish a stage started with begin_stage() and add it to the run"""
+    wall_start, cpu_start = record.pop('_start')
+    record['wall_s'] = time.perf_counter() - wall_start
+    record['cpu_s'] = _cpu_seconds() - cpu_start
+    record['peak_rss_mb'] = _peak_rss_mb('self')
+    record['children_peak_rss_mb'] = _peak_rss_mb('children')
+    if rows_in is not None:
+        record['rows_in'] = rows_in
+    if rows_out is not None:
+        record['rows_out'] = rows_out
+    rows = record['rows_in'] if record['rows_in'] is not None else record['rows_out']
+    record['rows_per_s'] = rows / record['wall_s'] if rows and record['wall_s'] > 0 else None
+
+    if run['profile'] is not None:
+        os.makedirs(run['profile_dir'], exist_ok=True)
+        path = os.path.join(run['profile_dir'], f"{_file_name(run['script'])}_{_file_name(record['stage'])}")
+    if run['profile'] == 'cprofile':
+        profiler = record.pop('_profiler')
+        profiler.disable()
+        profiler.dump_stats(path + '.prof')
+    elif run['profile'] == 'tracemalloc':
+        snapshot = tracemalloc.take_snapshot()
+        record['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024**2
+        tracemalloc.stop()
+        with open(path + '.tracemalloc.txt', 'w') as f:
+            for stat in snapshot.statistics('lineno')[:TRACEMALLOC_TOP]:
+                f.write(f"{stat}\n")
+    run['stages'].append(record)
+    return record
+
+
+@contextmanager
+def timed(times, name, rows_in=0):
+    """Add the wall and CPU time of a block to times[name] (lightweight, for inner loops)
+
+    Yields a dict whose rows_in / rows_out (rows_out defaults to rows_in) can
+    be set inside the block.
+    """
+    record = times.setdefault(name, {'wall_s': 0.0, 'cpu_s': 0.0, 'rows_in': 0, 'rows_out': 0})
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    rows = {'rows_in': rows_in, 'rows_out': None}
+    yield rows
+    record['wall_s'] += time.perf_counter() - wall_start
+    record['cpu_s'] += time.process_time() - cpu_start
+    record['rows_in'] += rows['rows_in']
+    record['rows_out'] += rows['rows_in'] if rows['rows_out'] is None else rows['rows_out']
+
+
+def step_table(times):
+    """Timings collected with timed(), as a frame indexed by step (adds up across chunks)"""
+    return pd.DataFrame.from_dict(times, orient='index')
+
+
+def add_steps(run, step_tables, prefix=''):
+    """Add up step_table()s (e.g. one per month) and add them to the run as
+    stages (time and rows only, no memory)"""
+    step_tables = [steps for steps in step_tables if steps is not None]
+    if not step_tables:
+        return
+    steps = pd.concat(step_tables).groupby(level=0, sort=False).sum()
+    for name, step in steps.iterrows():
+        run['stages'].append({'stage': f"{prefix}{name}", 'wall_s': step['wall_s'], 'cpu_s': step['cpu_s'],
+                              'rows_in': int(step['rows_in']), 'rows_out': int(step['rows_out']),
+                              'rows_per_s': step['rows_in'] / step['wall_s'] if step['wall_s'] > 0 else None})
+
+
+def stage_table(run):
+    """The stages of a run as a frame"""
+    table = pd.DataFrame(run['stages']).reindex(columns=STAGE_COLUMNS)
+    return table.astype({'rows_in': 'Int64', 'rows_out': 'Int64'})
+
+
+def write_run_report(run, path):
+    """Save the run as JSON at `path` and its stages as CSV next to it"""
+    run = dict(run, finished=datetime.now().isoformat(timespec='seconds'))
+    with open(path, 'w') as f:
+        json.dump(run, f, indent=2, default=str)
+    stage_table(run).to_csv(os.path.splitext(path)[0] + '.csv', index=False)
+
+
+def read_run_report(path):
+    """Load a run saved by write_run_report(), or None if there is none"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_runs(previous, current, threshold=1.25, min_seconds=0.5):
+    """Stages whose wall time grew by more than `threshold` times since `previous`
+
+    Stages shorter than min_seconds in both runs are ignored as noise.
+    """
+    before = stage_table(previous).set_index('stage')['wall_s']
+    after = stage_table(current).set_index('stage')['wall_s']
+    both = pd.DataFrame({'before_s': before, 'after_s': after}).dropna()
+    both = both[(both['before_s'] >= min_seconds) | (both['after_s'] >= min_seconds)]
+    both['ratio'] = both['after_s'] / both['before_s']
+    return both[both['ratio'] > threshold].sort_values('ratio', ascending=False)
@@ -0,0 +1,293 @@
+"""Data quality profiles of raw and cleaned rides, one pass per chunk
+
+profile_frame() looks at every column of a chunk once and returns a
+profile that merge_profiles() can add to the profiles of other chunks or
+months, in any order:
+
+    profile = None
+    for chunk in chunks:
+        profile = merge_profiles([profile, profile_frame(chunk)])
+
+Per column it keeps the null count and, by kind of column:
+
+- text, categorical, boolean and integer columns: value counts of the
+  TRACKED_VALUES most frequent values (the rest are counted in 'other')
+  and a HyperLogLog sketch of the distinct values (only the sketch for the
+  KEY_COLUMNS);
+- numeric and datetime columns: count, sum, min and max (so the mean);
+- a histogram: counts per HISTOGRAM_EDGES bin for the numeric columns
+  listed there, and rides per day for datetime columns.
+
+Counts and distinct values are exact while a column has no more than
+TRACKED_VALUES distinct values; beyond that the top values are approximate
+(their counts are lower bounds) and the distinct count is an estimate,
+within about 2%.
+
+column_table() and checklist() turn profiles into the data quality report,
+and write_quality_report() saves it as JSON.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import (is_bool_dtype, is_datetime64_any_dtype, is_integer_dtype,
+                              is_numeric_dtype)
+
+from cyclistic.schema import encode_ride_ids
+
+TRACKED_VALUES = 2000
+
+# Unique keys: only their distinct count is estimated (exact repeats are
+# found by cyclistic.dedup), which spares counting a million values per chunk
+KEY_COLUMNS = ['ride_id']
+
+# HyperLogLog registers (2 ** HLL_BITS) for the distinct counts: about 1.6% standard error
+HLL_BITS = 12
+
+# Bin edges of the numeric histograms; values below the first edge or at
+# or above the last get bins of their own
+HISTOGRAM_EDGES = {
+    'ride_length_min': [0, 1, 5, 15, 30, 60, 120, 1440],
+    'distance_km': [0, 0.5, 1, 2, 5, 10, 20, 50],
+    'speed_kmh': [0, 5, 10, 15, 20, 25, 30, 40, 60],
+}
+
+CHECKLIST_COLUMNS = ['section', 'item', 'value', 'percent']
+
+
+def _hash_values(values):
+    values = pd.Index(values)
+    if is_integer_dtype(values.dtype):
+        return pd.util.hash_array(np.asarray(values).astype(np.uint64))
+    if is_numeric_dtype(values.dtype) and not is_bool_dtype(values.dtype):
+        return pd.util.hash_array(values.to_numpy(dtype='float64'))
+    return pd.util.hash_array(values.astype(str).to_numpy(dtype=object))
+
+
+def _registers(values):
+    """HyperLogLog registers of a set of values"""
+    registers = np.zeros(1 << HLL_BITS, dtype=np.uint8)
+    if len(values) == 0:
+        return registers
+    hashes = _hash_values(values)
+    index = (hashes >> np.uint64(64 - HLL_BITS)).astype(np.intp)
+    rest = (hashes << np.uint64(HLL_BITS)).astype('float64')
+    # Position of the first set bit of the remaining bits, 1-based
+    with np.errstate(divide='ignore'):
+        rank = np.where(rest > 0, 64 - np.floor(np.log2(rest)), 64 - HLL_BITS + 1).astype(np.intp)
+    # Highest rank per register, from a (register, rank) occupancy grid
+    seen = np.bincount(index * 64 + rank, minlength=len(registers) * 64).reshape(-1, 64) > 0
+    registers[:] = np.where(seen.any(axis=1), 63 - np.argmax(seen[:, ::-1], axis=1), 0)
+    return registers
+
+
+def _estimate_distinct(registers):
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(2.0 ** -registers.astype('float64'))
+    zeros = int((registers == 0).sum())
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+
+def _bin_labels(edges):
+    return ([f'<{edges[0]:g}'] + [f'{low:g}-{high:g}' for low, high in zip(edges[:-1], edges[1:])]
+            + [f'{edges[-1]:g}+'])
+
+
+def _top(counts):
+    """(the TRACKED_VALUES largest counts, sum of the others)"""
+    counts = counts[counts > 0]
+    other = 0
+    if len(counts) > TRACKED_VALUES:
+        keep = np.argpartition(-counts.to_numpy(), TRACKED_VALUES)[:TRACKED_VALUES]
+        other = int(counts.sum() - counts.iloc[keep].sum())
+        counts = counts.iloc[keep]
+    return counts.sort_values(ascending=False, kind='stable').astype('int64'), other
+
+
+def profile_column(values, name=None):
+    """Profile of one column (a Series) of a chunk"""
+    dtype = values.dtype
+    present = values.notna()
+    profile = {'dtype': str(dtype), 'nulls': int(len(values) - present.sum()), 'counts': None, 'other': 0,
+               'registers': None, 'count': None, 'sum': None, 'min': None, 'max': None, 'histogram': None}
+    counted = (isinstance(dtype, pd.CategoricalDtype) or is_bool_dtype(dtype) or is_integer_dtype(dtype)
+               or not (is_numeric_dtype(dtype) or is_datetime64_any_dtype(dtype)))
+    if name in KEY_COLUMNS and counted:
+        # Distinct keys only, hashed from their uint64 form (see cyclistic.schema)
+        profile['registers'] = _registers(encode_ride_ids(values[present]))
+    elif counted:
+        counts = values.value_counts(sort=False)
+        profile['registers'] = _registers(counts.index[counts.to_numpy() > 0])
+        profile['counts'], profile['other'] = _top(counts)
+    if is_datetime64_any_dtype(dtype):
+        days = values[present].to_numpy().astype('datetime64[D]')
+        profile['count'] = len(days)
+        if len(days):
+            profile['min'], profile['max'] = values.min(), values.max()
+        profile['histogram'] = pd.Series(days).value_counts(sort=False).sort_index().astype('int64')
+    elif is_numeric_dtype(dtype) and not is_bool_dtype(dtype):
+        numbers = values.to_numpy(dtype='float64', na_value=np.nan)
+        numbers = numbers[~np.isnan(numbers)]
+        profile['count'], profile['sum'] = len(numbers), float(numbers.sum())
+        if len(numbers):
+            profile['min'], profile['max'] = float(numbers.min()), float(numbers.max())
+        if name in HISTOGRAM_EDGES:
+            edges = HISTOGRAM_EDGES[name]
+            bins = np.bincount(np.searchsorted(edges, numbers, side='right'), minlength=len(edges) + 1)
+            profile['histogram'] = pd.Series(bins, index=_bin_labels(edges), dtype='int64')
+    return profile
+
+
+def profile_frame(df, columns=None):
+    """Profile of every column (or `columns`) of one chunk"""
+    columns = list(df.columns) if columns is None else columns
+    return {'rows': len(df), 'columns': {column: profile_column(df[column], column) for column in columns}}
+
+
+def _add_series(a, b):
+    if a is None or b is None:
+        return b if a is None else a
+    return a.add(b, fill_value=0).astype('int64')
+
+
+def _merge_columns(a, b):
+    merged = {'dtype': a['dtype'] if a['dtype'] == b['dtype'] else 'mixed', 'nulls': a['nulls'] + b['nulls'],
+              'counts': None, 'other': a['other'] + b['other'], 'registers': None,
+              'histogram': _add_series(a['histogram'], b['histogram'])}
+    if a['counts'] is not None or b['counts'] is not None:
+        counts, dropped = _top(_add_series(a['counts'], b['counts']))
+        merged['counts'], merged['other'] = counts, merged['other'] + dropped
+    if a['registers'] is not None and b['registers'] is not None:
+        merged['registers'] = np.maximum(a['registers'], b['registers'])
+    else:
+        merged['registers'] = b['registers'] if a['registers'] is None else a['registers']
+    merged['count'] = None if a['count'] is None and b['count'] is None else (a['count'] or 0) + (b['count'] or 0)
+    merged['sum'] = None if a['sum'] is None and b['sum'] is None else (a['sum'] or 0) + (b['sum'] or 0)
+    extremes = {key: [value for value in (a[key], b[key]) if value is not None] for key in ('min', 'max')}
+    merged['min'] = min(extremes['min']) if extremes['min'] else None
+    merged['max'] = max(extremes['max']) if extremes['max'] else None
+    return merged
+
+
+def merge_profiles(profiles):
+    """Add up the profiles of several chunks or months"""
+    profiles = [profile for profile in profiles if profile is not None]
+    if not profiles:
+        return None
+    total = profiles[0]
+    for profile in profiles[1:]:
+        columns = dict(total['columns'])
+        for column, column_profile in profile['columns'].items():
+            other = columns.get(column)
+            columns[column] = column_profile if other is None else _merge_columns(other, column_profile)
+        total = {'rows': total['rows'] + profile['rows'], 'columns': columns}
+    return total
+
+
+def value_counts(profile, column, dropna=True):
+    """Counts of a column's values, most frequent first (with the nulls as NaN unless dropna)"""
+    column_profile = profile['columns'][column]
+    if column_profile['counts'] is None:
+        raise ValueError(f"{column} is a {column_profile['dtype']} column; its values are not counted")
+    counts = column_profile['counts']
+    if not dropna and column_profile['nulls']:
+        counts = pd.concat([counts, pd.Series([column_profile['nulls']], index=[np.nan])])
+    return counts.sort_values(ascending=False, kind='stable')
+
+
+def distinct_values(profile, column):
+    """(distinct non-null values of a column, whether the number is exact), or (None, False)"""
+    column_profile = profile['columns'][column]
+    if column_profile['counts'] is not None and column_profile['other'] == 0:
+        return len(column_profile['counts']), True
+    if column_profile['registers'] is None:
+        return None, False
+    return _estimate_distinct(column_profile['registers']), False
+
+
+def column_mean(profile, column):
+    """Mean of a numeric column (None when it has no values or is not numeric)"""
+    column_profile = profile['columns'][column]
+    if column_profile['sum'] is None or not column_profile['count']:
+        return None
+    return column_profile['sum'] / column_profile['count']
+
+
+def column_table(profile, top=3):
+    """One row per column: dtype, nulls, distinct and top values, min, max, mean"""
+    rows = []
+    for column, column_profile in profile['columns'].items():
+        distinct, exact = distinct_values(profile, column)
+        top_values = None
+        if column_profile['counts'] is not None:
+            top_values = ', '.join(f'{value} ({count:,})'
+                                   for value, count in value_counts(profile, column).iloc[:top].items())
+        rows.append({'column': column, 'dtype': column_profile['dtype'], 'rows': profile['rows'],
+                     'nulls': column_profile['nulls'],
+                     'null_percent': column_profile['nulls'] / profile['rows'] * 100 if profile['rows'] else None,
+                     'distinct': distinct, 'distinct_exact': exact, 'top_values': top_values,
+                     'min': column_profile['min'], 'max': column_profile['max'],
+                     'mean': column_mean(profile, column)})
+    return pd.DataFrame(rows).set_index('column')
+
+
+def check_rows(section, items):
+    """Checklist rows of one section from (item, value) or (item, value, percent) tuples"""
+    return pd.DataFrame([(section, *item, None)[:4] for item in items], columns=CHECKLIST_COLUMNS)
+
+
+def checklist(profile, by_user=None, medians=None):
+    """The step-8 data quality checklist of a clean profile, one row per item
+
+    Columns are section, item, value and percent (of the rides, where it
+    applies). Ride lengths per user type come from `by_user` (mean and max
+    per member_casual, e.g. a cube rollup) and `medians` when given, and are
+    the overall mean and max otherwise.
+    """
+    total = profile['rows']
+    users = value_counts(profile, 'member_casual')
+    sections = [check_rows('User Type Distribution', [(f'{user.title()} rides', int(count), count / total * 100)
+                                                      for user, count in users.items()])]
+
+    started = profile['columns']['started_at']
+    sections.append(check_rows('Date Range', [
+        ('Start', started['min']), ('End', started['max']),
+        ('Total days', (started['max'] - started['min']).days if started['count'] else 0),
+        ('Days without rides', int((started['max'] - started['min']).days + 1 - len(started['histogram']))
+         if started['count'] else 0),
+    ]))
+
+    if by_user is not None:
+        lengths = []
+        for user in ['member', 'casual']:
+            lengths += [(f'{user.title()} average', round(float(by_user.loc[user, 'mean']), 1))]
+            if medians is not None:
+                lengths += [(f'{user.title()} median', round(float(medians[user]), 1))]
+            lengths += [(f'{user.title()} max', round(float(by_user.loc[user, 'max']), 1))]
+    else:
+        lengths = [('Average', round(column_mean(profile, 'ride_length_min'), 1)),
+                   ('Max', round(profile['columns']['ride_length_min']['max'], 1))]
+    sections.append(check_rows('Ride Length Statistics (minutes)', lengths))
+
+    missing = [(column, column_profile['nulls'], column_profile['nulls'] / total * 100)
+               for column, column_profile in profile['columns'].items() if column_profile['nulls']]
+    sections.append(check_rows('Missing Values in Clean Data', missing or [('Columns with missing values', 0)]))
+    return pd.concat(sections, ignore_index=True)
+
+
+def write_quality_report(path, report, profiles):
+    """Save the checklist and the column_table() of each profile ({name: profile}) as JSON"""
+    def records(frame):
+        return json.loads(frame.to_json(orient='records', date_format='iso', default_handler=str))
+
+    body = {'checklist': records(report)}
+    for name, profile in profiles.items():
+        body[f'{name}_columns'] = records(column_table(profile).reset_index())
+    building = path + '.building'
+    with open(building, 'w') as f:
+        json.dump(body, f, indent=2)
+    os.replace(building, path)
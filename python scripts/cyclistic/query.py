@@ -0,0 +1,109 @@
+"""Queries over the saved aggregate cube and quantile sketch
+
+open_service() loads the cube and sketch written by the cleaning script
+once; run_query() then answers group-by/filter questions over DIMENSIONS
+without touching the rides:
+
+    run_query(service, 'mean', by=['member_casual', 'hour'],
+              where={'season': ['Summer'], 'rideable_type': ['electric_bike']})
+
+Measures are the ride count, the rollup() columns of the cube (mean, std,
+min, max, avg_distance, avg_speed) and ride length quantiles from the
+sketch. The sketch has no hour key, so quantiles cannot be grouped or
+filtered by hour. The results of the last `cache_size` distinct queries are
+kept in memory; the least recently used one is dropped first.
+"""
+import json
+import time
+from collections import OrderedDict
+
+from cyclistic.cube import read_cube, rollup, with_derived_keys
+from cyclistic.sketch import read_sketch, sketch_quantiles
+
+DIMENSIONS = ['member_casual', 'rideable_type', 'month', 'season', 'day_name', 'hour']
+CUBE_MEASURES = ['count', 'mean', 'std', 'min', 'max', 'avg_distance', 'avg_speed']
+MEASURES = CUBE_MEASURES + ['quantile']
+DEFAULT_CACHE_SIZE = 256
+
+
+def open_service(cube_path, sketch_path, cache_size=DEFAULT_CACHE_SIZE):
+    """Load the aggregates once; returns the service to pass to run_query()"""
+    cube = with_derived_keys(read_cube(cube_path), ['season'])
+    sketch = with_derived_keys(read_sketch(sketch_path).reset_index(), ['season'])
+    return {'cube': cube, 'sketch': sketch, 'cache': OrderedDict(), 'cache_size': cache_size,
+            'hits': 0, 'misses': 0}
+
+
+def _normalize(measure, by, where, quantiles):
+    if measure not in MEASURES:
+        raise ValueError(f"measure must be one of {MEASURES}, got {measure!r}")
+    by = [by] if isinstance(by, str) else list(by or [])
+    where = {key: [values] if isinstance(values, (str, int)) else list(values)
+             for key, values in (where or {}).items()}
+    unknown = [key for key in by + list(where) if key not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimension(s) {unknown}; use {DIMENSIONS}")
+    if 'hour' in where:
+        where['hour'] = [int(hour) for hour in where['hour']]
+    if measure == 'quantile':
+        if 'hour' in by or 'hour' in where:
+            raise ValueError("Quantiles are not available by hour (the sketch has no hour key)")
+        quantiles = tuple(float(q) for q in quantiles)
+        if not all(0 <= q <= 1 for q in quantiles):
+            raise ValueError(f"Quantiles must be between 0 and 1, got {quantiles}")
+    else:
+        quantiles = ()
+    where = {key: sorted(set(values), key=str) for key, values in sorted(where.items())}
+    return measure, by, where, quantiles
+
+
+def _filter(frame, where):
+    for key, values in where.items():
+        frame = frame[frame[key].isin(values)]
+    return frame
+
+
+def _compute(service, measure, by, where, quantiles):
+    if measure == 'quantile':
+        counts = _filter(service['sketch'], where)
+        # One 'all' group, like the cube below: a where that keeps no rides gives no rows
+        grouping = by or ['all']
+        sketch = counts.assign(all=0).groupby(grouping + ['bin'], observed=True)['count'].sum()
+        table = sketch_quantiles(sketch, grouping, quantiles)
+        return table.reset_index(drop=True) if not by else table.reset_index()
+    cube = _filter(service['cube'], where)
+    if not by:
+        cube, by = cube.assign(all='all'), ['all']
+        return rollup(cube, by, observed=True)[[measure]].reset_index(drop=True)
+    return rollup(cube, by, observed=True)[[measure]].reset_index()
+
+
+def run_query(service, measure='count', by=(), where=None, quantiles=(0.5,)):
+    """Answer one query; returns (table, True if it came from the cache)
+
+    by lists DIMENSIONS to group on (none gives one row for all rides), where
+    maps DIMENSIONS to the values to keep, and quantiles are used with
+    measure='quantile'. Raises ValueError for a query that cannot be answered.
+    """
+    measure, by, where, quantiles = _normalize(measure, by, where, quantiles)
+    key = (measure, tuple(by), tuple((k, tuple(v)) for k, v in where.items()), quantiles)
+    cache = service['cache']
+    if key in cache:
+        cache.move_to_end(key)
+        service['hits'] += 1
+        return cache[key].copy(), True
+    table = _compute(service, measure, by, where, quantiles)
+    service['misses'] += 1
+    cache[key] = table
+    if len(cache) > service['cache_size']:
+        cache.popitem(last=False)
+    return table.copy(), False
+
+
+def query_records(service, measure='count', by=(), where=None, quantiles=(0.5,)):
+    """run_query() as a JSON-ready dict with the rows and the time taken"""
+    start = time.perf_counter()
+    table, cached = run_query(service, measure, by, where, quantiles)
+    return {'measure': measure, 'by': list(by), 'where': where or {}, 'cached': cached,
+            'ms': round((time.perf_counter() - start) * 1000, 3),
+            'rows': json.loads(table.to_json(orient='records'))}
@@ -0,0 +1,166 @@
+"""Reproducible ride samples, stratified or uniform, drawn in one pass
+
+Every ride gets a pseudo-random priority hashed from its ride_id and a seed,
+and a stratum keeps the rides with the lowest priorities. That is a uniform
+sample without replacement of the stratum (bottom-k sampling, a reservoir
+sample that does not depend on the order of the rides), so feeding the
+rides in any chunks or order gives the same sample for the same seed:
+
+    sample = start_sample(populations, size=100_000)
+    for rides in chunks:
+        add_to_sample(sample, rides)
+    rows, weights = finish_sample(sample)
+
+populations are the ride counts per stratum (from the cube), used to share
+`size` between strata before the pass: 'proportional' keeps each stratum's
+share of the rides, 'equal' gives every stratum the same number of rows
+(small strata are then over-sampled). method='reservoir' draws one uniform
+sample of all rides instead. Each sampled row carries a sample_weight, the
+rides of its stratum per sampled row, so weighted sums reproduce the
+population totals; the weights table lists them per stratum.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from cyclistic.schema import concat_frames
+
+STRATA = ['member_casual', 'month', 'rideable_type']
+METHODS = ('stratified', 'reservoir')
+ALLOCATIONS = ('proportional', 'equal')
+DEFAULT_SAMPLE_SIZE = 100_000
+DEFAULT_SEED = 2025
+
+
+def ride_priorities(ride_ids, seed=DEFAULT_SEED):
+    """A pseudo-random uint64 per uint64 ride id (SplitMix64), the same in every run for a seed"""
+    with np.errstate(over='ignore'):
+        z = np.asarray(ride_ids, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15) * np.uint64(seed + 1)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def allocate(populations, size, allocation='proportional'):
+    """Rows to draw per stratum: `size` in all, never more than a stratum holds"""
+    if allocation not in ALLOCATIONS:
+        raise ValueError(f"allocation must be one of {ALLOCATIONS}, got {allocation!r}")
+    populations = populations[populations > 0].astype('int64')
+    size = min(int(size), int(populations.sum()))
+    if allocation == 'proportional':
+        exact = populations * size / populations.sum()
+        counts = np.floor(exact).astype('int64')
+        # The rows left after rounding down go to the largest remainders
+        largest = np.argsort(-(exact - counts).to_numpy(), kind='stable')[:size - counts.sum()]
+        counts.iloc[largest] += 1
+        return counts
+    # Equal shares, smallest strata first, so what they cannot fill goes to the others
+    counts = pd.Series(0, index=populations.index, dtype='int64')
+    left = size
+    for i, position in enumerate(np.argsort(populations.to_numpy(), kind='stable')):
+        share = -(-left // (len(populations) - i))
+        counts.iloc[position] = min(populations.iloc[position], share)
+        left -= counts.iloc[position]
+    return counts
+
+
+def _stratum_keys(frame, strata):
+    return pd.MultiIndex.from_arrays([frame[column].astype(str) for column in strata], names=strata)
+
+
+def start_sample(populations, size=DEFAULT_SAMPLE_SIZE, method='stratified', allocation='proportional',
+                 seed=DEFAULT_SEED):
+    """Start a sample; populations are ride counts indexed by the STRATA values
+
+    Returns the sample to pass to add_to_sample() and finish_sample().
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+    if method == 'reservoir':
+        strata, populations = [], pd.Series([int(populations.sum())], index=pd.Index(['all'], name='stratum'))
+    else:
+        strata = list(populations.index.names)
+    counts = allocate(populations, size, allocation)
+    if strata:
+        counts.index = _stratum_keys(counts.index.to_frame(index=False), strata)
+    return {'method': method, 'strata': strata, 'seed': seed, 'allocation': counts,
+            'seen': np.zeros(len(counts), dtype='int64'), 'kept': None}
+
+
+def add_to_sample(sample, rides):
+    """Offer one chunk of rides (with ride_id as uint64) to the sample"""
+    if sample['strata']:
+        codes = sample['allocation'].index.get_indexer(_stratum_keys(rides, sample['strata']))
+        if (codes < 0).any():
+            raise ValueError("Rides in strata the populations do not have; rebuild them from these rides")
+    else:
+        codes = np.zeros(len(rides), dtype='int64')
+    sample['seen'] += np.bincount(codes, minlength=len(sample['seen']))
+    wanted = sample['allocation'].to_numpy()
+    # Only the chunk's own lowest priorities in each stratum can make the sample,
+    # so just those rows are copied
+    priorities = ride_priorities(rides['ride_id'], sample['seed'])
+    order = np.argsort(priorities, kind='stable')
+    rank = pd.Series(codes[order]).groupby(codes[order]).cumcount().to_numpy()
+    candidates = order[rank < wanted[codes[order]]]
+    rows = rides.iloc[candidates].assign(_stratum=codes[candidates], _priority=priorities[candidates])
+    if sample['kept'] is not None:
+        rows = concat_frames([sample['kept'], rows])
+    rows = rows.sort_values('_priority', kind='stable')
+    sample['kept'] = rows[rows.groupby('_stratum').cumcount().to_numpy() < wanted[rows['_stratum'].to_numpy()]]
+
+
+def finish_sample(sample):
+    """(sampled rows with a sample_weight column, weights per stratum)"""
+    counts = sample['allocation']
+    weights = counts.index.to_frame(index=False)
+    kept = sample['kept']
+    if kept is None:
+        raise ValueError("No rides were added to the sample")
+    weights['population'] = sample['seen']
+    weights['sampled'] = np.bincount(kept['_stratum'], minlength=len(counts))
+    weights['weight'] = weights['population'] / weights['sampled'].where(weights['sampled'] > 0)
+    rows = kept.assign(sample_weight=weights['weight'].to_numpy()[kept['_stratum'].to_numpy()])
+    order = ['started_at', 'ride_id'] if 'started_at' in rows else ['_priority']
+    rows = rows.sort_values(order, kind='stable').drop(columns=['_stratum', '_priority'])
+    return rows.reset_index(drop=True), weights
+
+
+def write_npz(frame, path):
+    """Save a frame as one compressed .npz file, text and categorical columns dictionary encoded"""
+    arrays = {}
+    for column in frame.columns:
+        values = frame[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            arrays[column] = values.cat.codes.to_numpy()
+            arrays[f'{column}.categories'] = np.asarray(values.cat.categories, dtype=str)
+        elif values.dtype == object:
+            codes, strings = pd.factorize(values)
+            arrays[column] = codes.astype(np.int32)
+            arrays[f'{column}.strings'] = np.asarray(strings, dtype=str)
+        else:
+            arrays[column] = values.to_numpy()
+    building = path + '.building'
+    with open(building, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(building, path)
+
+
+def read_npz(path):
+    """A frame saved by write_npz()"""
+    with np.load(path) as arrays:
+        data = {}
+        for name in arrays.files:
+            if name.endswith(('.categories', '.strings')):
+                continue
+            values = arrays[name]
+            if f'{name}.categories' in arrays.files:
+                values = pd.Categorical.from_codes(values, categories=arrays[f'{name}.categories'].astype(object))
+            elif f'{name}.strings' in arrays.files:
+                strings = arrays[f'{name}.strings'].astype(object)
+                decoded = np.full(len(values), np.nan, dtype=object)
+                decoded[values >= 0] = strings[values[values >= 0]]
+                values = decoded
+            data[name] = values
+    return pd.DataFrame(data)
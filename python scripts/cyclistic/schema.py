@@ -0,0 +1,145 @@
+"""Column dtypes shared by the cleaning and analysis scripts
+
+Closed sets (user type, day, month, season, hour band) are categoricals
+with a fixed category order; open sets (bike and station names) are plain
+categoricals. Hours and days are int8, coordinates and durations float32.
+ride_id is held as a uint64: Divvy ride ids are 16 hex digits, so
+encode_ride_ids() is exact for them and decode_ride_ids() gives the
+(upper-case) hex string back for output files.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+from cyclistic.features import DAY_NAMES, HOUR_CATEGORIES, MONTH_NAMES, SEASONS
+from cyclistic.timestamps import parse_timestamps
+
+MEMBER_CASUAL = ['casual', 'member']
+
+DATE_COLUMNS = ['started_at', 'ended_at']
+
+# Raw monthly files: text columns with few distinct values become categoricals
+RAW_DTYPES = {
+    'rideable_type': 'category',
+    'start_station_name': 'category',
+    'start_station_id': 'category',
+    'end_station_name': 'category',
+    'end_station_id': 'category',
+    'start_lat': 'float32',
+    'start_lng': 'float32',
+    'end_lat': 'float32',
+    'end_lng': 'float32',
+    'member_casual': 'category',
+    'ride_length': 'category',
+}
+
+# Cleaned data (2025_cyclistic_cleaned_full.csv and the in-memory frames)
+CLEAN_DTYPES = {
+    **RAW_DTYPES,
+    'member_casual': CategoricalDtype(MEMBER_CASUAL),
+    'start_station_key': 'int32',
+    'end_station_key': 'int32',
+    'day_of_week': 'int8',
+    'ride_length_min': 'float32',
+    'day_name': CategoricalDtype(DAY_NAMES, ordered=True),
+    'month': CategoricalDtype(MONTH_NAMES, ordered=True),
+    'year': 'int16',
+    'hour': 'int8',
+    'hour_category': CategoricalDtype(HOUR_CATEGORIES, ordered=True),
+    'season': CategoricalDtype(SEASONS, ordered=True),
+    'is_weekend': 'bool',
+    'distance_km': 'float32',
+    'speed_kmh': 'float32',
+}
+
+_HEX_DIGITS = np.frombuffer(b'0123456789ABCDEF', dtype=np.uint8)
+_HEX_VALUES = np.full(256, 255, dtype=np.uint8)
+_HEX_VALUES[_HEX_DIGITS] = np.arange(16)
+_HEX_VALUES[np.frombuffer(b'abcdef', dtype=np.uint8)] = np.arange(10, 16)
+
+
+def encode_ride_ids(ride_ids):
+    """Turn 16-hex-digit ride ids into uint64 values
+
+    Ids that are not 16 hex digits are hashed instead, so they still get a
+    stable 64-bit key (but cannot be decoded back).
+    """
+    ride_ids = pd.Series(ride_ids).astype(str)
+    # One byte past the 16 digits tells longer ids apart (shorter ones end in NUL padding)
+    try:
+        raw = ride_ids.to_numpy().astype('S17')
+    except UnicodeEncodeError:
+        # Non-ASCII characters become '?', which keeps those ids off the hex path
+        raw = ride_ids.str.encode('ascii', errors='replace').to_numpy().astype('S17')
+    raw = raw.view(np.uint8).reshape(-1, 17)
+    nibbles = _HEX_VALUES[raw[:, :16]]
+    is_hex = (nibbles != 255).all(axis=1) & (raw[:, 16] == 0)
+
+    values = np.zeros(len(raw), dtype=np.uint64)
+    for i in range(16):
+        values = (values << np.uint64(4)) | nibbles[:, i].astype(np.uint64)
+    if not is_hex.all():
+        values[~is_hex] = pd.util.hash_array(ride_ids.to_numpy()[~is_hex])
+    return values
+
+
+def decode_ride_ids(values):
+    """Turn uint64 ride ids back into 16-hex-digit strings"""
+    values = np.asarray(values, dtype=np.uint64)
+    shifts = np.arange(60, -4, -4, dtype=np.uint64)
+    nibbles = (values[:, None] >> shifts) & np.uint64(15)
+    digits = _HEX_DIGITS[nibbles.astype(np.intp)]
+    return digits.view('S16').ravel().astype(str).astype(object)
+
+
+def compact(df):
+    """Apply CLEAN_DTYPES to the columns of df that have an entry"""
+    df = df.astype({column: dtype for column, dtype in CLEAN_DTYPES.items()
+                    if column in df.columns})
+    if 'ride_id' in df.columns and df['ride_id'].dtype == object:
+        df['ride_id'] = encode_ride_ids(df['ride_id'])
+    return df
+
+
+def concat_frames(frames):
+    """Concatenate chunks, keeping categoricals whose categories differ
+
+    Categoricals are recoded to the union of their categories first, so the
+    column never passes through an object-dtype copy.
+    """
+    frames = list(frames)
+    if not frames:
+        return pd.DataFrame()
+    recode = {}
+    for column in frames[0].columns:
+        dtypes = [frame[column].dtype for frame in frames]
+        if (all(isinstance(dtype, CategoricalDtype) for dtype in dtypes)
+                and len(set(dtypes)) > 1):
+            categories = dtypes[0].categories
+            for dtype in dtypes[1:]:
+                categories = categories.union(dtype.categories)
+            recode[column] = CategoricalDtype(categories, ordered=dtypes[0].ordered)
+    if recode:
+        frames = [frame.astype(recode) for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def iter_cleaned_csv(path, columns=None, chunksize=1_000_000):
+    """Yield a cleaned CSV in chunks of `chunksize` rows, with the compact dtypes"""
+    header = list(pd.read_csv(path, nrows=0).columns)
+    columns = header if columns is None else [column for column in header if column in columns]
+    dtypes = {column: dtype for column, dtype in CLEAN_DTYPES.items() if column in columns}
+    date_columns = [column for column in DATE_COLUMNS + ['date'] if column in columns]
+
+    # Timestamps are parsed with the format found in the first chunk
+    formats = {}
+    for chunk in pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunksize):
+        for column in date_columns:
+            chunk[column], fmt, _ = parse_timestamps(chunk[column], formats.get(column))
+            formats.setdefault(column, fmt)
+        yield compact(chunk)
+
+
+def read_cleaned_csv(path, columns=None, chunksize=1_000_000):
+    """Read a cleaned CSV with the compact dtypes, one chunk at a time"""
+    return concat_frames(iter_cleaned_csv(path, columns, chunksize))
@@ -0,0 +1,118 @@
+"""Mergeable quantile sketches for ride_length_min
+
+Ride lengths are counted in logarithmic bins: bin k holds the values in
+(MIN_VALUE * GAMMA**(k-1), MIN_VALUE * GAMMA**k] and reports the value
+MIN_VALUE * 2 * GAMMA**k / (GAMMA + 1). Any quantile read from the bins is
+then within RELATIVE_ACCURACY (0.25%) of the ride length at that rank, so a
+12.0 minute median comes back as 12.0 +/- 0.03 minutes. Values at or below
+MIN_VALUE (one second) share bin 0.
+
+A sketch is a Series of bin counts indexed by (SKETCH_KEYS..., bin) that
+only lists non-empty bins. Sketches of separate chunks or months merge by
+adding counts, so they can be kept per month and combined later.
+exact_quantiles() computes the same table from the rides for checking.
+"""
+import numpy as np
+import pandas as pd
+
+from cyclistic.schema import compact, concat_frames
+
+SKETCH_KEYS = ['member_casual', 'day_name', 'rideable_type', 'month']
+
+RELATIVE_ACCURACY = 0.0025
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+MIN_VALUE = 1 / 60
+MAX_VALUE = 100_000
+N_BINS = int(np.ceil(np.log(MAX_VALUE / MIN_VALUE) / np.log(GAMMA))) + 1
+
+
+def bin_index(values):
+    """Bin number of each value"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bins = np.ceil(np.log(values / MIN_VALUE) / np.log(GAMMA))
+    return np.clip(np.nan_to_num(bins, nan=0, neginf=0), 0, N_BINS - 1).astype(np.int16)
+
+
+def bin_value(bins):
+    """Value reported for each bin number"""
+    bins = np.asarray(bins, dtype='float64')
+    return np.where(bins > 0, MIN_VALUE * 2 * GAMMA**bins / (GAMMA + 1), MIN_VALUE)
+
+
+def build_sketch(df, value='ride_length_min', keys=SKETCH_KEYS):
+    """Count one chunk of rides into a sketch (missing values are skipped)"""
+    values = df[value].to_numpy(dtype='float64')
+    present = ~np.isnan(values)
+    cells = pd.DataFrame({key: df[key] for key in keys}).loc[present]
+    cells['bin'] = bin_index(values[present])
+    return cells.groupby(keys + ['bin'], observed=True).size().rename('count')
+
+
+def merge_sketches(sketches):
+    """Add up the bin counts of several sketches"""
+    sketches = [sketch for sketch in sketches if sketch is not None]
+    if len(sketches) == 1:
+        return sketches[0]
+    combined = concat_frames(sketch.reset_index() for sketch in sketches)
+    index = [column for column in combined.columns if column != 'count']
+    return combined.groupby(index, observed=True)['count'].sum()
+
+
+def write_sketch(sketch, path):
+    """Save a sketch as CSV, one row per non-empty bin"""
+    sketch.reset_index().to_csv(path, index=False)
+
+
+def read_sketch(path):
+    """Read a sketch saved with write_sketch()"""
+    counts = compact(pd.read_csv(path))
+    return counts.set_index([column for column in counts.columns if column != 'count'])['count']
+
+
+def _quantile_name(q):
+    return 'median' if q == 0.5 else f'p{q * 100:g}'
+
+
+def sketch_quantiles(sketch, by, quantiles=(0.5,)):
+    """Quantiles of ride length per `by` group, read from a sketch
+
+    Returns one column per quantile ('median', 'p90', 'p99', ...) with one
+    row per observed group; with by=[] it returns one Series for all rides.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    if not by:
+        overall = sketch.groupby(level='bin').sum()
+        overall.index = pd.MultiIndex.from_arrays([np.zeros(len(overall), dtype=int), overall.index],
+                                                  names=['all', 'bin'])
+        return sketch_quantiles(overall, 'all', quantiles).iloc[0]
+    counts = sketch.groupby(by + ['bin'], observed=True).sum().reset_index()
+    counts = counts.sort_values(by + ['bin'], kind='stable')
+    grouped = counts.groupby(by, observed=True, sort=False)['count']
+    cumulative = grouped.cumsum().to_numpy()
+    total = grouped.transform('sum').to_numpy()
+
+    table = {}
+    for q in quantiles:
+        # first bin whose running count passes the rank of the q-quantile
+        rank = np.floor(q * (total - 1))
+        hit = counts.loc[cumulative > rank, by + ['bin']]
+        first = hit.groupby(by, observed=True, sort=True)['bin'].first()
+        table[_quantile_name(q)] = pd.Series(bin_value(first.to_numpy()), index=first.index)
+    return pd.DataFrame(table)
+
+
+def exact_quantiles(df, by, quantiles=(0.5,), value='ride_length_min', interpolation='linear'):
+    """Exact version of sketch_quantiles(), computed from the rides
+
+    The default matches Series.median(); interpolation='lower' picks the
+    ride at the same rank the sketch reads, for checking the error bound.
+    """
+    grouped = df.groupby(by, observed=True)[value]
+    return pd.DataFrame({_quantile_name(q): grouped.quantile(q, interpolation=interpolation)
+                         for q in quantiles})
+
+
+def max_relative_error(estimated, exact):
+    """Largest relative difference between two quantile tables"""
+    estimated, exact = estimated.align(exact, join='inner')
+    return float(((estimated - exact).abs() / exact.abs()).max().max())
@@ -0,0 +1,161 @@
+"""Geohash grid, origin-destination flows and straight-line distances
+
+Coordinates are binned into geohash cells, computed as integers: the
+latitude and longitude are quantized and their bits interleaved (longitude
+first), so cell c at precision p is the base-32 geohash of p characters.
+Precision 6 cells are about 1.2 km x 0.6 km in Chicago.
+
+build_od() counts one chunk of rides per (member_casual, season, hour,
+origin cell, destination cell); only observed pairs are kept, so the table
+is a sparse OD matrix. OD tables merge by adding counts and are kept sorted
+by origin, so flows_from() finds the rows leaving a cell with a binary
+search instead of a scan.
+
+haversine_km() gives the great-circle distance between start and end
+points, in float32, for whole columns at once.
+"""
+import numpy as np
+import pandas as pd
+
+from cyclistic.schema import compact, concat_frames
+
+GEOHASH_PRECISION = 6
+GEOHASH_ALPHABET = np.frombuffer(b'0123456789bcdefghjkmnpqrstuvwxyz', dtype=np.uint8)
+_GEOHASH_VALUES = np.full(256, 255, dtype=np.uint8)
+_GEOHASH_VALUES[GEOHASH_ALPHABET] = np.arange(32)
+
+OD_KEYS = ['member_casual', 'season', 'hour', 'origin', 'destination']
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _bit_split(precision):
+    bits = 5 * precision
+    return (bits + 1) // 2, bits // 2  # longitude bits, latitude bits
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km as float32 (NaN where a coordinate is missing)"""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(values, dtype=np.float32))
+                              for values in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return (2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))).astype(np.float32)
+
+
+def geohash_cells(lat, lng, precision=GEOHASH_PRECISION):
+    """Integer geohash cell of each coordinate (-1 where lat or lng is missing)"""
+    lat = np.asarray(lat, dtype='float64')
+    lng = np.asarray(lng, dtype='float64')
+    lng_bits, lat_bits = _bit_split(precision)
+    valid = ~(np.isnan(lat) | np.isnan(lng))
+    with np.errstate(invalid='ignore'):
+        lat_q = np.clip(np.floor((lat + 90) / 180 * 2**lat_bits), 0, 2**lat_bits - 1)
+        lng_q = np.clip(np.floor((lng + 180) / 360 * 2**lng_bits), 0, 2**lng_bits - 1)
+    lat_q = np.where(valid, lat_q, 0).astype(np.int64)
+    lng_q = np.where(valid, lng_q, 0).astype(np.int64)
+
+    cells = np.zeros(len(lat), dtype=np.int64)
+    for i in range(5 * precision):
+        # even bits (from the top) come from longitude, odd bits from latitude
+        if i % 2 == 0:
+            bit = (lng_q >> (lng_bits - 1 - i // 2)) & 1
+        else:
+            bit = (lat_q >> (lat_bits - 1 - i // 2)) & 1
+        cells = (cells << 1) | bit
+    return np.where(valid, cells, -1)
+
+
+def cell_centers(cells, precision=GEOHASH_PRECISION):
+    """(lat, lng) of the center of each cell"""
+    cells = np.asarray(cells, dtype=np.int64)
+    lng_bits, lat_bits = _bit_split(precision)
+    lat_q = np.zeros(len(cells), dtype=np.int64)
+    lng_q = np.zeros(len(cells), dtype=np.int64)
+    for i in range(5 * precision):
+        bit = (cells >> (5 * precision - 1 - i)) & 1
+        if i % 2 == 0:
+            lng_q = (lng_q << 1) | bit
+        else:
+            lat_q = (lat_q << 1) | bit
+    lat = (lat_q + 0.5) / 2**lat_bits * 180 - 90
+    lng = (lng_q + 0.5) / 2**lng_bits * 360 - 180
+    return lat, lng
+
+
+def geohash_strings(cells, precision=GEOHASH_PRECISION):
+    """Turn integer cells into geohash strings"""
+    cells = np.asarray(cells, dtype=np.int64)
+    shifts = np.arange(5 * (precision - 1), -5, -5, dtype=np.int64)
+    digits = GEOHASH_ALPHABET[(cells[:, None] >> shifts) & 31]
+    return digits.view(f'S{precision}').ravel().astype(str).astype(object)
+
+
+def parse_geohashes(strings, precision=GEOHASH_PRECISION):
+    """Turn geohash strings back into integer cells"""
+    raw = np.asarray(strings, dtype=str).astype(f'S{precision}')
+    values = _GEOHASH_VALUES[raw.view(np.uint8).reshape(-1, precision)].astype(np.int64)
+    cells = np.zeros(len(raw), dtype=np.int64)
+    for i in range(precision):
+        cells = (cells << 5) | values[:, i]
+    return cells
+
+
+def build_od(df, precision=GEOHASH_PRECISION):
+    """Count one chunk of rides per OD_KEYS (rides without both cells are skipped)"""
+    origin = geohash_cells(df['start_lat'], df['start_lng'], precision)
+    destination = geohash_cells(df['end_lat'], df['end_lng'], precision)
+    located = (origin >= 0) & (destination >= 0)
+    rides = pd.DataFrame({
+        'member_casual': df['member_casual'],
+        'season': df['season'],
+        'hour': df['hour'],
+        'origin': origin,
+        'destination': destination,
+    }).loc[located]
+    od = rides.groupby(OD_KEYS, observed=True).size().rename('rides').reset_index()
+    return sort_od(od)
+
+
+def merge_od(parts):
+    """Add up the flows of several OD tables"""
+    parts = [part for part in parts if part is not None]
+    combined = concat_frames(parts)
+    if len(parts) == 1:
+        return combined
+    return sort_od(combined.groupby(OD_KEYS, observed=True)['rides'].sum().reset_index())
+
+
+def sort_od(od):
+    """Order an OD table by origin cell, as flows_from() expects"""
+    return od.sort_values(['origin', 'destination'] + OD_KEYS[:3], kind='stable').reset_index(drop=True)
+
+
+def flows_from(od, cell, by=('member_casual',)):
+    """Rides leaving `cell`, per destination and `by` keys, busiest first"""
+    origins = od['origin'].to_numpy()
+    start, stop = np.searchsorted(origins, [cell, cell + 1])
+    flows = od.iloc[start:stop].groupby(list(by) + ['destination'], observed=True)['rides'].sum()
+    return flows[flows > 0].sort_values(ascending=False, kind='stable')
+
+
+def top_flows(od, by=('member_casual',), n=10):
+    """The n busiest (origin, destination) pairs per `by` group"""
+    by = list(by)
+    flows = od.groupby(by + ['origin', 'destination'], observed=True)['rides'].sum()
+    flows = flows[flows > 0].reset_index().sort_values(by + ['rides'], ascending=[True] * len(by) + [False],
+                                                      kind='stable')
+    return flows.groupby(by, observed=True).head(n).reset_index(drop=True)
+
+
+def read_od(path, precision=GEOHASH_PRECISION):
+    """Read an OD table saved with geohash strings, back to integer cells"""
+    od = pd.read_csv(path, dtype={'origin': str, 'destination': str})
+    od['origin'] = parse_geohashes(od['origin'], precision)
+    od['destination'] = parse_geohashes(od['destination'], precision)
+    return compact(od)
+
+
+def write_od(od, path, precision=GEOHASH_PRECISION):
+    """Save an OD table with the cells written as geohash strings"""
+    od.assign(origin=geohash_strings(od['origin'], precision),
+              destination=geohash_strings(od['destination'], precision)).to_csv(path, index=False)
@@ -0,0 +1,236 @@
+"""Station dimension table
+
+Rides name their start and end stations with an id, a name and a lat/lng
+pair. station_counts() reduces a chunk of rides to one row per (role,
+station, member_casual) with ride counts and coordinate sums; these merge
+across chunks and months. station_dimension() turns the merged counts into
+one row per (station_id, station_name) with an integer station_key, a
+canonical coordinate (the mean of the coordinates seen for it) and its
+start/end counts by user type.
+
+Keys are handed out before cleaning: find_station_keys() reads the station
+id and name columns of every month (from the parse cache when it is fresh)
+and numbers the stations in order of the first month that names them, so
+keys stay the same when later months are appended. clean_month() then
+writes start_station_key and end_station_key (int32, -1 where there is no
+station name) into the cleaned rows with add_station_keys(), and the
+partitioned dataset keeps only the keys, not the id and name strings.
+"""
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cyclistic.cache import DEFAULT_CACHE_DIR, iter_source_columns
+from cyclistic.ingest import month_label
+from cyclistic.schema import MEMBER_CASUAL, concat_frames
+
+STATION_COLUMNS = {
+    'start': {'id': 'start_station_id', 'name': 'start_station_name',
+              'lat': 'start_lat', 'lng': 'start_lng'},
+    'end': {'id': 'end_station_id', 'name': 'end_station_name',
+            'lat': 'end_lat', 'lng': 'end_lng'},
+}
+
+STATION_TEXT_COLUMNS = [columns[part] for columns in STATION_COLUMNS.values() for part in ('id', 'name')]
+STATION_KEY_COLUMNS = [f'{role}_station_key' for role in STATION_COLUMNS]
+
+COUNT_KEYS = ['role', 'station_id', 'station_name', 'member_casual']
+
+
+def month_station_pairs(path, cache_dir=DEFAULT_CACHE_DIR, chunksize=1_000_000, dtypes=None, date_columns=()):
+    """Distinct (station_id, station_name) pairs named by one month file, as start or end station"""
+    pairs = []
+    for chunk in iter_source_columns(path, STATION_TEXT_COLUMNS, chunksize, cache_dir, dtypes, date_columns):
+        for columns in STATION_COLUMNS.values():
+            names = chunk[columns['name']]
+            present = names.notna().to_numpy()
+            pairs.append(pd.DataFrame({
+                # A missing id is kept as '', as in station_counts()
+                'station_id': chunk[columns['id']].astype(object).fillna('').astype(str),
+                'station_name': names.astype(object),
+            }).loc[present].drop_duplicates())
+    if not pairs:
+        return pd.DataFrame({'station_id': [], 'station_name': []}, dtype=object)
+    return pd.concat(pairs, ignore_index=True).drop_duplicates(ignore_index=True)
+
+
+def find_station_keys(paths, cache_dir=DEFAULT_CACHE_DIR, chunksize=1_000_000, dtypes=None, date_columns=(),
+                      workers=1):
+    """Integer keys for every station named in `paths` (in month order)
+
+    Returns a table of station_key, station_id, station_name and
+    first_month (the label of the first month naming the station). Keys
+    follow first_month, then id and name. Months are read `workers` at a time.
+    """
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+            futures = [pool.submit(month_station_pairs, path, cache_dir, chunksize, dtypes, date_columns)
+                       for path in paths]
+            pairs = [future.result() for future in futures]
+    else:
+        pairs = [month_station_pairs(path, cache_dir, chunksize, dtypes, date_columns) for path in paths]
+    keys = pd.concat([month_pairs.assign(first_month=month_label(path))
+                      for path, month_pairs in zip(paths, pairs)], ignore_index=True)
+    keys = keys.sort_values(['first_month', 'station_id', 'station_name'], kind='stable')
+    keys = keys.drop_duplicates(['station_id', 'station_name']).reset_index(drop=True)
+    keys.insert(0, 'station_key', np.arange(len(keys), dtype=np.int32))
+    return keys
+
+
+def station_keys_key(keys, label):
+    """Digest of the keys of the stations first named up to month `label`
+
+    The keys of a month's stations only change when this does.
+    """
+    if keys is None:
+        return None
+    known = keys[keys['first_month'] <= label]
+    return hashlib.sha256(pd.util.hash_pandas_object(known, index=False).to_numpy().tobytes()).hexdigest()
+
+
+def station_counts(df, month=None):
+    """Count one chunk of rides per station, role (start/end) and user type"""
+    frames = []
+    for role, columns in STATION_COLUMNS.items():
+        names = df[columns['name']]
+        present = names.notna().to_numpy()
+        rides = pd.DataFrame({
+            # A missing id is kept as '' so the station still has a name-only row
+            'station_id': df[columns['id']].astype(object).fillna(''),
+            'station_name': names,
+            'member_casual': df['member_casual'],
+            'lat': df[columns['lat']].astype('float64'),
+            'lng': df[columns['lng']].astype('float64'),
+        }).loc[present]
+        counts = rides.groupby(['station_id', 'station_name', 'member_casual'], observed=True).agg(
+            rides=('lat', 'size'),
+            coords=('lat', 'count'),
+            lat_sum=('lat', 'sum'),
+            lng_sum=('lng', 'sum'),
+        ).reset_index()
+        counts.insert(0, 'role', role)
+        frames.append(counts.astype({'station_id': 'category', 'station_name': 'category'}))
+    counts = concat_frames(frames)
+    counts['first_month'] = month
+    return counts
+
+
+def merge_station_counts(counts):
+    """Combine the station counts of several chunks or months"""
+    counts = concat_frames(part for part in counts if part is not None)
+    return counts.groupby(COUNT_KEYS, observed=True).agg(
+        rides=('rides', 'sum'),
+        coords=('coords', 'sum'),
+        lat_sum=('lat_sum', 'sum'),
+        lng_sum=('lng_sum', 'sum'),
+        first_month=('first_month', 'min'),
+    ).reset_index()
+
+
+def station_dimension(counts, keys):
+    """One row per station with clean rides: its key, canonical coordinate and ride counts
+
+    Keys are looked up in the find_station_keys() table `keys`.
+    """
+    stations = counts.groupby(['station_id', 'station_name'], observed=True).agg(
+        first_month=('first_month', 'min'),
+        coords=('coords', 'sum'),
+        lat_sum=('lat_sum', 'sum'),
+        lng_sum=('lng_sum', 'sum'),
+    )
+    coords = stations['coords'].where(stations['coords'] > 0)
+    stations['lat'] = (stations['lat_sum'] / coords).astype('float32')
+    stations['lng'] = (stations['lng_sum'] / coords).astype('float32')
+
+    rides = counts.pivot_table(index=['station_id', 'station_name'],
+                               columns=['role', 'member_casual'], values='rides',
+                               aggfunc='sum', fill_value=0, observed=True)
+    for role in STATION_COLUMNS:
+        for user_type in MEMBER_CASUAL:
+            column = (role, user_type)
+            stations[f'{role}s_{user_type}'] = (rides[column] if column in rides.columns else 0)
+    stations = stations.fillna({column: 0 for column in stations.columns
+                                if column.startswith(('starts_', 'ends_'))})
+
+    stations = stations.reset_index()
+    stations['station_id'] = stations['station_id'].astype(str)
+    stations['station_name'] = stations['station_name'].astype(str)
+    stations.insert(0, 'station_key', station_keys(stations['station_id'], stations['station_name'], keys))
+    stations = stations.sort_values('station_key').drop(columns=['coords', 'lat_sum', 'lng_sum'])
+    count_columns = [column for column in stations.columns if column.startswith(('starts_', 'ends_'))]
+    stations[count_columns] = stations[count_columns].astype('int64')
+    return stations.reset_index(drop=True)
+
+
+def read_station_dimension(path):
+    """Read a station dimension saved with to_csv"""
+    stations = pd.read_csv(path, dtype={'station_id': str, 'station_name': str})
+    stations['station_id'] = stations['station_id'].fillna('')
+    return stations.astype({'station_key': 'int32', 'lat': 'float32', 'lng': 'float32'})
+
+
+def station_keys(ids, names, stations):
+    """Map ride station ids and names to station keys (int32, -1 if unknown)
+
+    Each distinct (id, name) pair is looked up once.
+    """
+    ids = pd.Categorical(pd.Series(ids).astype(object).fillna(''))
+    names = pd.Categorical(names)
+    n_names = len(names.categories) + 1
+    pairs = (ids.codes.astype(np.int64) + 1) * n_names + (names.codes.astype(np.int64) + 1)
+    unique_pairs, inverse = np.unique(pairs, return_inverse=True)
+
+    id_codes = unique_pairs // n_names - 1
+    name_codes = unique_pairs % n_names - 1
+    pair_ids = np.asarray(ids.categories, dtype=object).take(np.maximum(id_codes, 0))
+    pair_names = np.where(name_codes >= 0,
+                          np.asarray(names.categories, dtype=object).take(np.maximum(name_codes, 0)),
+                          '')
+    index = pd.MultiIndex.from_arrays([stations['station_id'], stations['station_name']])
+    found = index.get_indexer(pd.MultiIndex.from_arrays([pair_ids, pair_names]))
+    keys = np.where(found >= 0, stations['station_key'].to_numpy().take(np.maximum(found, 0)), -1)
+    return keys.astype(np.int32)[inverse]
+
+
+def add_station_keys(rides, keys):
+    """Insert start_station_key and end_station_key after the station id columns"""
+    for role, columns in STATION_COLUMNS.items():
+        rides.insert(rides.columns.get_loc(columns['id']) + 1, f'{role}_station_key',
+                     station_keys(rides[columns['id']], rides[columns['name']], keys))
+    return rides
+
+
+def top_stations(counts, stations, n=10):
+    """The n busiest stations per user type
+
+    counts is a Series of rides indexed by (member_casual, station_key).
+    """
+    counts = counts[counts > 0].rename('rides').reset_index()
+    counts = counts.sort_values(['member_casual', 'rides', 'station_key'],
+                                ascending=[True, False, True], kind='stable')
+    top = counts.groupby('member_casual', observed=True).head(n)
+    top = top.merge(stations[['station_key', 'station_name', 'lat', 'lng']], on='station_key', how='left')
+    top.insert(1, 'rank', top.groupby('member_casual', observed=True).cumcount() + 1)
+    return top.reset_index(drop=True)
+
+
+def start_counts_from_rides(rides):
+    """Start counts per (member_casual, station_key) of rides with a start_station_key"""
+    counts = rides[rides['start_station_key'] >= 0].groupby(
+        ['member_casual', 'start_station_key'], observed=True).size()
+    counts.index.names = ['member_casual', 'station_key']
+    return counts
+
+
+def merge_start_counts(counts):
+    """Add up the start counts of several chunks"""
+    return pd.concat([part for part in counts if part is not None]).groupby(level=['member_casual', 'station_key'], observed=True).sum()
+
+
+def start_counts_from_dimension(stations):
+    """Start counts per (member_casual, station_key), read off the dimension"""
+    counts = stations.set_index('station_key')[[f'starts_{user_type}' for user_type in MEMBER_CASUAL]]
+    counts.columns = pd.Index(MEMBER_CASUAL, name='member_casual')
+    return counts.stack().swaplevel().sort_index()
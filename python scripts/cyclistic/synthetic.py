@@ -0,0 +1,296 @@
+"""Synthetic monthly trip files in the Divvy export layout
+
+write_synthetic_year() writes one `YYYY_MM_cyclistic.csv` per month with the
+same 15 columns as the real exports, so both scripts can be run (and
+benchmarked) at any size without the production files. The distributions
+are set from the 2025 notebook outputs:
+
+- 64% member rides; electric bikes 65% of casual and 63% of member rides
+- casual rides peak in summer and on weekends, members ride all year with
+  weekday commute peaks at 8:00 and 17:00
+- log-normal ride lengths with the means/medians seen per user and bike type
+  (casual classic rides longest), longer on weekends
+- about 20% of rides (all electric) without a start or end station; their
+  coordinates are rounded to 2 decimals as in the exports
+- the invalid rows the cleaning removes: rides under a minute (~2.6%),
+  over a day (~0.1%), missing ride_length and missing end coordinates
+- the two timestamp layouts of the exports, `1/21/2025  5:23:55 PM` and
+  ISO with milliseconds, one per month
+
+Rows are generated and appended in blocks, so memory use does not grow with
+the number of rows. The same seed always gives the same files.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cyclistic.spatial import haversine_km
+
+RAW_COLUMNS = ['ride_id', 'rideable_type', 'started_at', 'ended_at',
+               'start_station_name', 'start_station_id', 'end_station_name', 'end_station_id',
+               'start_lat', 'start_lng', 'end_lat', 'end_lng',
+               'member_casual', 'ride_length', 'day_of_week']
+
+MEMBER_SHARE = 0.64
+ELECTRIC_SHARE = {'casual': 0.651, 'member': 0.634}
+
+# Relative rides per month (January first); casual usage triples in summer
+MONTH_WEIGHTS = {
+    'casual': [0.05, 0.07, 0.16, 0.25, 0.55, 0.85, 0.95, 1.00, 0.85, 0.50, 0.17, 0.07],
+    'member': [0.30, 0.38, 0.50, 0.62, 0.80, 0.90, 0.95, 1.00, 0.98, 0.80, 0.50, 0.30],
+}
+
+# Share of each user type's rides per weekday, Sunday first
+DAY_WEIGHTS = {
+    'casual': [16.5, 11.4, 11.3, 11.1, 12.9, 16.0, 20.6],
+    'member': [10.7, 14.2, 15.9, 15.5, 16.2, 14.9, 12.6],
+}
+
+# Relative rides per start hour
+HOUR_WEIGHTS = {
+    ('member', False): [0.3, 0.15, 0.1, 0.08, 0.15, 0.6, 2.2, 4.5, 6.0, 3.8, 3.0, 3.5,
+                        4.2, 4.2, 4.3, 5.5, 7.8, 9.5, 7.0, 5.0, 3.6, 2.7, 1.8, 0.9],
+    ('casual', False): [0.8, 0.5, 0.3, 0.15, 0.15, 0.3, 0.9, 1.8, 2.4, 2.2, 2.6, 3.4,
+                        4.3, 4.5, 4.8, 5.6, 7.2, 8.4, 7.4, 5.8, 4.4, 3.6, 2.8, 1.6],
+    ('member', True): [1.2, 0.9, 0.6, 0.3, 0.2, 0.3, 0.7, 1.4, 2.6, 3.9, 5.0, 5.8,
+                       6.2, 6.3, 6.3, 6.2, 6.0, 5.6, 4.8, 3.9, 3.0, 2.4, 1.9, 1.3],
+    ('casual', True): [1.6, 1.2, 0.8, 0.4, 0.25, 0.3, 0.6, 1.2, 2.4, 3.8, 5.2, 6.3,
+                       6.8, 7.0, 7.0, 6.9, 6.6, 6.0, 5.2, 4.2, 3.3, 2.6, 2.1, 1.5],
+}
+
+# Log-normal ride length: median minutes per (user type, bike type), sigma per user type
+MEDIAN_MINUTES = {('casual', 'classic_bike'): 16.5, ('casual', 'electric_bike'): 9.0,
+                  ('member', 'classic_bike'): 9.9, ('member', 'electric_bike'): 8.2}
+SIGMA = {'casual': 1.0, 'member': 0.8}
+WEEKEND_FACTOR = {'casual': 1.2, 'member': 1.1}
+
+# Typical riding speed; a ride ends 25-90% of the distance it could cover
+# in a straight line away from its start (or back at it, for round trips)
+SPEED_KMH = {'classic_bike': 11.0, 'electric_bike': 15.0}
+ROUND_TRIP_RATE = {'casual': 0.05, 'member': 0.01}
+
+# Share of rides without a start (or end) station, by bike type
+NO_STATION_RATE = {'classic_bike': 0.0, 'electric_bike': 0.32}
+
+# Rows the cleaning should remove or flag, as a share of all rows
+INVALID_RATES = {
+    'too_short': 0.021,              # 0-59 s, on top of the short rides of the log-normal
+    'too_long': 0.001,               # 24-26 h
+    'missing_ride_length': 5e-6,
+    'missing_end_coords': 3e-5,
+    'member_casual_variant': 0.0,    # ' Member', 'CASUAL ' (none seen in 2025)
+}
+
+# Timestamp layout per month (1-12)
+TIMESTAMP_STYLE_BY_MONTH = {month: 'iso' if month % 3 == 0 else 'excel' for month in range(1, 13)}
+
+N_STATIONS = 1800
+NEIGHBORS = 128
+DEFAULT_BLOCK_ROWS = 500_000
+
+_HEX = np.frombuffer(b'0123456789ABCDEF', dtype=np.uint8)
+_STREETS_NS = ['State St', 'Clark St', 'Wells St', 'LaSalle St', 'Dearborn St', 'Wabash Ave',
+               'Michigan Ave', 'Halsted St', 'Racine Ave', 'Ashland Ave', 'Damen Ave', 'Western Ave',
+               'California Ave', 'Kedzie Ave', 'Pulaski Rd', 'Cicero Ave', 'Lake Shore Dr', 'Sheridan Rd',
+               'Broadway', 'Clybourn Ave', 'Milwaukee Ave', 'Elston Ave', 'Lincoln Ave', 'Wolcott Ave',
+               'Paulina St', 'Wood St', 'Hoyne Ave', 'Leavitt St', 'Oakley Blvd', 'Sacramento Blvd']
+_STREETS_EW = ['Madison St', 'Monroe St', 'Adams St', 'Jackson Blvd', 'Van Buren St', 'Harrison St',
+               'Roosevelt Rd', 'Cermak Rd', 'Grand Ave', 'Ohio St', 'Chicago Ave', 'Division St',
+               'North Ave', 'Armitage Ave', 'Fullerton Ave', 'Diversey Pkwy', 'Belmont Ave',
+               'Addison St', 'Irving Park Rd', 'Montrose Ave', 'Lawrence Ave', 'Foster Ave',
+               'Bryn Mawr Ave', 'Devon Ave', 'Touhy Ave', '18th St', '31st St', '35th St',
+               '47th St', '55th St', '63rd St', '71st St', '79th St', '87th St', '95th St']
+
+
+def make_stations(rng, n=N_STATIONS):
+    """Station table (id, name, lat, lng, popularity) spread over Chicago"""
+    downtown = rng.random(n) < 0.6
+    lat = np.where(downtown, rng.normal(41.89, 0.035, n), rng.uniform(41.65, 42.07, n))
+    lng = np.where(downtown, rng.normal(-87.64, 0.025, n), rng.uniform(-87.80, -87.53, n))
+    names = pd.MultiIndex.from_product([_STREETS_NS, _STREETS_EW]).map(' & '.join).to_numpy()
+    names = rng.permutation(np.concatenate([names, 'Public Rack - ' + names]))[:n]
+    numbers = rng.permutation(np.arange(1000, 99999))[:n]
+    prefixes = np.array(['', 'TA13070000', 'KA15030000', 'SL-0', 'LF-00'])[rng.integers(0, 5, n)]
+    ids = np.char.add(prefixes, numbers.astype(str)).astype(object)
+    popularity = rng.zipf(1.6, n).clip(max=200).astype('float64')
+    return pd.DataFrame({'station_id': ids, 'station_name': names.astype(object),
+                         'lat': np.clip(lat, 41.64, 42.08), 'lng': np.clip(lng, -87.85, -87.52),
+                         'weight': popularity / popularity.sum()})
+
+
+def station_neighbors(stations, k=NEIGHBORS):
+    """The k nearest stations of each station (itself first) and their distances in km"""
+    lat, lng = stations['lat'].to_numpy(), stations['lng'].to_numpy()
+    distances = haversine_km(lat[:, None], lng[:, None], lat[None, :], lng[None, :])
+    nearest = np.argsort(distances, axis=1, kind='stable')[:, :k]
+    return nearest, np.take_along_axis(distances, nearest, axis=1).astype('float64')
+
+
+def month_row_counts(total_rows):
+    """Rides per month (January first) and the member share of each month"""
+    shares = {user: np.array(weights) / sum(weights) for user, weights in MONTH_WEIGHTS.items()}
+    member = MEMBER_SHARE * shares['member']
+    month_share = member + (1 - MEMBER_SHARE) * shares['casual']
+    exact = total_rows * month_share
+    counts = np.floor(exact).astype(np.int64)
+    # Hand the rounding remainder to the months with the largest fractions
+    counts[np.argsort(counts - exact)[:total_rows - counts.sum()]] += 1
+    return counts, member / month_share
+
+
+def _choice(rng, weights, n):
+    cdf = np.cumsum(weights, dtype='float64')
+    return np.searchsorted(cdf / cdf[-1], rng.random(n), side='right')
+
+
+def _hex_ids(rng, n):
+    values = rng.integers(0, 2**63, n, dtype=np.int64).astype('>u8').view(np.uint8).reshape(n, 8)
+    digits = np.empty((n, 16), dtype=np.uint8)
+    digits[:, 0::2] = _HEX[values >> 4]
+    digits[:, 1::2] = _HEX[values & 15]
+    return digits.view('S16').ravel().astype(str).astype(object)
+
+
+def _time_tables(year, month, n_days, style):
+    """Date strings (for day offsets from the 1st) and time-of-day strings for one layout"""
+    days = pd.date_range(pd.Timestamp(year, month, 1), periods=n_days + 3, freq='D')
+    seconds = pd.to_datetime(np.arange(86400), unit='s')
+    if style == 'excel':
+        dates = np.array([f'{d.month}/{d.day}/{d.year}' for d in days], dtype=object)
+        hours12 = (seconds.hour + 11) % 12 + 1
+        times = np.array([f' {h:>2}:{m:02d}:{s:02d} {"AM" if H < 12 else "PM"}' for h, m, s, H
+                          in zip(hours12, seconds.minute, seconds.second, seconds.hour)], dtype=object)
+    else:
+        dates = days.strftime('%Y-%m-%d').to_numpy(dtype=object)
+        times = seconds.strftime(' %H:%M:%S').to_numpy(dtype=object)
+    return dates, times
+
+
+def _ride_length_table(max_seconds):
+    seconds = np.arange(max_seconds + 1)
+    return np.array([f'{s // 3600}:{s % 3600 // 60:02d}:{s % 60:02d}' for s in seconds], dtype=object)
+
+
+def generate_rides(n, year, month, member_share, stations, neighbors, rng, style='excel'):
+    """n synthetic raw rides starting in one month, in the export column layout"""
+    first_day = pd.Timestamp(year, month, 1)
+    n_days = first_day.days_in_month
+    is_member = rng.random(n) < member_share
+    users = np.where(is_member, 'member', 'casual')
+
+    # Start day, weighted by weekday per user type; then the hour
+    weekdays = (first_day.dayofweek + 1 + np.arange(n_days)) % 7  # 0 = Sunday
+    day = np.empty(n, dtype=np.int64)
+    for user, mask in (('member', is_member), ('casual', ~is_member)):
+        day[mask] = _choice(rng, np.array(DAY_WEIGHTS[user])[weekdays], mask.sum())
+    weekday = weekdays[day]
+    weekend = (weekday == 0) | (weekday == 6)
+    hour = np.empty(n, dtype=np.int64)
+    for (user, on_weekend), weights in HOUR_WEIGHTS.items():
+        mask = (users == user) & (weekend == on_weekend)
+        hour[mask] = _choice(rng, weights, mask.sum())
+    start = day * 86400 + hour * 3600 + rng.integers(0, 3600, n)
+
+    # Bike type and log-normal ride length
+    electric = rng.random(n) < np.where(is_member, ELECTRIC_SHARE['member'], ELECTRIC_SHARE['casual'])
+    bikes = np.where(electric, 'electric_bike', 'classic_bike')
+    median = np.empty(n)
+    for (user, bike), minutes in MEDIAN_MINUTES.items():
+        median[(users == user) & (bikes == bike)] = minutes
+    median *= np.where(weekend, np.where(is_member, WEEKEND_FACTOR['member'], WEEKEND_FACTOR['casual']), 1)
+    sigma = np.where(is_member, SIGMA['member'], SIGMA['casual'])
+    minutes = np.clip(median * np.exp(rng.normal(0, 1, n) * sigma), 1 / 60, 1439.9)
+    duration = np.round(minutes * 60).astype(np.int64)
+    too_short = rng.random(n) < INVALID_RATES['too_short']
+    duration[too_short] = rng.integers(0, 60, too_short.sum())
+    too_long = rng.random(n) < INVALID_RATES['too_long']
+    duration[too_long] = rng.integers(1441 * 60, 1575 * 60, too_long.sum())
+
+    # Start station by popularity; the end station is the neighbor closest to
+    # the distance the ride could cover (itself for round trips)
+    origin = _choice(rng, stations['weight'].to_numpy(), n)
+    nearest, distances = neighbors
+    speed = np.where(electric, SPEED_KMH['electric_bike'], SPEED_KMH['classic_bike'])
+    reach = speed * np.minimum(duration, 3 * 3600) / 3600 * rng.uniform(0.25, 0.9, n)
+    reach[rng.random(n) < np.where(is_member, ROUND_TRIP_RATE['member'], ROUND_TRIP_RATE['casual'])] = 0
+    k = distances.shape[1]
+    offset = distances[:, -1].max() + 1
+    flat = (distances + offset * np.arange(len(distances))[:, None]).ravel()
+    rank = np.searchsorted(flat, origin * offset + reach) - origin * k
+    destination = nearest[origin, np.clip(rank, 0, k - 1)]
+
+    lat, lng = stations['lat'].to_numpy(), stations['lng'].to_numpy()
+    rides = {}
+    for role, station in (('start', origin), ('end', destination)):
+        no_station = electric & (rng.random(n) < NO_STATION_RATE['electric_bike'])
+        # Electric bikes report their GPS position; without a station it is rounded
+        jitter = np.where(electric, 0.0003, 0.0)
+        station_lat = lat[station] + rng.normal(0, 1, n) * jitter
+        station_lng = lng[station] + rng.normal(0, 1, n) * jitter
+        rides[f'{role}_lat'] = np.where(no_station, np.round(station_lat + rng.normal(0, 0.004, n), 2), station_lat)
+        rides[f'{role}_lng'] = np.where(no_station, np.round(station_lng + rng.normal(0, 0.004, n), 2), station_lng)
+        rides[f'{role}_station_name'] = np.where(no_station, None, stations['station_name'].to_numpy()[station])
+        rides[f'{role}_station_id'] = np.where(no_station, None, stations['station_id'].to_numpy()[station])
+    lost = rng.random(n) < INVALID_RATES['missing_end_coords']
+    for column in ('end_lat', 'end_lng', 'end_station_name', 'end_station_id'):
+        rides[column] = np.where(lost, np.nan if column.endswith(('lat', 'lng')) else None, rides[column])
+
+    # Text columns in the export layout
+    dates, times = _time_tables(year, month, n_days, style)
+    end = start + duration
+    started_at = dates[start // 86400] + times[start % 86400]
+    ended_at = dates[end // 86400] + times[end % 86400]
+    if style == 'iso':
+        millis = np.array([f'.{ms:03d}' for ms in range(1000)], dtype=object)
+        started_at = started_at + millis[rng.integers(0, 1000, n)]
+        ended_at = ended_at + millis[rng.integers(0, 1000, n)]
+    ride_length = _ride_length_table(int(duration.max(initial=0)))[duration]
+    ride_length[rng.random(n) < INVALID_RATES['missing_ride_length']] = None
+    variant = rng.random(n) < INVALID_RATES['member_casual_variant']
+    users = users.astype(object)
+    users[variant] = np.where(is_member[variant], ' Member', 'CASUAL ')
+
+    rides.update({
+        'ride_id': _hex_ids(rng, n),
+        'rideable_type': bikes,
+        'started_at': started_at,
+        'ended_at': ended_at,
+        'member_casual': users,
+        'ride_length': ride_length,
+        'day_of_week': weekday + 1,
+    })
+    return pd.DataFrame(rides)[RAW_COLUMNS]
+
+
+def write_synthetic_month(folder, year, month, count, member_share, seed=0,
+                          block_rows=DEFAULT_BLOCK_ROWS):
+    """Write `count` synthetic rides of one month; returns the file path"""
+    stations = make_stations(np.random.default_rng(seed))
+    neighbors = station_neighbors(stations)
+    # Each month has its own random stream, so months can be written in any order
+    rng = np.random.default_rng([seed, year, month])
+    style = TIMESTAMP_STYLE_BY_MONTH[month]
+    path = os.path.join(folder, f'{year}_{month:02d}_cyclistic.csv')
+    for first in range(0, max(count, 1), block_rows):
+        n = int(min(block_rows, count - first))
+        rides = generate_rides(n, year, month, member_share, stations, neighbors, rng, style)
+        rides.to_csv(path, mode='w' if first == 0 else 'a', header=first == 0, index=False)
+    return path
+
+
+def write_synthetic_year(folder, total_rows, year=2025, seed=0, block_rows=DEFAULT_BLOCK_ROWS, workers=1):
+    """Write `total_rows` synthetic rides as twelve monthly CSV files in `folder`
+
+    Months are written `workers` at a time in separate processes. Returns
+    the file paths.
+    """
+    os.makedirs(folder, exist_ok=True)
+    counts, member_shares = month_row_counts(total_rows)
+    jobs = [(folder, year, month, int(count), member_share, seed, block_rows)
+            for month, (count, member_share) in enumerate(zip(counts, member_shares), start=1)]
+    if workers <= 1:
+        return [write_synthetic_month(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(write_synthetic_month, *zip(*jobs)))
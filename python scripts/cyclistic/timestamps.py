@@ -0,0 +1,71 @@
+"""Explicit-format parsing of started_at / ended_at
+
+Divvy exports use one timestamp layout per file (ISO in some months,
+`1/21/2025 17:23` in others). detect_format() finds that layout once from a
+sample, and parse_timestamps() parses every distinct string with it in one
+vectorized call. Only strings that do not match the format go through the
+slow per-value parser, and their number is returned so it can be reported.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype
+
+# Layouts seen in the monthly exports and the cleaned files, most common first
+TIMESTAMP_FORMATS = [
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%dT%H:%M:%S',
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %I:%M:%S %p',
+    '%m/%d/%y %H:%M',
+    '%Y-%m-%d',
+]
+
+DETECT_SAMPLE_SIZE = 1000
+
+
+def detect_format(values, formats=TIMESTAMP_FORMATS, sample_size=DETECT_SAMPLE_SIZE):
+    """Return the format that parses most of a sample of values, or None"""
+    sample = pd.Series(values).dropna().astype(str).head(sample_size)
+    if sample.empty:
+        return None
+    best, best_parsed = None, 0
+    for fmt in formats:
+        parsed = int(pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum())
+        if parsed > best_parsed:
+            best, best_parsed = fmt, parsed
+    return best
+
+
+def parse_timestamps(values, fmt=None):
+    """Parse timestamp strings, using one explicit format for the whole column
+
+    fmt is detected from the values when not given. Returns (datetime64
+    Series, format used, number of rows that needed the slow fallback).
+    Rows that no parser understands become NaT.
+    """
+    values = pd.Series(values)
+    if is_datetime64_any_dtype(values):
+        return values, None, 0
+    if fmt is None:
+        fmt = detect_format(values)
+
+    # Each distinct string is parsed once; codes map them back to the rows
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(np.asarray(uniques, dtype=object))
+    if fmt is None:
+        parsed = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[ns]')
+    else:
+        parsed = pd.to_datetime(uniques, format=fmt, errors='coerce')
+
+    retry = parsed.isna().to_numpy()
+    fallback = 0
+    if retry.any():
+        parsed[retry] = pd.to_datetime(uniques[retry], errors='coerce')
+        fallback = int(np.isin(codes, np.flatnonzero(retry)).sum())
+
+    # code -1 (missing value) picks the NaT appended at the end
+    parsed = np.append(parsed.to_numpy(dtype='datetime64[ns]'), np.datetime64('NaT', 'ns'))
+    return pd.Series(parsed[codes], index=values.index, name=values.name), fmt, fallback
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""Serve ride counts, means and quantiles from the saved aggregates
+
+    python "python scripts/query_service.py" --dir data
+
+Loads 2025_cyclistic_cube.csv and 2025_cyclistic_sketch.csv (written by
+01_data_cleaning.py) from --dir once and answers HTTP GET requests on
+localhost; nothing is fetched from the network. Examples:
+
+    /query?measure=count&by=member_casual,month
+    /query?measure=mean&by=hour&member_casual=casual&season=Summer
+    /query?measure=quantile&q=0.5,0.9&by=rideable_type&month=July,August
+    /dimensions            values of every dimension
+    /stats                 cached queries, hits and misses
+
+Group-by and filter keys are member_casual, rideable_type, month, season,
+day_name and hour; filter values are comma-separated. Answers are JSON with
+the rows, whether they came from the in-memory cache, and the time taken.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPTS_DIR)
+
+from cyclistic.query import DEFAULT_CACHE_SIZE, DIMENSIONS, open_service, query_records
+
+CUBE_FILE = '2025_cyclistic_cube.csv'
+SKETCH_FILE = '2025_cyclistic_sketch.csv'
+DEFAULT_PORT = 8765
+
+
+def parse_query(params):
+    """measure, by, where and quantiles from the query-string parameters"""
+    def values(name):
+        return [value for text in params.get(name, []) for value in text.split(',') if value]
+
+    where = {key: values(key) for key in DIMENSIONS if key in params}
+    unknown = set(params) - set(DIMENSIONS) - {'measure', 'by', 'q'}
+    if unknown:
+        raise ValueError(f"Unknown parameter(s) {sorted(unknown)}")
+    return {'measure': params.get('measure', ['count'])[0], 'by': values('by'), 'where': where,
+            'quantiles': [float(q) for q in values('q')] or [0.5]}
+
+
+def dimension_values(service):
+    """The values each dimension takes in the cube, in category order"""
+    cube = service['cube']
+    return {key: sorted(int(hour) for hour in cube[key].unique()) if key == 'hour'
+            else [str(value) for value in cube[key].cat.remove_unused_categories().cat.categories]
+            for key in DIMENSIONS}
+
+
+def make_handler(service):
+    """Request handler class bound to a loaded service"""
+    class QueryHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            try:
+                if url.path == '/query':
+                    self.send_json(200, query_records(service, **parse_query(parse_qs(url.query))))
+                elif url.path == '/dimensions':
+                    self.send_json(200, dimension_values(service))
+                elif url.path == '/stats':
+                    self.send_json(200, {key: service[key] for key in ('hits', 'misses', 'cache_size')}
+                                   | {'cached_queries': len(service['cache'])})
+                else:
+                    self.send_json(404, {'error': f"Unknown path {url.path}; use /query, /dimensions or /stats"})
+            except ValueError as error:
+                self.send_json(400, {'error': str(error)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return QueryHandler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--dir', default='.', help="folder with the cleaning outputs (default .)")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"port (default {DEFAULT_PORT})")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help=f"query results kept in memory (default {DEFAULT_CACHE_SIZE})")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    service = open_service(os.path.join(args.dir, CUBE_FILE), os.path.join(args.dir, SKETCH_FILE),
+                           args.cache_size)
+    print(f"Loaded {len(service['cube']):,} cube cells and {len(service['sketch']):,} sketch bins "
+          f"in {time.perf_counter() - start:.2f}s")
+    server = HTTPServer((args.host, args.port), make_handler(service))
+    print(f"Serving on http://{args.host}:{args.port}/query (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""Redraw the analysis charts from the saved aggregates
+
+    python "python scripts/render_charts.py" --dir data
+
+Reads 2025_cyclistic_cube.csv and 2025_cyclistic_sketch.csv (written by
+01_data_cleaning.py) from --dir and renders the charts of
+cyclistic/charts.py into --out, without reading a single ride. Charts whose
+tables, style and drawing code are unchanged since their PNG was written are
+skipped unless --force is given.
+"""
+import argparse
+import os
+import sys
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPTS_DIR)
+
+from cyclistic.charts import CHARTS, DEFAULT_DPI, DEFAULT_STYLE, chart_tables, render_charts
+from cyclistic.cube import read_cube
+from cyclistic.memo import DEFAULT_MEMO_DIR
+from cyclistic.sketch import read_sketch
+
+CUBE_FILE = '2025_cyclistic_cube.csv'
+SKETCH_FILE = '2025_cyclistic_sketch.csv'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--dir', default='.', help="folder with the cleaning outputs (default .)")
+    parser.add_argument('--out', default=None, help="folder for the PNGs (default --dir)")
+    parser.add_argument('--charts', default=None,
+                        help=f"comma-separated charts to draw (default all: {','.join(CHARTS)})")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="charts drawn at once (default one per core)")
+    parser.add_argument('--style', default=DEFAULT_STYLE, help=f"matplotlib style (default {DEFAULT_STYLE})")
+    parser.add_argument('--dpi', type=int, default=DEFAULT_DPI, help=f"resolution (default {DEFAULT_DPI})")
+    parser.add_argument('--force', action='store_true', help="redraw charts that are up to date")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    tables = chart_tables(read_cube(os.path.join(args.dir, CUBE_FILE)),
+                          read_sketch(os.path.join(args.dir, SKETCH_FILE)))
+    out = args.out or args.dir
+    os.makedirs(out, exist_ok=True)
+    charts = render_charts(tables, out, args.charts.split(',') if args.charts else None, args.workers,
+                           args.style, args.dpi, os.path.join(args.dir, DEFAULT_MEMO_DIR), args.force)
+    for name in charts['rendered']:
+        print(f"Rendered {os.path.join(out, CHARTS[name][0])}")
+    for name in charts['skipped']:
+        print(f"Up to date {os.path.join(out, CHARTS[name][0])}")
+    print(f"Done in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""render_charts() on small hand-made tables"""
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cyclistic.charts import CHARTS, render_charts
+
+
+def small_tables():
+    def table(index):
+        return pd.DataFrame({'casual': range(1, len(index) + 1), 'member': range(2, len(index) + 2)},
+                            index=pd.Index(index))
+
+    return {
+        'daily_rides': table(['Monday', 'Tuesday']),
+        'daily_duration': table(['Monday', 'Tuesday']),
+        'hourly_rides': table([7, 8, 17]),
+        'monthly_rides': table(['January', 'February']),
+        'weekend_rides': table(['Weekday', 'Weekend']),
+        'time_of_day_rides': table(['Morning', 'Evening']),
+        'season_rides': table(['Winter', 'Summer']),
+        'duration_rides': table(['0-15min', '16-30min']),
+        'bike_rides': table(['classic_bike', 'electric_bike']),
+    }
+
+
+def test_renders_into_empty_folder(tmp_path):
+    result = render_charts(small_tables(), folder=str(tmp_path), dpi=20)
+    assert result == {'rendered': list(CHARTS), 'skipped': []}
+    for file, _, _, _ in CHARTS.values():
+        assert os.path.exists(tmp_path / file)
+
+
+def test_skips_only_charts_memoized_with_their_png(tmp_path):
+    memo_dir = str(tmp_path / 'memo')
+    tables = small_tables()
+    assert render_charts(tables, folder=str(tmp_path), dpi=20, memo_dir=memo_dir)['skipped'] == []
+    assert render_charts(tables, folder=str(tmp_path), dpi=20, memo_dir=memo_dir)['skipped'] == list(CHARTS)
+    os.remove(tmp_path / CHARTS['insights'][0])
+    result = render_charts(tables, folder=str(tmp_path), dpi=20, memo_dir=memo_dir)
+    assert result['rendered'] == ['insights']
+    assert os.path.exists(tmp_path / CHARTS['insights'][0])
@@ -0,0 +1,77 @@
+"""Partition pruning in cyclistic.dataset"""
+import json
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cyclistic.dataset import (finish_month_partitions, read_dataset, select_partitions, start_month_partitions,
+                               write_partitions)
+from cyclistic.schema import compact
+
+
+def rides(n, start='2025-08-01', minutes=10.0, member_casual='member'):
+    return compact(pd.DataFrame({
+        'ride_id': [f'{i:016X}' for i in range(n)],
+        'started_at': pd.date_range(start, periods=n, freq='min'),
+        'ride_length_min': [minutes + i for i in range(n)],
+        'member_casual': [member_casual] * n,
+    }))
+
+
+def write_month(root, label, chunks, partition_by=()):
+    month = start_month_partitions(root, label, partition_by)
+    for chunk in chunks:
+        write_partitions(month, chunk)
+    finish_month_partitions(month)
+
+
+def test_prunes_months_and_user_types(tmp_path):
+    root = str(tmp_path)
+    write_month(root, '2025_07', [rides(5, '2025-07-01'), rides(5, '2025-07-02', member_casual='casual')],
+                ['member_casual'])
+    write_month(root, '2025_08', [rides(5, '2025-08-01', minutes=100)], ['member_casual'])
+
+    selected, total = select_partitions(root, [{'column': 'started_at', 'op': '>=', 'value': '2025-08-01'}])
+    assert total == 3
+    assert [(month['month'], partition['folder']) for month, partition in selected] == \
+        [('2025_08', 'member_casual=member')]
+
+    selected, _ = select_partitions(root, [{'column': 'member_casual', 'op': 'isin', 'value': ['casual']}])
+    assert [partition['folder'] for _, partition in selected] == ['member_casual=casual']
+
+    rows = read_dataset(root, ['ride_length_min'], [{'column': 'ride_length_min', 'op': '<', 'value': 12}])
+    assert sorted(rows['ride_length_min']) == [10, 10, 11, 11]
+
+
+def test_empty_chunk_keeps_bounds_and_rows(tmp_path):
+    root = str(tmp_path)
+    write_month(root, '2025_08', [rides(0), rides(200)])
+
+    with open(tmp_path / '2025_08' / 'month.json') as f:
+        partition, = json.load(f)['partitions']
+    assert partition['rows'] == 200 and partition['parts'] == 1
+    assert partition['ride_length_min'] == [10.0, 209.0]
+    assert partition['started_at'][0] == '2025-08-01 00:00:00'
+
+    selected, _ = select_partitions(root, [{'column': 'ride_length_min', 'op': '>=', 'value': 0}])
+    assert len(selected) == 1
+    assert len(read_dataset(root, filters=[{'column': 'ride_length_min', 'op': '>=', 'value': 0}])) == 200
+
+
+def test_missing_bounds_may_match(tmp_path):
+    root = str(tmp_path)
+    write_month(root, '2025_08', [rides(3)])
+    path = tmp_path / '2025_08' / 'month.json'
+    with open(path) as f:
+        meta = json.load(f)
+    meta['partitions'][0]['started_at'] = ['NaT', 'NaT']
+    del meta['partitions'][0]['ride_length_min']
+    with open(path, 'w') as f:
+        json.dump(meta, f)
+
+    filters = [{'column': 'started_at', 'op': '<', 'value': '2025-09-01'},
+               {'column': 'ride_length_min', 'op': '>=', 'value': 0}]
+    assert len(select_partitions(root, filters)[0]) == 1
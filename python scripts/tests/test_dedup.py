@@ -0,0 +1,56 @@
+"""Duplicate ride_ids across and within month files"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cyclistic.dedup import duplicate_rows, find_duplicates
+from cyclistic.schema import decode_ride_ids, encode_ride_ids
+
+
+def hex_ids(start, n):
+    return [f'{i:016X}' for i in range(start, start + n)]
+
+
+def write_months(folder):
+    months = {
+        # 3 ids of January come back in March, one twice; 0x101 is repeated within February
+        '2025_01': hex_ids(0, 100),
+        '2025_02': hex_ids(100, 50) + [f'{0x101:016X}'] * 2 + [None],
+        '2025_03': hex_ids(200, 50) + hex_ids(10, 3) + [f'{10:016X}', None, None],
+    }
+    paths = []
+    for label, ids in months.items():
+        path = os.path.join(folder, f'{label}_cyclistic.csv')
+        pd.DataFrame({'ride_id': ids, 'member_casual': 'member'}).to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+@pytest.mark.parametrize('use_bloom, workers', [(False, 1), (True, 1), (False, 2)])
+def test_finds_earlier_and_repeated_ids(tmp_path, use_bloom, workers):
+    paths = write_months(str(tmp_path))
+    duplicates, report = find_duplicates(paths, str(tmp_path / 'index'), str(tmp_path / 'cache'),
+                                         use_bloom=use_bloom, workers=workers)
+    assert sorted(duplicates) == ['2025_02', '2025_03']
+    assert list(decode_ride_ids(duplicates['2025_02']['repeated'])) == [f'{0x101:016X}']
+    assert list(decode_ride_ids(duplicates['2025_03']['drop'])) == hex_ids(10, 3)
+    report = report.set_index(decode_ride_ids(report['ride_id']))
+    assert report.loc[f'{10:016X}', ['month', 'first_month', 'rows_dropped']].tolist() == ['2025_03', '2025_01', 2]
+    assert report.loc[f'{0x101:016X}', ['first_month', 'rows_dropped']].tolist() == ['2025_02', 1]
+    assert report['rows_dropped'].sum() == 5
+
+
+def test_duplicate_rows_across_chunks_keeps_missing_ids(tmp_path):
+    paths = write_months(str(tmp_path))
+    duplicates, _ = find_duplicates(paths, str(tmp_path / 'index'), str(tmp_path / 'cache'))
+    ids = pd.read_csv(paths[1], dtype={'ride_id': str})['ride_id']
+    seen = {}
+    drop = np.concatenate([duplicate_rows(chunk, duplicates['2025_02'], seen) for chunk in (ids[:51], ids[51:])])
+    assert drop.tolist() == [False] * 51 + [True, False]
+    encoded = pd.Series(encode_ride_ids(ids.fillna('0')), dtype='uint64')
+    assert duplicate_rows(encoded, duplicates['2025_02'], {}).sum() == 1
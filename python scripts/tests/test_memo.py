@@ -0,0 +1,46 @@
+"""Memo keys built from code_version()"""
+import importlib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cyclistic.memo import code_version, memo_key, memoize
+
+
+def write_module(folder, name, source):
+    with open(os.path.join(folder, f'{name}.py'), 'w') as f:
+        f.write(source)
+
+
+def test_chart_only_edit_hits_the_memo(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    write_module(tmp_path, 'memo_tables', "def table():\n    return [1, 2, 3]\n")
+    write_module(tmp_path, 'memo_charts', "COLOR = 'red'\n")
+    import memo_charts
+    import memo_tables
+
+    def key():
+        return memo_key('inputs', code_version(memo_tables.table, memo_tables))
+
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return memo_tables.table()
+
+    memo_dir = str(tmp_path / 'memo')
+    first = key()
+    assert memoize(memo_dir, 'table', first, compute) == [1, 2, 3]
+
+    write_module(tmp_path, 'memo_charts', "COLOR = 'blue'\n")
+    importlib.reload(memo_charts)
+    assert key() == first
+    assert memoize(memo_dir, 'table', key(), compute) == [1, 2, 3]
+    assert len(calls) == 1
+
+    write_module(tmp_path, 'memo_tables', "def table():\n    return [1, 2, 3, 4]\n")
+    importlib.reload(memo_tables)
+    assert key() != first
+    assert memoize(memo_dir, 'table', key(), compute) == [1, 2, 3, 4]
+    assert len(calls) == 2
@@ -0,0 +1,68 @@
+"""clean_month() and clean_months() on small synthetic month files"""
+import filecmp
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cyclistic.cache import is_cached
+from cyclistic.cube import merge_cubes
+from cyclistic.dataset import read_months
+from cyclistic.dedup import find_duplicates
+from cyclistic.incremental import assemble_csv, partition_path
+from cyclistic.ingest import read_columns
+from cyclistic.pipeline import clean_month, clean_months
+from cyclistic.schema import DATE_COLUMNS, RAW_DTYPES
+from cyclistic.sketch import merge_sketches
+from cyclistic.spatial import merge_od
+from cyclistic.stations import find_station_keys, merge_station_counts
+from cyclistic.synthetic import write_synthetic_month
+
+
+def month_options(tmp_path, path):
+    return dict(chunksize=300, columns=read_columns(path), cache_dir=str(tmp_path / 'cache'), dtypes=RAW_DTYPES,
+                date_columns=DATE_COLUMNS)
+
+
+def test_header_only_month_cleans_from_the_cache(tmp_path):
+    path = write_synthetic_month(str(tmp_path), 2025, 4, 0, 0.6)
+    options = month_options(tmp_path, path)
+    for run in range(2):
+        outputs = {name: str(tmp_path / f'{name}-{run}.csv') for name in ('full', 'analysis', 'rejects')}
+        state = clean_month(path, outputs, **options)
+        assert state['stats'].get('rows_in', 0) == 0
+        assert state['cube'].empty
+        assert is_cached(path, options['cache_dir'], RAW_DTYPES, DATE_COLUMNS)
+
+
+def test_parallel_months_match_serial(tmp_path):
+    os.makedirs(tmp_path / 'months')
+    paths = [write_synthetic_month(str(tmp_path / 'months'), 2025, month, 900, 0.6, seed=1) for month in (1, 2, 3)]
+    options = month_options(tmp_path, paths[0])
+    duplicates, _ = find_duplicates(paths, str(tmp_path / 'index'), options['cache_dir'], dtypes=RAW_DTYPES,
+                                    date_columns=DATE_COLUMNS)
+    station_keys = find_station_keys(paths, options['cache_dir'], dtypes=RAW_DTYPES, date_columns=DATE_COLUMNS)
+    options.update(duplicates=duplicates, station_keys=station_keys)
+
+    outputs = {'full': str(tmp_path / 'full.csv'), 'analysis': str(tmp_path / 'analysis.csv'), 'rejects': None}
+    serial = [clean_month(path, outputs, dataset_dir=str(tmp_path / 'serial'), **options) for path in paths]
+    states = dict(clean_months(paths, 2, state_dir=str(tmp_path / 'state'), dataset_dir=str(tmp_path / 'parallel'),
+                               **options))
+    parallel = [states[path] for path in paths]
+
+    for name in ('full', 'analysis'):
+        assembled = str(tmp_path / f'parallel-{name}.csv')
+        assemble_csv([partition_path(state['folder'], name) for state in parallel], assembled,
+                     str(tmp_path / 'state'))
+        assert filecmp.cmp(outputs[name], assembled, shallow=False)
+    assert merge_cubes(state['cube'] for state in serial).equals(merge_cubes(state['cube'] for state in parallel))
+    assert merge_sketches(state['sketch'] for state in serial).equals(
+        merge_sketches(state['sketch'] for state in parallel))
+    assert merge_station_counts(state['stations'] for state in serial).equals(
+        merge_station_counts(state['stations'] for state in parallel))
+    assert merge_od(state['od'] for state in serial).equals(merge_od(state['od'] for state in parallel))
+    for state_serial, state_parallel in zip(serial, parallel):
+        for key in ('rows_in', 'rows_out'):
+            assert state_serial['stats'][key] == state_parallel['stats'][key]
+    assert [month['partitions'] for month in read_months(str(tmp_path / 'serial'))] == \
+        [month['partitions'] for month in read_months(str(tmp_path / 'parallel'))]
@@ -0,0 +1,66 @@
+"""run_query() edge cases on a small saved cube and sketch"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cyclistic.cube import build_cube, write_cube
+from cyclistic.query import open_service, run_query
+from cyclistic.schema import compact
+from cyclistic.sketch import build_sketch, write_sketch
+
+
+@pytest.fixture
+def service(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 2_000
+    rides = compact(pd.DataFrame({
+        'member_casual': rng.choice(['casual', 'member'], n),
+        'rideable_type': rng.choice(['classic_bike', 'electric_bike'], n),
+        'month': rng.choice(['July', 'August'], n),
+        'day_name': rng.choice(['Monday', 'Saturday'], n),
+        'hour': rng.integers(0, 24, n),
+        'ride_length_min': rng.lognormal(2.4, 0.6, n),
+    }))
+    write_cube(build_cube(rides), tmp_path / 'cube.csv')
+    write_sketch(build_sketch(rides), tmp_path / 'sketch.csv')
+    return open_service(tmp_path / 'cube.csv', tmp_path / 'sketch.csv')
+
+
+def test_where_matching_nothing_gives_no_rows(service):
+    for measure, by in [('quantile', []), ('quantile', ['member_casual']), ('mean', []), ('count', ['hour'])]:
+        table, _ = run_query(service, measure, by=by, where={'month': ['NotAMonth']})
+        assert table.empty
+    table, _ = run_query(service, 'quantile', where={'month': 'NotAMonth'}, quantiles=(0.5, 0.9))
+    assert list(table.columns) == ['median', 'p90']
+
+
+def test_overall_quantile_is_one_row(service):
+    table, _ = run_query(service, 'quantile', quantiles=(0.25, 0.5))
+    assert len(table) == 1 and table.loc[0, 'p25'] < table.loc[0, 'median']
+    summer, _ = run_query(service, 'quantile', where={'season': 'Summer'})
+    assert summer.loc[0, 'median'] == table.loc[0, 'median']
+
+
+def test_counts_add_up_and_repeat_from_cache(service):
+    total, cached = run_query(service, 'count')
+    assert total.loc[0, 'count'] == 2_000 and not cached
+    by_hour, _ = run_query(service, 'count', by='hour', where={'hour': list(range(24))})
+    assert by_hour['count'].sum() == 2_000
+    again, cached = run_query(service, 'count', by=['hour'], where={'hour': [str(h) for h in range(24)]})
+    assert cached and again.equals(by_hour)
+
+
+@pytest.mark.parametrize('query', [
+    {'measure': 'median'},
+    {'by': ['station']},
+    {'measure': 'quantile', 'by': ['hour']},
+    {'measure': 'quantile', 'quantiles': (1.5,)},
+])
+def test_bad_queries_raise_value_error(service, query):
+    with pytest.raises(ValueError):
+        run_query(service, **query)
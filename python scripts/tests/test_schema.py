@@ -0,0 +1,24 @@
+"""encode_ride_ids() on hex and other ride ids"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cyclistic.schema import decode_ride_ids, encode_ride_ids
+
+
+def test_hex_ids_round_trip():
+    ids = ['51A2FCC6542035F1', '0000000000000000', 'ffffffffffffffff']
+    assert list(decode_ride_ids(encode_ride_ids(ids))) == ['51A2FCC6542035F1', '0000000000000000',
+                                                          'FFFFFFFFFFFFFFFF']
+
+
+def test_other_ids_are_hashed():
+    ids = ['51A2FCC6542035F1', 'é1', '?1', '51A2FCC6542035F1X', 'é1']
+    values = encode_ride_ids(ids)
+    assert values.dtype == np.uint64
+    assert decode_ride_ids(values[:1])[0] == ids[0]
+    assert values[1] == values[4]
+    assert len(set(values[:4])) == 4
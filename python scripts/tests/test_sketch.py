@@ -0,0 +1,47 @@
+"""Quantile sketch error bounds and merging"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cyclistic.schema import compact
+from cyclistic.sketch import (MIN_VALUE, RELATIVE_ACCURACY, build_sketch, exact_quantiles, max_relative_error,
+                              merge_sketches, sketch_quantiles)
+
+QUANTILES = (0.01, 0.25, 0.5, 0.9, 0.99)
+
+
+def rides(n=20_000, seed=0):
+    rng = np.random.default_rng(seed)
+    return compact(pd.DataFrame({
+        'member_casual': rng.choice(['casual', 'member'], n),
+        'day_name': rng.choice(['Monday', 'Sunday'], n),
+        'rideable_type': rng.choice(['classic_bike', 'electric_bike'], n),
+        'month': rng.choice(['June', 'July'], n),
+        'ride_length_min': np.concatenate([rng.lognormal(2.4, 0.9, n - 3), [MIN_VALUE, 1, 1440]]),
+    }))
+
+
+def test_quantiles_within_relative_accuracy():
+    df = rides()
+    sketch = build_sketch(df)
+    for by in (['member_casual'], ['member_casual', 'day_name', 'rideable_type', 'month']):
+        estimated = sketch_quantiles(sketch, by, QUANTILES)
+        exact = exact_quantiles(df, by, QUANTILES, interpolation='lower')
+        assert max_relative_error(estimated, exact) <= RELATIVE_ACCURACY * (1 + 1e-6)
+    overall = sketch_quantiles(sketch, [], QUANTILES)
+    values = np.sort(df['ride_length_min'].to_numpy(dtype='float64'))
+    exact = values[np.floor(np.array(QUANTILES) * (len(values) - 1)).astype(int)]
+    assert (np.abs(overall.to_numpy() - exact) <= RELATIVE_ACCURACY * exact * (1 + 1e-6)).all()
+
+
+def test_merged_chunks_equal_one_pass():
+    df = rides()
+    merged = merge_sketches(build_sketch(df.iloc[start:start + 3_000]) for start in range(0, len(df), 3_000))
+    one_pass = build_sketch(df)
+    assert merged.sort_index().equals(one_pass.sort_index())
+    missing = df.assign(ride_length_min=df['ride_length_min'].where(df.index % 7 > 0))
+    assert build_sketch(missing).sum() == (df.index % 7 > 0).sum()
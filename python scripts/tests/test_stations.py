@@ -0,0 +1,54 @@
+"""Station keys handed out before cleaning"""
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cyclistic.schema import RAW_DTYPES
+from cyclistic.stations import add_station_keys, find_station_keys, station_keys_key
+
+
+def write_month(folder, label, starts, ends):
+    path = os.path.join(folder, f'{label}_cyclistic.csv')
+    pd.DataFrame({
+        'ride_id': [f'{i:016X}' for i in range(len(starts))],
+        'start_station_name': [name for name, _ in starts],
+        'start_station_id': [station_id for _, station_id in starts],
+        'end_station_name': [name for name, _ in ends],
+        'end_station_id': [station_id for _, station_id in ends],
+    }).to_csv(path, index=False)
+    return path
+
+
+def test_keys_follow_first_month_and_survive_appends(tmp_path):
+    folder, cache = str(tmp_path), str(tmp_path / 'cache')
+    january = write_month(folder, '2025_01', [('Wells St', 'B2'), ('Clark St', 'A1')],
+                          [('Clark St', 'A1'), (None, None)])
+    february = write_month(folder, '2025_02', [('Lake Shore', 'C3')], [('Wells St', 'B2')])
+    keys = find_station_keys([january, february], cache, dtypes=RAW_DTYPES)
+    assert keys[['station_id', 'station_name', 'first_month']].values.tolist() == [
+        ['A1', 'Clark St', '2025_01'], ['B2', 'Wells St', '2025_01'], ['C3', 'Lake Shore', '2025_02']]
+    assert keys['station_key'].tolist() == [0, 1, 2]
+
+    march = write_month(folder, '2025_03', [('Archer Ave', 'A0'), ('Lake Shore', 'C3')],
+                        [('Clark St', 'A1'), (None, None)])
+    more = find_station_keys([january, february, march], cache, dtypes=RAW_DTYPES, workers=2)
+    assert more.iloc[:3].equals(keys)
+    assert more.iloc[3].tolist() == [3, 'A0', 'Archer Ave', '2025_03']
+    assert station_keys_key(more, '2025_02') == station_keys_key(keys, '2025_02')
+    assert station_keys_key(more, '2025_03') != station_keys_key(keys, '2025_03')
+
+
+def test_add_station_keys_after_the_id_columns(tmp_path):
+    path = write_month(str(tmp_path), '2025_01', [('Clark St', 'A1'), (None, None)],
+                       [('Wells St', 'B2'), ('Clark St', None)])
+    keys = find_station_keys([path], str(tmp_path / 'cache'), dtypes=RAW_DTYPES)
+    rides = add_station_keys(pd.read_csv(path), keys)
+    assert list(rides.columns) == ['ride_id', 'start_station_name', 'start_station_id', 'start_station_key',
+                                   'end_station_name', 'end_station_id', 'end_station_key']
+    assert rides['start_station_key'].dtype == 'int32'
+    station = dict(zip(keys['station_name'] + '/' + keys['station_id'], keys['station_key']))
+    assert rides['start_station_key'].tolist() == [station['Clark St/A1'], -1]
+    assert rides['end_station_key'].tolist() == [station['Wells St/B2'], station['Clark St/']]